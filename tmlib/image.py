@@ -14,7 +14,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import collections
 import numpy as np
+import numexpr as ne
 import scipy.ndimage as ndi
 import cv2
 import mahotas as mh
@@ -31,6 +33,12 @@ from tmlib.metadata import ImageMetadata, PyramidTileMetadata
 
 logger = logging.getLogger(__name__)
 
+#: numpy.ndarray[numpy.float32]: natural logarithm of each possible 16-bit
+#: intensity value (zero is treated as ``10**-10``)
+_LOG_LUT = np.log(
+    np.concatenate([[10**-10], np.arange(1, 2**16, dtype=np.float64)])
+).astype(np.float32)
+
 
 class Image(object):
 
@@ -597,7 +605,101 @@ class ChannelImage(Image):
             return new_image
 
     @staticmethod
-    def _correct_illumination(img, mean, std, log_transform=True):
+    def _compute_correction_terms(mean, std, mean_of_mean=None,
+            mean_of_std=None, log_transform=True):
+        '''Computes the terms of the affine transformation that corrects
+        (log transformed) pixel intensities for illumination artifacts.
+
+        Parameters
+        ----------
+        mean: numpy.ndarray[numpy.float64]
+            matrix of mean values
+        std: numpy.ndarray[numpy.float64]
+            matrix of standard deviation values (same dimensions as `mean`)
+        mean_of_mean: float, optional
+            average of `mean`; computed if not provided (default: ``None``)
+        mean_of_std: float, optional
+            average of `std`; computed if not provided (default: ``None``)
+        log_transform: bool, optional
+            whether the statistics were computed on log10 transformed
+            intensities (default: ``True``)
+
+        Returns
+        -------
+        Tuple[numpy.ndarray[numpy.float32]]
+            scale and offset at each pixel position
+
+        Note
+        ----
+        The correction ``(v - mean) / std * mean_of_std + mean_of_mean``
+        is equivalent to ``v * scale + offset``. In case of `log_transform`
+        the offset refers to the natural logarithm, such that corrected
+        intensities are given by ``exp(log(x) * scale + offset)``.
+        '''
+        if mean_of_mean is None:
+            mean_of_mean = np.mean(mean)
+        if mean_of_std is None:
+            mean_of_std = np.mean(std)
+        scale = mean_of_std / std
+        offset = mean_of_mean - mean * scale
+        if log_transform:
+            offset *= np.log(10)
+        return (scale.astype(np.float32), offset.astype(np.float32))
+
+    @staticmethod
+    def _apply_correction_terms(img, scale, offset, log_transform=True,
+            lower=None, upper=None):
+        '''Corrects an image for illumination artifacts in a single pass
+        and optionally clips and rescales the corrected intensities to 8-bit.
+
+        Parameters
+        ----------
+        img: numpy.ndarray[numpy.uint8 or numpy.uint16]
+            image that should be corrected
+        scale: numpy.ndarray[numpy.float32]
+            scale at each pixel position (same dimensions as `img`)
+        offset: numpy.ndarray[numpy.float32]
+            offset at each pixel position (same dimensions as `img`)
+        log_transform: bool, optional
+            whether `scale` and `offset` apply to log transformed intensities
+            (default: ``True``)
+        lower: int, optional
+            value below which corrected pixel values will be set to 0
+            (requires `img` to have 16-bit unsigned integer type)
+        upper: int, optional
+            value above which corrected pixel values will be set to 255
+            (requires `img` to have 16-bit unsigned integer type)
+
+        Returns
+        -------
+        numpy.ndarray
+            corrected image (same data type as `img` or 8-bit unsigned
+            integer type in case `lower` and `upper` are provided)
+
+        See also
+        --------
+        :meth:`tmlib.image.ChannelImage._compute_correction_terms`
+        :meth:`tmlib.image.ChannelImage._map_to_uint8`
+        '''
+        if log_transform:
+            # The lookup table avoids the conversion to float type and the
+            # computation of the logarithm for each pixel.
+            values = _LOG_LUT[img]
+            expression = 'exp(values * scale + offset)'
+        else:
+            values = img.astype(np.float32)
+            expression = 'values * scale + offset'
+        corrected = ne.evaluate(expression)
+        np.clip(corrected, 0, np.iinfo(img.dtype).max, out=corrected)
+        corrected = corrected.astype(img.dtype)
+        if lower is None or upper is None:
+            return corrected
+        # Mapping intensities via lookup table implicitly clips values
+        return ChannelImage._map_to_uint8(corrected, lower, upper)
+
+    @staticmethod
+    def _correct_illumination(img, mean, std, log_transform=True,
+            mean_of_mean=None, mean_of_std=None):
         '''Corrects an image for illumination artifacts.
 
         Parameters
@@ -610,25 +712,22 @@ class ChannelImage(Image):
             matrix of standard deviation values (same dimensions as `img`)
         log_transform: bool, optional
             log10 transform `img` (default: ``True``)
+        mean_of_mean: float, optional
+            average of `mean`; computed if not provided (default: ``None``)
+        mean_of_std: float, optional
+            average of `std`; computed if not provided (default: ``None``)
 
         Returns
         -------
         numpy.ndarray
             corrected image (same data type as `img`)
         '''
-        img_type = img.dtype
-        # Do all computations with type float
-        img = img.astype(np.float64)
-        if log_transform:
-            img[img == 0] = 10**-10
-            img = np.log10(img)
-            img[img == 0] = 0
-        img = (img - mean) / std
-        img = (img * np.mean(std)) + np.mean(mean)
-        if log_transform:
-            img = 10 ** img
-        # Cast back to original type.
-        return img.astype(img_type)
+        scale, offset = ChannelImage._compute_correction_terms(
+            mean, std, mean_of_mean, mean_of_std, log_transform
+        )
+        return ChannelImage._apply_correction_terms(
+            img, scale, offset, log_transform
+        )
 
     @assert_type(stats='tmlib.image.IllumstatsContainer')
     def correct(self, stats, inplace=True):
@@ -657,9 +756,8 @@ class ChannelImage(Image):
         if (stats.mean.metadata.channel_id != self.metadata.channel_id or
                 stats.std.metadata.channel_id != self.metadata.channel_id):
             raise ValueError('Channels don\'t match!')
-        array = self._correct_illumination(
-            self.array, stats.mean.array, stats.std.array
-        )
+        scale, offset = stats.get_correction_terms()
+        array = self._apply_correction_terms(self.array, scale, offset)
         if inplace:
             self.array = array
             self.metadata.is_corrected = True
@@ -669,6 +767,55 @@ class ChannelImage(Image):
             new_object.metadata.is_corrected = True
             return new_object
 
+    @assert_type(stats='tmlib.image.IllumstatsContainer')
+    def correct_and_scale(self, stats, lower, upper, inplace=True):
+        '''Corrects the image for illumination artifacts, clips the corrected
+        values and scales them to 8-bit in a single pass. The result is
+        equivalent to calling :meth:`correct <tmlib.image.ChannelImage.correct>`,
+        :meth:`clip <tmlib.image.ChannelImage.clip>` and
+        :meth:`scale <tmlib.image.ChannelImage.scale>` consecutively.
+
+        Parameters
+        ----------
+        stats: tmlib.image.IllumstatsContainer
+            mean and standard deviation statistics at each pixel position
+            calculated over all images of the same channel
+        lower: int
+            value below which corrected pixel values will be set to 0
+        upper: int
+            value above which corrected pixel values will be set to 255
+        inplace: bool, optional
+            whether values should be modified in place rather than creating
+            a new image object (default: ``True``)
+
+        Returns
+        -------
+        tmlib.image.ChannelImage
+            image with corrected and rescaled pixels
+
+        Raises
+        ------
+        ValueError
+            when channel doesn't match between illumination statistics and
+            image
+        '''
+        if (stats.mean.metadata.channel_id != self.metadata.channel_id or
+                stats.std.metadata.channel_id != self.metadata.channel_id):
+            raise ValueError('Channels don\'t match!')
+        scale, offset = stats.get_correction_terms()
+        array = self._apply_correction_terms(
+            self.array, scale, offset, lower=lower, upper=upper
+        )
+        if inplace:
+            image = self
+            image.array = array
+        else:
+            image = ChannelImage(array, self.metadata)
+        image.metadata.is_corrected = True
+        image.metadata.is_clipped = True
+        image.metadata.is_rescaled = True
+        return image
+
     def png_encode(self):
         '''Encodes pixels of the image in *PNG* format.
 
@@ -792,6 +939,14 @@ class SegmentationImage(Image):
         -------
         Generator[Tuple[Union[int, shapely.geometry.polygon.Polygon]]]
             label and geometry for each segmented object
+
+        Note
+        ----
+        Contours of all objects are traced in a few passes over the whole
+        image. To this end, objects are grouped such that objects of the same
+        group don't touch each other. Only objects whose contour may not
+        represent a valid polygon, e.g. because it has holes or touches
+        itself, are processed individually.
         '''
         bboxes = mh.labeled.bbox(self.array)
         # We set border pixels to zero to get closed contours for
@@ -804,117 +959,251 @@ class SegmentationImage(Image):
         plane[:, 0] = 0
         plane[:, -1] = 0
 
-        for label in np.unique(plane[plane > 0]):
-            bbox = bboxes[label]
-            obj_im = self._get_bbox_image(plane, bbox)
-            logger.debug('find contour for object #%d', label)
-            # We could do this for all objects at once, but doing it on the
-            # bounding box for each object individually ensures that we get the
-            # correct number of objects and that polygons are in the
-            # correct order, i.e. sorted according to their corresponding label.
-            mask = obj_im == label
-            if np.sum(mask > 0) > 1:
-                # We need to remove single pixel extensions on the border of
-                # objects because they can lead to polygon self-intersections.
-                # However, this should only be done if the object is larger
-                # than 1 pixel.
-                mask = mh.open(mask)
-            # NOTE: OpenCV returns x, y coordinates. This means one would need
-            # to flip the axis for numpy-based indexing (y,x coordinates).
-            _, contours, hierarchy = cv2.findContours(
-                (mask).astype(np.uint8) * 255,
+        labels = np.flatnonzero(np.bincount(plane.ravel())[1:]) + 1
+        if len(labels) == 0:
+            return
+        opened = self._open_labels(plane)
+        contours = self._find_contours_per_label(opened, labels)
+        # Objects with a single contour are represented by a polygon without
+        # holes. The polygon is used as is in case it is valid.
+        shells = dict()
+        candidates = [l for l, c in contours.iteritems() if len(c) == 1]
+        if candidates:
+            is_simple = self._are_simple_contours(
+                [contours[l][0] for l in candidates]
+            )
+            for label, simple in zip(candidates, is_simple):
+                if simple:
+                    shells[label] = contours[label][0]
+
+        for label in labels:
+            if label in shells:
+                shell = shells[label]
+                # Add offset required due to alignment and invert the
+                # y-axis as required by Openlayers.
+                shell[:, 0] += x_offset
+                shell[:, 1] = -1 * (shell[:, 1] + y_offset)
+                poly = shapely.geometry.Polygon(shell)
+            else:
+                poly = self._extract_polygon(
+                    plane, label, bboxes[label], y_offset, x_offset
+                )
+            yield (int(label), poly)
+
+    @staticmethod
+    def _open_labels(plane):
+        # Morphological opening of each object individually, but for all
+        # objects at once. A pixel survives erosion in case all its direct
+        # neighbours belong to the same object. Dilation can't extend an
+        # object beyond its original pixels, since all direct neighbours
+        # of an eroded pixel belong to the object. Objects consisting of
+        # a single pixel are not opened.
+        center = plane[1:-1, 1:-1]
+        eroded = np.zeros(plane.shape, dtype=bool)
+        eroded[1:-1, 1:-1] = (
+            (center > 0) &
+            (plane[:-2, 1:-1] == center) & (plane[2:, 1:-1] == center) &
+            (plane[1:-1, :-2] == center) & (plane[1:-1, 2:] == center)
+        )
+        dilated = eroded.copy()
+        dilated[1:, :] |= eroded[:-1, :]
+        dilated[:-1, :] |= eroded[1:, :]
+        dilated[:, 1:] |= eroded[:, :-1]
+        dilated[:, :-1] |= eroded[:, 1:]
+        areas = np.bincount(plane.ravel())
+        is_single_pixel = (plane > 0) & (areas[plane] == 1)
+        return np.where(dilated | is_single_pixel, plane, 0).astype(np.int32)
+
+    @staticmethod
+    def _find_contours_per_label(plane, labels):
+        # Assign objects to groups, such that no two objects of a group touch
+        # each other (8-connectivity). Contours of objects of one group
+        # can then be traced in a single pass and are identical to those
+        # that would be traced for each object individually.
+        pairs = list()
+        for a, b in [
+                (plane[:, :-1], plane[:, 1:]), (plane[:-1, :], plane[1:, :]),
+                (plane[:-1, :-1], plane[1:, 1:]), (plane[:-1, 1:], plane[1:, :-1])
+            ]:
+            index = (a != b) & (a > 0) & (b > 0)
+            pairs.append(np.column_stack([a[index], b[index]]))
+        pairs = np.vstack(pairs).astype(np.int64)
+        n = np.int64(np.max(labels)) + 1
+        pairs = np.unique(pairs[:, 0] * n + pairs[:, 1])
+        neighbours = collections.defaultdict(set)
+        for a, b in zip(pairs // n, pairs % n):
+            neighbours[a].add(b)
+            neighbours[b].add(a)
+        groups = np.zeros((n, ), dtype=np.int32)
+        for label in labels:
+            used = {groups[l] for l in neighbours[label]}
+            group = 1
+            while group in used:
+                group += 1
+            groups[label] = group
+
+        contours = collections.defaultdict(list)
+        group_image = groups[plane]
+        for group in range(1, groups.max() + 1):
+            mask = (group_image == group).astype(np.uint8)
+            group_contours = cv2.findContours(
+                mask,
                 cv2.RETR_CCOMP,  # two-level hierarchy (holes)
                 cv2.CHAIN_APPROX_NONE
+            )[-2]
+            for c in group_contours:
+                # NOTE: OpenCV returns x, y coordinates.
+                c = c[:, 0, :].astype(np.int64)
+                contours[plane[c[0, 1], c[0, 0]]].append(c)
+        return contours
+
+    @staticmethod
+    def _are_simple_contours(contours):
+        # Consecutive points of a contour are direct or diagonal neighbours.
+        # Edges of such a ring can only intersect at shared points or where
+        # diagonal edges cross each other within the same pixel square.
+        # A ring without these intersections and non-zero area represents
+        # a valid polygon. All contours are checked at once.
+        lengths = np.array([len(c) for c in contours])
+        is_simple = lengths >= 3
+        points = np.vstack(contours)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        index = np.repeat(np.arange(len(contours)), lengths)
+        following = np.arange(len(points)) + 1
+        following[ends - 1] = starts
+        next_points = points[following]
+        n = np.int64(points.max()) + 2
+
+        keys = np.sort((index * n + points[:, 1]) * n + points[:, 0])
+        is_duplicate = keys[1:] == keys[:-1]
+        is_simple[keys[1:][is_duplicate] // (n * n)] = False
+
+        steps = next_points - points
+        is_diagonal = (steps[:, 0] != 0) & (steps[:, 1] != 0)
+        corners = np.minimum(points, next_points)[is_diagonal]
+        squares = (index[is_diagonal] * n + corners[:, 1]) * n + corners[:, 0]
+        orientations = steps[is_diagonal, 0] * steps[is_diagonal, 1] > 0
+        squares = np.unique(squares * 2 + orientations) // 2
+        is_crossing = squares[1:] == squares[:-1]
+        is_simple[squares[1:][is_crossing] // (n * n)] = False
+
+        areas = np.add.reduceat(
+            points[:, 0] * next_points[:, 1] - next_points[:, 0] * points[:, 1],
+            starts
+        )
+        is_simple[areas == 0] = False
+        return is_simple
+
+    def _extract_polygon(self, plane, label, bbox, y_offset, x_offset):
+        # Creates the polygon for an individual object based on its
+        # bounding box.
+        obj_im = self._get_bbox_image(plane, bbox)
+        logger.debug('find contour for object #%d', label)
+        mask = obj_im == label
+        if np.sum(mask > 0) > 1:
+            # We need to remove single pixel extensions on the border of
+            # objects because they can lead to polygon self-intersections.
+            # However, this should only be done if the object is larger
+            # than 1 pixel.
+            mask = mh.open(mask)
+        # NOTE: OpenCV returns x, y coordinates. This means one would need
+        # to flip the axis for numpy-based indexing (y,x coordinates).
+        contours, hierarchy = cv2.findContours(
+            (mask).astype(np.uint8) * 255,
+            cv2.RETR_CCOMP,  # two-level hierarchy (holes)
+            cv2.CHAIN_APPROX_NONE
+        )[-2:]
+        if len(contours) == 0:
+            logger.warn('no contours identified for object #%d', label)
+            # This is most likely an object that does not extend
+            # beyond the line of border pixels.
+            # To ensure a correct number of objects we represent
+            # it by the smallest possible valid polygon.
+            coords = np.array(np.where(obj_im == label)).T
+            coords += [bbox[0] - 1, bbox[2] - 1]
+            y, x = np.mean(coords, axis=0).astype(int)
+            shell = np.array([
+                [x-1, x+1, x+1, x-1, x-1],
+                [y-1, y-1, y+1, y+1, y-1]
+            ]).T
+            holes = None
+        elif len(contours) > 1:
+            # It may happens that more than one contour is
+            # identified per object, for example if the object
+            # has holes, i.e. enclosed background pixels.
+            logger.debug(
+                '%d contours identified for object #%d',
+                len(contours), label
             )
-            if len(contours) == 0:
-                logger.warn('no contours identified for object #%d', label)
-                # This is most likely an object that does not extend
-                # beyond the line of border pixels.
-                # To ensure a correct number of objects we represent
-                # it by the smallest possible valid polygon.
-                coords = np.array(np.where(plane == label)).T
-                y, x = np.mean(coords, axis=0).astype(int)
-                shell = np.array([
-                    [x-1, x+1, x+1, x-1, x-1],
-                    [y-1, y-1, y+1, y+1, y-1]
-                ]).T
-                holes = None
-            elif len(contours) > 1:
-                # It may happens that more than one contour is
-                # identified per object, for example if the object
-                # has holes, i.e. enclosed background pixels.
-                logger.debug(
-                    '%d contours identified for object #%d',
-                    len(contours), label
-                )
-                holes = list()
-                for i in range(len(contours)):
-                    child_idx = hierarchy[0][i][2]
-                    parent_idx = hierarchy[0][i][3]
-                    # There should only be two levels with one
-                    # contour each.
-                    if parent_idx >= 0:
-                        shell = np.squeeze(contours[parent_idx])
-                    elif child_idx >= 0:
-                        holes.append(np.squeeze(contours[child_idx]))
-                    else:
-                        # Same hierarchy level. This shouldn't happen.
-                        # Take only the largest one.
-                        lengths = [len(c) for c in contours]
-                        idx = lengths.index(np.max(lengths))
-                        shell = np.squeeze(contours[idx])
-                        break
-            else:
-                shell = np.squeeze(contours[0])
-                holes = None
-
-            if shell.ndim < 2 or shell.shape[0] < 3:
-                logger.warn('polygon doesn\'t have enough coordinates')
-                # In case the contour cannot be represented as a
-                # valid polygon we create a little square to not loose
-                # the object.
-                y, x = np.array(mask.shape) / 2
-                # Create a closed ring with coordinates sorted
-                # counter-clockwise
-                shell = np.array([
-                    [x-1, x+1, x+1, x-1, x-1],
-                    [y-1, y-1, y+1, y+1, y-1]
-                ]).T
-
-            # Add offset required due to alignment and cropping and
-            # invert the y-axis as required by Openlayers.
-            add_y = y_offset + bbox[0] - 1
-            add_x = x_offset + bbox[2] - 1
-            shell[:, 0] = shell[:, 0] + add_x
-            shell[:, 1] = -1 * (shell[:, 1] + add_y)
-            if holes is not None:
-                for i in range(len(holes)):
-                    holes[i][:, 0] = holes[i][:, 0] + add_x
-                    holes[i][:, 1] = -1 * (holes[i][:, 1] + add_y)
-            poly = shapely.geometry.Polygon(shell, holes)
+            holes = list()
+            for i in range(len(contours)):
+                child_idx = hierarchy[0][i][2]
+                parent_idx = hierarchy[0][i][3]
+                # There should only be two levels with one
+                # contour each.
+                if parent_idx >= 0:
+                    shell = np.squeeze(contours[parent_idx])
+                elif child_idx >= 0:
+                    holes.append(np.squeeze(contours[child_idx]))
+                else:
+                    # Same hierarchy level. This shouldn't happen.
+                    # Take only the largest one.
+                    lengths = [len(c) for c in contours]
+                    idx = lengths.index(np.max(lengths))
+                    shell = np.squeeze(contours[idx])
+                    break
+        else:
+            shell = np.squeeze(contours[0])
+            holes = None
+
+        if shell.ndim < 2 or shell.shape[0] < 3:
+            logger.warn('polygon doesn\'t have enough coordinates')
+            # In case the contour cannot be represented as a
+            # valid polygon we create a little square to not loose
+            # the object.
+            y, x = np.array(mask.shape) / 2
+            # Create a closed ring with coordinates sorted
+            # counter-clockwise
+            shell = np.array([
+                [x-1, x+1, x+1, x-1, x-1],
+                [y-1, y-1, y+1, y+1, y-1]
+            ]).T
+
+        # Add offset required due to alignment and cropping and
+        # invert the y-axis as required by Openlayers.
+        add_y = y_offset + bbox[0] - 1
+        add_x = x_offset + bbox[2] - 1
+        shell[:, 0] = shell[:, 0] + add_x
+        shell[:, 1] = -1 * (shell[:, 1] + add_y)
+        if holes is not None:
+            for i in range(len(holes)):
+                holes[i][:, 0] = holes[i][:, 0] + add_x
+                holes[i][:, 1] = -1 * (holes[i][:, 1] + add_y)
+        poly = shapely.geometry.Polygon(shell, holes)
+        if not poly.is_valid:
+            logger.warn(
+                'invalid polygon for object #%d - trying to fix it',
+                label
+            )
+            # In some cases there may be invalid intersections
+            # that can be fixed with the buffer trick.
+            poly = poly.buffer(0)
             if not poly.is_valid:
+                raise ValueError(
+                    'Polygon of object #%d is invalid.' % label
+                )
+            if isinstance(poly, shapely.geometry.MultiPolygon):
                 logger.warn(
-                    'invalid polygon for object #%d - trying to fix it',
-                    label
+                    'object #%d has multiple polygons - '
+                    'take largest', label
                 )
-                # In some cases there may be invalid intersections
-                # that can be fixed with the buffer trick.
-                poly = poly.buffer(0)
-                if not poly.is_valid:
-                    raise ValueError(
-                        'Polygon of object #%d is invalid.' % label
-                    )
-                if isinstance(poly, shapely.geometry.MultiPolygon):
-                    logger.warn(
-                        'object #%d has multiple polygons - '
-                        'take largest', label
-                    )
-                    # Repair may create multiple polygons.
-                    # We take the largest and discard the smaller ones.
-                    areas = [g.area for g in poly.geoms]
-                    index = areas.index(np.max(areas))
-                    poly = poly.geoms[index]
-            yield (int(label), poly)
+                # Repair may create multiple polygons.
+                # We take the largest and discard the smaller ones.
+                areas = [g.area for g in poly.geoms]
+                index = areas.index(np.max(areas))
+                poly = poly.geoms[index]
+        return poly
 
     @staticmethod
     def _get_bbox_image(img, bbox):
@@ -1153,7 +1442,8 @@ class IllumstatsContainer(object):
     @assert_type(
         mean='tmlib.image.IllumstatsImage', std='tmlib.image.IllumstatsImage'
     )
-    def __init__(self, mean, std, percentiles):
+    def __init__(self, mean, std, percentiles, mean_of_mean=None,
+            mean_of_std=None):
         '''
         Parameters
         ----------
@@ -1164,10 +1454,60 @@ class IllumstatsContainer(object):
             over all sites
         percentiles: Dict[float, int]
             intensity percentiles calculated over all sites
+        mean_of_mean: float, optional
+            precomputed average of `mean` (default: ``None``)
+        mean_of_std: float, optional
+            precomputed average of `std` (default: ``None``)
         '''
         self.mean = mean
         self.std = std
         self.percentiles = percentiles
+        self._mean_of_mean = mean_of_mean
+        self._mean_of_std = mean_of_std
+        self._correction_terms = dict()
+
+    @property
+    def mean_of_mean(self):
+        '''float: average of the mean values over all pixel coordinates'''
+        if self._mean_of_mean is None:
+            self._mean_of_mean = float(np.mean(self.mean.array))
+        return self._mean_of_mean
+
+    @property
+    def mean_of_std(self):
+        '''float: average of the standard deviation values over all pixel
+        coordinates
+        '''
+        if self._mean_of_std is None:
+            self._mean_of_std = float(np.mean(self.std.array))
+        return self._mean_of_std
+
+    def get_correction_terms(self, log_transform=True):
+        '''Gets the terms of the affine transformation that corrects images
+        for illumination artifacts. The terms are computed only once.
+
+        Parameters
+        ----------
+        log_transform: bool, optional
+            whether statistics were calculated on log10 transformed
+            intensities (default: ``True``)
+
+        Returns
+        -------
+        Tuple[numpy.ndarray[numpy.float32]]
+            scale and offset at each pixel position
+
+        See also
+        --------
+        :meth:`tmlib.image.ChannelImage._compute_correction_terms`
+        '''
+        if log_transform not in self._correction_terms:
+            self._correction_terms[log_transform] = \
+                ChannelImage._compute_correction_terms(
+                    self.mean.array, self.std.array,
+                    self.mean_of_mean, self.mean_of_std, log_transform
+                )
+        return self._correction_terms[log_transform]
 
     def smooth(self, sigma=5):
         '''Smoothes mean and standard deviation statistic images with a
@@ -1190,6 +1530,9 @@ class IllumstatsContainer(object):
         self.mean.metadata.is_smoothed = True
         self.std.array = self.std.smooth(sigma).array
         self.std.metadata.is_smoothed = True
+        self._mean_of_mean = None
+        self._mean_of_std = None
+        self._correction_terms = dict()
         return self
 
     def get_closest_percentile(self, value):
@@ -140,7 +140,7 @@ from tmlib.models.tile import ChannelLayerTile
 from tmlib.models.mapobject import (
     MapobjectType, Mapobject, MapobjectSegmentation, SegmentationLayer
 )
-from tmlib.models.feature import Feature, FeatureValues
+from tmlib.models.feature import Feature, FeatureValues, FeatureStatistics
 from tmlib.models.plate import Plate
 from tmlib.models.acquisition import Acquisition
 from tmlib.models.cycle import Cycle
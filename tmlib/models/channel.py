@@ -21,9 +21,10 @@ import itertools
 import collections
 import lxml
 import numpy as np
+import pandas as pd
 from cached_property import cached_property
 from sqlalchemy import Column, Integer, ForeignKey, String, UniqueConstraint
-from sqlalchemy import or_
+from sqlalchemy import or_, and_
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship, backref, Session
@@ -55,6 +56,80 @@ CHANNEL_LOCATION_FORMAT = 'channel_{id}'
 CHANNEL_LAYER_LOCATION_FORMAT = 'layer_{id}'
 
 
+def build_site_layout(sites, wells, vertical_site_displacement,
+        horizontal_site_displacement):
+    '''Builds an index of the position of sites within a channel layer.
+
+    Parameters
+    ----------
+    sites: List[Tuple[int]]
+        ID, well ID, *y* and *x* coordinate within the well, height, width,
+        whether the site was omitted and ID of the image file of the layer
+        (``None`` if missing) for each site
+    wells: List[Tuple[int]]
+        ID as well as *y* and *x* offset within the layer for each well
+    vertical_site_displacement: int
+        number of pixels sites overlap or are apart in vertical direction
+    horizontal_site_displacement: int
+        number of pixels sites overlap or are apart in horizontal direction
+
+    Returns
+    -------
+    pandas.DataFrame
+        offsets of sites within the layer, dimensions of their well, IDs of
+        image files and of neighbouring sites within the same well;
+        indexed by site ID
+
+    See also
+    --------
+    :attr:`ChannelLayer.site_layout <tmlib.models.channel.ChannelLayer.site_layout>`
+    '''
+    layout = pd.DataFrame.from_records(
+        sites,
+        columns=[
+            'site_id', 'well_id', 'y', 'x', 'height', 'width', 'omitted',
+            'file_id'
+        ]
+    )
+    layout['omitted'] = layout['omitted'].fillna(False).astype(bool)
+    layout['file_id'] = layout['file_id'].fillna(-1).astype(int)
+
+    well_offsets = pd.DataFrame.from_records(
+        wells, columns=['well_id', 'y_offset', 'x_offset']
+    ).set_index('well_id')
+    layout['y_offset'] = (
+        layout['y'] * (layout['height'] + vertical_site_displacement) +
+        well_offsets['y_offset'].loc[layout['well_id']].values
+    )
+    layout['x_offset'] = (
+        layout['x'] * (layout['width'] + horizontal_site_displacement) +
+        well_offsets['x_offset'].loc[layout['well_id']].values
+    )
+    well_dimensions = layout.groupby('well_id')[['y', 'x']].max() + 1
+    layout['well_rows'] = well_dimensions['y'].loc[layout['well_id']].values
+    layout['well_columns'] = well_dimensions['x'].loc[layout['well_id']].values
+
+    positions = pd.Series(
+        layout['site_id'].values,
+        index=pd.MultiIndex.from_arrays(
+            [layout['well_id'].values, layout['y'].values, layout['x'].values]
+        )
+    )
+    neighbours = {
+        'upper_site_id': (-1, 0), 'lower_site_id': (1, 0),
+        'left_site_id': (0, -1), 'right_site_id': (0, 1),
+        'upper_left_site_id': (-1, -1)
+    }
+    for name, (dy, dx) in neighbours.iteritems():
+        index = pd.MultiIndex.from_arrays([
+            layout['well_id'].values,
+            layout['y'].values + dy, layout['x'].values + dx
+        ])
+        layout[name] = positions.reindex(index).fillna(-1).astype(int).values
+
+    return layout.set_index('site_id')
+
+
 @remove_location_upon_delete
 class Channel(DirectoryModel, DateMixIn, IdMixIn):
 
@@ -410,6 +485,69 @@ class ChannelLayer(ExperimentModel, IdMixIn):
             ]
         }
 
+    @cached_property
+    def site_layout(self):
+        '''pandas.DataFrame: position of each
+        :class:`Site <tmlib.models.site.Site>` of the experiment within the
+        layer together with the ID of the corresponding
+        :class:`ChannelImageFile <tmlib.models.file.ChannelImageFile>` of the
+        layer and the IDs of neighbouring sites within the same well;
+        indexed by site ID
+
+        Note
+        ----
+        Missing files and neighbours are encoded as ``-1``. The index is built
+        once per layer with a single query for all sites, such that mapping
+        sites to tiles doesn't require any further database access.
+        '''
+        logger.debug('create site layout index')
+        experiment = self.channel.experiment
+        session = Session.object_session(self)
+        records = session.query(
+                Site.id, Site.well_id, Site.y, Site.x,
+                Site.height, Site.width, Site.omitted,
+                ChannelImageFile.id
+            ).\
+            join(Well).\
+            join(Plate).\
+            outerjoin(
+                ChannelImageFile,
+                and_(
+                    ChannelImageFile.site_id == Site.id,
+                    ChannelImageFile.channel_id == self.channel_id,
+                    ChannelImageFile.tpoint == self.tpoint,
+                    ChannelImageFile.zplane == self.zplane
+                )
+            ).\
+            filter(Plate.experiment_id == experiment.id).\
+            all()
+        # Offsets only need to be calculated once per well.
+        well_ids = list({r[1] for r in records})
+        wells = session.query(Well).filter(Well.id.in_(well_ids))
+        return build_site_layout(
+            records, [(w.id, w.offset[0], w.offset[1]) for w in wells],
+            experiment.vertical_site_displacement,
+            experiment.horizontal_site_displacement
+        )
+
+    def _has_image_file(self, site_id):
+        if site_id < 0:
+            return False
+        return self.site_layout.at[site_id, 'file_id'] >= 0
+
+    def _map_site_to_base_tiles(self, site_id):
+        experiment = self.channel.experiment
+        site = self.site_layout.loc[site_id]
+        row_indices = self._calc_tile_indices(
+            int(site['y_offset']), int(site['height']),
+            experiment.vertical_site_displacement
+        )
+        col_indices = self._calc_tile_indices(
+            int(site['x_offset']), int(site['width']),
+            experiment.horizontal_site_displacement
+        )
+        return itertools.product(row_indices, col_indices)
+
     def map_image_to_base_tiles(self, image_file):
         '''Maps an image to the corresponding tiles at the base of the pyramid
         (maximal zoom level) that intersect with the image.
@@ -430,20 +568,23 @@ class ChannelLayer(ExperimentModel, IdMixIn):
         ----
         For those tiles that overlap multiple images, only map those at the
         upper and/or left border of the image in `image_file`.
+
+        See also
+        --------
+        :attr:`site_layout <tmlib.models.channel.ChannelLayer.site_layout>`
         '''
         mappings = list()
         experiment = self.channel.experiment
-        site = image_file.site
-        well = image_file.site.well
-        y_offset_site, x_offset_site = site.offset
+        site = self.site_layout.loc[image_file.site_id]
+        image_size = (int(site['height']), int(site['width']))
         # Determine the index and offset of each tile whose pixels are part of
         # the image
         row_info = self._calc_tile_indices_and_offsets(
-            y_offset_site, site.image_size[0],
+            int(site['y_offset']), image_size[0],
             experiment.vertical_site_displacement
         )
         col_info = self._calc_tile_indices_and_offsets(
-            x_offset_site, site.image_size[1],
+            int(site['x_offset']), image_size[1],
             experiment.horizontal_site_displacement
         )
         # Each job processes only the overlapping tiles at the upper and/or
@@ -453,34 +594,15 @@ class ChannelLayer(ExperimentModel, IdMixIn):
         # or plates represent an exception because in these cases there is
         # no neighboring image to create the tile instead, but an empty spacer.
         # The same is true in case of missing neighboring images.
-        session = Session.object_session(self)
-        lower_neighbor_count = session.query(ChannelImageFile.id).\
-            join(Site).\
-            filter(
-                Site.y == site.y + 1, Site.x == site.x,
-                Site.well_id == site.well_id,
-                ChannelImageFile.channel_id == self.channel_id,
-                ChannelImageFile.tpoint == self.tpoint
-            ).\
-            count()
-        right_neighbor_count = session.query(ChannelImageFile.id).\
-            join(Site).\
-            filter(
-                Site.y == site.y, Site.x == site.x + 1,
-                Site.well_id == site.well_id,
-                ChannelImageFile.channel_id == self.channel_id,
-                ChannelImageFile.tpoint == self.tpoint
-            ).\
-            count()
-        has_lower_neighbor = lower_neighbor_count > 0
-        has_right_neighbor = right_neighbor_count > 0
+        has_lower_neighbor = self._has_image_file(site['lower_site_id'])
+        has_right_neighbor = self._has_image_file(site['right_site_id'])
         for i, y in enumerate(row_info['indices']):
             y_offset = row_info['offsets'][i]
             is_overhanging_vertically = (
-                (y_offset + self.tile_size) > site.image_size[0]
+                (y_offset + self.tile_size) > image_size[0]
             )
             is_not_lower_plate_border = (y + 1) != self.dimensions[-1][0]
-            is_not_lower_well_border = (site.y + 1) != well.dimensions[0]
+            is_not_lower_well_border = (site['y'] + 1) != site['well_rows']
             if is_overhanging_vertically and has_lower_neighbor:
                 if (is_not_lower_plate_border and
                         is_not_lower_well_border):
@@ -488,10 +610,12 @@ class ChannelLayer(ExperimentModel, IdMixIn):
             for j, x in enumerate(col_info['indices']):
                 x_offset = col_info['offsets'][j]
                 is_overhanging_horizontally = (
-                    (x_offset + self.tile_size) > site.image_size[1]
+                    (x_offset + self.tile_size) > image_size[1]
                 )
                 is_not_right_plate_border = (x + 1) != self.dimensions[-1][1]
-                is_not_right_well_border = (site.x + 1) != well.dimensions[1]
+                is_not_right_well_border = (
+                    (site['x'] + 1) != site['well_columns']
+                )
                 if is_overhanging_horizontally and has_right_neighbor:
                     if (is_not_right_plate_border and
                             is_not_right_well_border):
@@ -569,40 +693,26 @@ class ChannelLayer(ExperimentModel, IdMixIn):
         Dict[Tuple[int], List[int]]
             IDs of images intersecting with a given tile hashable by tile
             y, x coordinates
+
+        See also
+        --------
+        :attr:`site_layout <tmlib.models.channel.ChannelLayer.site_layout>`
         '''
-        experiment = self.channel.experiment
-        session = Session.object_session(self)
+        layout = self.site_layout
+        current_site = layout.loc[site.id]
         # Only consider sites to the left and/or top of the current site
-        neighbouring_sites = session.query(Site).\
-            join(Well).\
-            filter(
-                Well.id == site.well.id,
-                Site.x.in_([site.x - 1, site.x]),
-                Site.y.in_([site.y - 1, site.y])
-            )
-
+        neighbouring_site_ids = [
+            current_site['upper_site_id'], current_site['left_site_id'],
+            current_site['upper_left_site_id']
+        ]
         mapping = collections.defaultdict(list)
-        for current_site in neighbouring_sites:
-            if current_site.y == site.y and current_site.x == site.x:
+        for site_id in neighbouring_site_ids:
+            if not self._has_image_file(site_id):
                 continue
-            if current_site.omitted:
+            if layout.at[site_id, 'omitted']:
                 continue
-            fid = session.query(ChannelImageFile.id).\
-                filter_by(
-                    site_id=current_site.id, channel_id=self.channel.id,
-                    tpoint=self.tpoint, zplane=self.zplane
-                ).\
-                one()[0]
-            y_offset_site, x_offset_site = current_site.offset
-            row_indices = self._calc_tile_indices(
-                y_offset_site, current_site.image_size[0],
-                experiment.vertical_site_displacement
-            )
-            col_indices = self._calc_tile_indices(
-                x_offset_site, current_site.image_size[1],
-                experiment.horizontal_site_displacement
-            )
-            for y, x in itertools.product(row_indices, col_indices):
+            fid = int(layout.at[site_id, 'file_id'])
+            for y, x in self._map_site_to_base_tiles(site_id):
                 mapping[(y, x)].append(fid)
 
         return mapping
@@ -614,33 +724,12 @@ class ChannelLayer(ExperimentModel, IdMixIn):
         to the files of intersecting images
         '''
         logger.debug('create mapping of base tile coordinates to image files')
-        experiment = self.channel.experiment
-        session = Session.object_session(self)
-        sites = session.query(Site).\
-            join(Well).\
-            join(Plate).\
-            filter(Plate.experiment_id == experiment.id)
+        layout = self.site_layout
+        layout = layout[~layout['omitted'] & (layout['file_id'] >= 0)]
         mapping = collections.defaultdict(list)
-        for site in sites:
-            if site.omitted:
-                continue
-            fid = session.query(ChannelImageFile.id).\
-                filter_by(
-                    site_id=site.id, channel_id=self.channel.id,
-                    tpoint=self.tpoint, zplane=self.zplane
-                ).\
-                one()[0]
-            y_offset_site, x_offset_site = site.offset
-            row_indices = self._calc_tile_indices(
-                y_offset_site, site.image_size[0],
-                experiment.vertical_site_displacement
-            )
-            col_indices = self._calc_tile_indices(
-                x_offset_site, site.image_size[1],
-                experiment.horizontal_site_displacement
-            )
-            for y, x in itertools.product(row_indices, col_indices):
-                mapping[(y, x)].append(fid)
+        for site_id, fid in layout['file_id'].iteritems():
+            for y, x in self._map_site_to_base_tiles(site_id):
+                mapping[(y, x)].append(int(fid))
         return mapping
 
     def calc_coordinates_of_next_higher_level(self, z, y, x):
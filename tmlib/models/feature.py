@@ -15,12 +15,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 import csv
+import numpy as np
 from cStringIO import StringIO
 from sqlalchemy import (
     Column, String, Integer, BigInteger, ForeignKey, Boolean, Index,
     PrimaryKeyConstraint, UniqueConstraint, ForeignKeyConstraint
 )
-from sqlalchemy.dialects.postgresql import HSTORE
+from sqlalchemy.dialects.postgresql import (
+    HSTORE, ARRAY, REAL, DOUBLE_PRECISION
+)
 from sqlalchemy.orm import relationship, backref
 
 from tmlib.models.base import (
@@ -31,6 +34,13 @@ from tmlib import cfg
 
 logger = logging.getLogger(__name__)
 
+#: int: number of histogram bins per factor of two of absolute feature values
+HISTOGRAM_BINS_PER_OCTAVE = 8
+
+#: int: absolute feature values are binned between 2^-x and 2^x; smaller and
+#: larger values are assigned to the outermost bins
+HISTOGRAM_OCTAVES = 64
+
 
 class Feature(ExperimentModel, IdMixIn):
 
@@ -52,6 +62,11 @@ class Feature(ExperimentModel, IdMixIn):
     #: bool: whether the feature is an aggregate of child object features
     is_aggregate = Column(Boolean, index=True)
 
+    #: int: zero-based position of the feature in
+    #: :attr:`FeatureValues.array_values <tmlib.models.feature.FeatureValues.array_values>`
+    #: in case the parent mapobject type stores feature values as arrays
+    array_index = Column(Integer)
+
     #: int: id of the parent mapobject type
     mapobject_type_id = Column(
         Integer,
@@ -118,13 +133,21 @@ class FeatureValues(DistributedExperimentModel):
     # when loaded into Python. One could define a custom type for this purpose.
     values = Column(HSTORE)
 
+    #: List[float]: values of all features ordered according to
+    #: :attr:`Feature.array_index <tmlib.models.feature.Feature.array_index>`
+    # NOTE: Used instead of "values" for mapobject types that store feature
+    # values as arrays. Values don't need to be parsed and casted and
+    # require less storage, but are limited to single precision.
+    array_values = Column(ARRAY(REAL))
+
     #: int: zero-based time point index
     tpoint = Column(Integer, index=True)
 
     #: int: ID of the parent mapobject
     mapobject_id = Column(BigInteger, index=True)
 
-    def __init__(self, partition_key, mapobject_id, values, tpoint=None):
+    def __init__(self, partition_key, mapobject_id, values=None, tpoint=None,
+            array_values=None):
         '''
         Parameters
         ----------
@@ -132,15 +155,19 @@ class FeatureValues(DistributedExperimentModel):
             key that determines on which shard the object will be stored
         mapobject_id: int
             ID of the mapobject to which values should be assigned
-        values: Dict[str, float]
+        values: Dict[str, float], optional
             mapping of feature ID to value
         tpoint: int, optional
             zero-based time point index
+        array_values: List[float], optional
+            value of each feature ordered according to
+            :attr:`Feature.array_index <tmlib.models.feature.Feature.array_index>`
         '''
         self.partition_key = partition_key
         self.mapobject_id = mapobject_id
         self.tpoint = tpoint
         self.values = values
+        self.array_values = array_values
 
     @classmethod
     def _add(cls, connection, instance):
@@ -186,8 +213,412 @@ class FeatureValues(DistributedExperimentModel):
         )
         f.close()
 
+    @classmethod
+    def _bulk_ingest_dataframe(cls, connection, data, partition_key,
+            mapobject_ids, tpoint, as_array=False):
+        # All values are converted to text at once by numpy and each row is
+        # written with a single format operation, which has the feature IDs
+        # already built in, rather than formatting each value individually.
+        # In case values are stored as arrays, columns of "data" must be
+        # ordered according to the array index of the features.
+        if as_array:
+            row_format = '%d;%d;%d;{' + ','.join(
+                ['%s'] * data.shape[1]
+            ) + '}\n'
+            columns = ('partition_key', 'mapobject_id', 'tpoint', 'array_values')
+        else:
+            row_format = '%d;%d;%d;' + ','.join([
+                '%s=>%%s' % str(feature_id).replace('%', '%%')
+                for feature_id in data.columns
+            ]) + '\n'
+            columns = ('partition_key', 'mapobject_id', 'tpoint', 'values')
+        values = data.values.astype(str).tolist()
+        f = StringIO()
+        for mapobject_id, v in zip(mapobject_ids, values):
+            f.write(row_format % tuple([partition_key, mapobject_id, tpoint] + v))
+        f.seek(0)
+        connection.copy_from(
+            f, cls.__table__.name, sep=';', columns=columns, null=''
+        )
+        f.close()
+
+    @staticmethod
+    def build_array_values_sql(array_indices, alias='feature_values'):
+        '''Builds a SQL expression that selects the values of the given
+        features from :attr:`array_values` in binary form.
+
+        Parameters
+        ----------
+        array_indices: List[int]
+            :attr:`Feature.array_index <tmlib.models.feature.Feature.array_index>`
+            of each feature that should be selected
+        alias: str, optional
+            name or alias of the table in the ``FROM`` clause of the query
+            (default: ``"feature_values"``)
+
+        Returns
+        -------
+        str
+            SQL expression
+
+        Note
+        ----
+        Values are concatenated in their binary representation as big-endian
+        32-bit floats, such that they can be decoded with
+        :meth:`decode_array_values` without loss of precision.
+        Missing values are represented as ``NaN``.
+        '''
+        if len(array_indices) == 0:
+            return "''::bytea"
+        return ' || '.join([
+            "coalesce(float4send(%s.array_values[%d]), '\\x7fc00000'::bytea)" % (
+                alias, int(i) + 1
+            )
+            for i in array_indices
+        ])
+
+    @staticmethod
+    def decode_array_values(buffers, n_features, dtype=np.float64):
+        '''Decodes feature values selected in binary form via
+        :meth:`build_array_values_sql`.
+
+        Parameters
+        ----------
+        buffers: List[buffer]
+            binary values of each mapobject
+        n_features: int
+            number of selected features
+        dtype: type, optional
+            data type of the returned array (default: ``numpy.float64``)
+
+        Returns
+        -------
+        numpy.ndarray
+            2D array of values, where rows represent mapobjects and columns
+            represent features
+        '''
+        if len(buffers) == 0 or n_features == 0:
+            return np.zeros((len(buffers), n_features), dtype=dtype)
+        values = np.frombuffer(
+            b''.join([bytes(b) for b in buffers]), dtype='>f4'
+        )
+        return values.reshape((len(buffers), n_features)).astype(dtype)
+
+    @classmethod
+    def convert_to_arrays(cls, connection, mapobject_type_id):
+        '''Converts feature values of a mapobject type from *HSTORE* to arrays
+        and assigns an array index to each
+        :class:`Feature <tmlib.models.feature.Feature>` of the type.
+
+        Parameters
+        ----------
+        connection: tmlib.models.utils.ExperimentConnection
+            experiment-specific database connection
+        mapobject_type_id: int
+            ID of the parent
+            :class:`MapobjectType <tmlib.models.mapobject.MapobjectType>`
+        '''
+        logger.info(
+            'assign array index to features of mapobject type %d',
+            mapobject_type_id
+        )
+        connection.execute('''
+            UPDATE features SET array_index = f.array_index
+            FROM (
+                SELECT id, row_number() OVER (ORDER BY id) - 1 AS array_index
+                FROM features WHERE mapobject_type_id = %(mapobject_type_id)s
+            ) AS f
+            WHERE features.id = f.id;
+        ''', {
+            'mapobject_type_id': mapobject_type_id
+        })
+        connection.execute('''
+            SELECT id, array_index FROM features
+            WHERE mapobject_type_id = %(mapobject_type_id)s
+            ORDER BY array_index
+        ''', {
+            'mapobject_type_id': mapobject_type_id
+        })
+        features = connection.fetchall()
+        logger.info(
+            'convert values of %d features of mapobject type %d to arrays',
+            len(features), mapobject_type_id
+        )
+        elements = ','.join([
+            "(v.values->'%d')::real" % f.id for f in features
+        ])
+        connection.execute('''
+            UPDATE feature_values AS v
+            SET array_values = ARRAY[%s]::real[], values = NULL
+            WHERE v.values IS NOT NULL
+            AND (v.mapobject_id, v.partition_key) IN (
+                SELECT id, partition_key FROM mapobjects
+                WHERE mapobject_type_id = %%(mapobject_type_id)s
+            );
+        ''' % elements, {
+            'mapobject_type_id': mapobject_type_id
+        })
+        connection.execute('''
+            UPDATE mapobject_types SET array_feature_values = TRUE
+            WHERE id = %(mapobject_type_id)s;
+        ''', {
+            'mapobject_type_id': mapobject_type_id
+        })
+
     def __repr__(self):
         return (
             '<FeatureValues(id=%r, tpoint=%r, mapobject_id=%r)>'
             % (self.id, self.tpoint, self.mapobject_id)
         )
+
+
+class FeatureStatistics(ExperimentModel, IdMixIn):
+
+    '''Summary statistics of the values of a
+    :class:`Feature <tmlib.models.feature.Feature>` at a given time point,
+    such that values can be rescaled or displayed as a histogram without
+    reading :class:`FeatureValues <tmlib.models.feature.FeatureValues>`.
+
+    Statistics are recorded for each job that saved feature values and
+    merged over all jobs afterwards. Merged statistics have no job ID.
+    Values of objects without a valid segmentation, which get removed
+    in the collect phase, are not included. Objects that are deleted after
+    the statistics were recorded are still included, however.
+    '''
+
+    __tablename__ = 'feature_statistics'
+
+    __table_args__ = (UniqueConstraint('feature_id', 'tpoint', 'job_id'), )
+
+    #: int: zero-based time point index
+    tpoint = Column(Integer, index=True)
+
+    #: int: one-based ID of the job that recorded the statistics
+    job_id = Column(Integer, index=True)
+
+    #: int: number of finite values
+    count = Column(BigInteger)
+
+    #: int: number of missing or non-finite values
+    nan_count = Column(BigInteger)
+
+    #: float: minimum of finite values
+    minimum = Column(DOUBLE_PRECISION)
+
+    #: float: maximum of finite values
+    maximum = Column(DOUBLE_PRECISION)
+
+    #: float: mean of finite values
+    mean = Column(DOUBLE_PRECISION)
+
+    #: List[int]: indices of non-empty histogram bins in ascending order
+    #: (see :meth:`get_bin_edges`)
+    histogram_bins = Column(ARRAY(Integer))
+
+    #: List[int]: number of finite values in each bin of
+    #: :attr:`histogram_bins`
+    histogram = Column(ARRAY(BigInteger))
+
+    #: int: ID of the parent feature
+    feature_id = Column(
+        Integer,
+        ForeignKey('features.id', onupdate='CASCADE', ondelete='CASCADE'),
+        index=True
+    )
+
+    #: tmlib.models.feature.Feature: parent feature
+    feature = relationship(
+        'Feature',
+        backref=backref('statistics', cascade='all, delete-orphan')
+    )
+
+    def __init__(self, feature_id, tpoint, count, nan_count, minimum, maximum,
+            mean, histogram_bins, histogram, job_id=None):
+        '''
+        Parameters
+        ----------
+        feature_id: int
+            ID of the parent :class:`Feature <tmlib.models.feature.Feature>`
+        tpoint: int
+            zero-based time point index
+        count: int
+            number of finite values
+        nan_count: int
+            number of missing or non-finite values
+        minimum: float
+            minimum of finite values
+        maximum: float
+            maximum of finite values
+        mean: float
+            mean of finite values
+        histogram_bins: List[int]
+            indices of non-empty histogram bins
+        histogram: List[int]
+            number of finite values per bin
+        job_id: int, optional
+            ID of the job that recorded the statistics; ``None`` for
+            statistics that were merged over all jobs
+        '''
+        self.feature_id = feature_id
+        self.tpoint = tpoint
+        self.job_id = job_id
+        self.count = count
+        self.nan_count = nan_count
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.histogram_bins = histogram_bins
+        self.histogram = histogram
+
+    @staticmethod
+    def digitize(values):
+        '''Assigns feature values to histogram bins.
+
+        Bins have fixed edges on a logarithmic scale, which don't depend on
+        the range of values. Bin ``0`` holds zeros, bins ``1`` to
+        ``2 * HISTOGRAM_OCTAVES * HISTOGRAM_BINS_PER_OCTAVE`` hold positive
+        and the corresponding negative indices hold negative values.
+
+        Parameters
+        ----------
+        values: numpy.ndarray[float]
+            finite feature values
+
+        Returns
+        -------
+        numpy.ndarray[int]
+            bin index of each value
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        n = HISTOGRAM_OCTAVES * HISTOGRAM_BINS_PER_OCTAVE
+        magnitudes = np.abs(values)
+        is_zero = magnitudes == 0
+        magnitudes[is_zero] = 1
+        index = np.floor(np.log2(magnitudes) * HISTOGRAM_BINS_PER_OCTAVE)
+        index = np.clip(index, -n, n - 1).astype(np.int64) + n + 1
+        index[is_zero] = 0
+        return np.where(values < 0, -index, index)
+
+    @staticmethod
+    def get_bin_edges(bins):
+        '''Gets the edges of histogram bins.
+
+        Parameters
+        ----------
+        bins: List[int]
+            bin indices as returned by :meth:`digitize`
+
+        Returns
+        -------
+        Tuple[numpy.ndarray[float]]
+            lower and upper edge of each bin; the edges of the outermost bins
+            only apply to values within the range of the histogram
+        '''
+        bins = np.asarray(bins, dtype=np.int64)
+        n = HISTOGRAM_OCTAVES * HISTOGRAM_BINS_PER_OCTAVE
+        exponents = np.abs(bins) - n - 1
+        lower = np.power(2.0, exponents / float(HISTOGRAM_BINS_PER_OCTAVE))
+        upper = np.power(2.0, (exponents + 1) / float(HISTOGRAM_BINS_PER_OCTAVE))
+        lower[bins == 0] = 0
+        upper[bins == 0] = 0
+        is_negative = bins < 0
+        lower[is_negative], upper[is_negative] = (
+            -upper[is_negative], -lower[is_negative]
+        )
+        return (lower, upper)
+
+    @staticmethod
+    def summarize(values):
+        '''Computes summary statistics of feature values.
+
+        Parameters
+        ----------
+        values: numpy.ndarray[float]
+            feature values
+
+        Returns
+        -------
+        dict
+            keyword arguments for the constructor of the class, i.e.
+            "count", "nan_count", "minimum", "maximum", "mean",
+            "histogram_bins" and "histogram"
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        summary = {
+            'count': int(finite.size),
+            'nan_count': int(values.size - finite.size),
+            'minimum': None, 'maximum': None, 'mean': None,
+            'histogram_bins': [], 'histogram': []
+        }
+        if finite.size > 0:
+            bins, counts = np.unique(
+                FeatureStatistics.digitize(finite), return_counts=True
+            )
+            summary.update({
+                'minimum': float(finite.min()),
+                'maximum': float(finite.max()),
+                'mean': float(finite.mean()),
+                'histogram_bins': bins.tolist(),
+                'histogram': counts.tolist()
+            })
+        return summary
+
+    @staticmethod
+    def merge(summaries):
+        '''Merges summary statistics of disjoint sets of feature values.
+
+        Parameters
+        ----------
+        summaries: List[dict]
+            summary statistics as returned by :meth:`summarize`
+
+        Returns
+        -------
+        dict
+            merged summary statistics
+
+        Note
+        ----
+        Since bins have fixed edges, histograms are merged exactly by adding
+        up the counts of the same bins, independent of how often summaries
+        get merged.
+        '''
+        merged = {
+            'count': sum([s['count'] for s in summaries]),
+            'nan_count': sum([s['nan_count'] for s in summaries]),
+            'minimum': None, 'maximum': None, 'mean': None,
+            'histogram_bins': [], 'histogram': []
+        }
+        if merged['count'] == 0:
+            return merged
+        summaries = [s for s in summaries if s['count'] > 0]
+        # Statistics recorded by previous versions lack the bins.
+        histograms = [s for s in summaries if s['histogram_bins'] is not None]
+        bins = np.concatenate([np.zeros((0, ), dtype=np.int64)] + [
+            np.asarray(s['histogram_bins'], dtype=np.int64)
+            for s in histograms
+        ])
+        counts = np.concatenate([np.zeros((0, ), dtype=np.int64)] + [
+            np.asarray(s['histogram'], dtype=np.int64)
+            for s in histograms
+        ])
+        bins, index = np.unique(bins, return_inverse=True)
+        histogram = np.zeros(bins.shape, dtype=np.int64)
+        np.add.at(histogram, index, counts)
+        merged.update({
+            'minimum': min([s['minimum'] for s in summaries]),
+            'maximum': max([s['maximum'] for s in summaries]),
+            'mean': sum([
+                s['mean'] * s['count'] for s in summaries
+            ]) / float(merged['count']),
+            'histogram_bins': bins.tolist(),
+            'histogram': histogram.tolist()
+        })
+        return merged
+
+    def __repr__(self):
+        return (
+            '<FeatureStatistics(id=%r, feature_id=%r, tpoint=%r, job_id=%r)>'
+            % (self.id, self.feature_id, self.tpoint, self.job_id)
+        )
@@ -21,6 +21,7 @@ from sqlalchemy.orm import relationship, backref, Session
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import func
 from cached_property import cached_property
 
 from tmlib.utils import assert_type
@@ -41,6 +42,11 @@ from tmlib.models.alignment import SiteShift
 
 logger = logging.getLogger(__name__)
 
+#: Dict[int, Tuple[float, tmlib.image.IllumstatsContainer]]: illumination
+#: statistics loaded by the current process mapped to the ID of the
+#: corresponding file together with the modification time of the file
+_illumstats_cache = dict()
+
 
 @remove_location_upon_delete
 class MicroscopeImageFile(FileModel, DateMixIn):
@@ -431,19 +437,55 @@ class IllumstatsFile(FileModel, DateMixIn):
         Returns
         -------
         Illumstats
-            illumination statistics images
+            smoothed illumination statistics images
+
+        Note
+        ----
+        Statistics are loaded only once per process and version of the file.
+        The version is identified by the size of the file and the time the
+        corresponding database row was last updated, which is set
+        upon :meth:`put <tmlib.models.file.IllumstatsFile.put>`.
+        The modification time of the file can't be used, because reading
+        the file also modifies it (see
+        :class:`DatasetReader <tmlib.readers.DatasetReader>`).
+        The returned object is shared between calls and must thus not be
+        modified.
         '''
+        version = (os.path.getsize(self.location), self.updated_at)
+        cached = _illumstats_cache.get(self.id)
+        if cached is not None and cached[0] == version:
+            logger.debug(
+                'use cached data of illumination statistics file: %s',
+                self.location
+            )
+            return cached[1]
         logger.debug(
             'get data from illumination statistics file: %s', self.location
         )
-        metadata = IllumstatsImageMetadata(channel_id=self.channel.id)
+        metadata = IllumstatsImageMetadata(channel_id=self.channel_id)
         with DatasetReader(self.location) as f:
-            mean = IllumstatsImage(f.read('mean'), metadata)
-            std = IllumstatsImage(f.read('std'), metadata)
             keys = f.read('percentiles/keys')
             values = f.read('percentiles/values')
             percentiles = dict(zip(keys, values))
-        return IllumstatsContainer(mean, std, percentiles).smooth()
+            if f.exists('smoothed'):
+                metadata.is_smoothed = True
+                stats = IllumstatsContainer(
+                    IllumstatsImage(f.read('smoothed/mean'), metadata),
+                    IllumstatsImage(f.read('smoothed/std'), metadata),
+                    percentiles,
+                    mean_of_mean=float(f.read('smoothed/mean_of_mean')),
+                    mean_of_std=float(f.read('smoothed/mean_of_std'))
+                )
+            else:
+                # Files written by previous versions only provide the
+                # raw statistics.
+                stats = IllumstatsContainer(
+                    IllumstatsImage(f.read('mean'), metadata),
+                    IllumstatsImage(f.read('std'), metadata),
+                    percentiles
+                ).smooth()
+        _illumstats_cache[self.id] = (version, stats)
+        return stats
 
     @assert_type(data='tmlib.image.IllumstatsContainer')
     def put(self, data):
@@ -453,15 +495,37 @@ class IllumstatsFile(FileModel, DateMixIn):
         ----------
         data: IllumstatsContainer
             illumination statistics
+
+        Note
+        ----
+        In addition to the provided statistics, smoothed statistics are
+        stored together with their average values, such that they don't
+        need to be recomputed upon :meth:`get <tmlib.models.file.IllumstatsFile.get>`.
         '''
         logger.debug(
             'put data to illumination statistics file: %s', self.location
         )
+        if data.mean.metadata is not None and data.mean.metadata.is_smoothed:
+            smoothed = data
+        else:
+            metadata = IllumstatsImageMetadata(channel_id=self.channel_id)
+            smoothed = IllumstatsContainer(
+                IllumstatsImage(data.mean.array, metadata),
+                IllumstatsImage(data.std.array, metadata),
+                data.percentiles
+            ).smooth()
         with DatasetWriter(self.location, truncate=True) as f:
             f.write('mean', data.mean.array)
             f.write('std', data.std.array)
             f.write('/percentiles/keys', data.percentiles.keys())
             f.write('/percentiles/values', data.percentiles.values())
+            f.write('/smoothed/mean', smoothed.mean.array)
+            f.write('/smoothed/std', smoothed.std.array)
+            f.write('/smoothed/mean_of_mean', smoothed.mean_of_mean)
+            f.write('/smoothed/mean_of_std', smoothed.mean_of_std)
+        # Mark the statistics as changed, such that cached copies of other
+        # processes get invalidated upon the next call of "get()".
+        self.updated_at = func.now()
 
     @hybrid_property
     def location(self):
@@ -21,7 +21,7 @@ import random
 import collections
 import pandas as pd
 from cStringIO import StringIO
-from sqlalchemy import func, case
+from sqlalchemy import func, case, literal_column
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import to_shape
 from sqlalchemy.orm import Session
@@ -72,6 +72,10 @@ class MapobjectType(ExperimentModel, IdMixIn):
     #: layout and independent of image segmentation (e.g. "Plate" or "Well")
     ref_type = Column(String(50))
 
+    #: bool: whether feature values are stored as arrays
+    #: (see :attr:`FeatureValues.array_values <tmlib.models.feature.FeatureValues.array_values>`)
+    array_feature_values = Column(Boolean, default=False)
+
     #: int: ID of parent experiment
     experiment_id = Column(
         Integer,
@@ -85,7 +89,8 @@ class MapobjectType(ExperimentModel, IdMixIn):
         backref=backref('mapobject_types', cascade='all, delete-orphan')
     )
 
-    def __init__(self, name, experiment_id, ref_type=None):
+    def __init__(self, name, experiment_id, ref_type=None,
+            array_feature_values=False):
         '''
         Parameters
         ----------
@@ -96,10 +101,14 @@ class MapobjectType(ExperimentModel, IdMixIn):
             :class:`Experiment <tmlib.models.experiment.Experiment>`
         ref_type: str, optional
             name of another reference type (default: ``None``)
+        array_feature_values: bool, optional
+            whether feature values should be stored as arrays
+            (default: ``False``)
         '''
         self.name = name
         self.ref_type = ref_type
         self.experiment_id = experiment_id
+        self.array_feature_values = array_feature_values
 
     @classmethod
     def delete_cascade(cls, connection, static=None):
@@ -258,12 +267,41 @@ class MapobjectType(ExperimentModel, IdMixIn):
         '''
         session = Session.object_session(self)
 
-        features = session.query(Feature.id, Feature.name).\
+        features = session.query(
+                Feature.id, Feature.name, Feature.array_index
+            ).\
             filter_by(mapobject_type_id=self.id)
         if feature_ids is not None:
             features = features.filter(Feature.id.in_(feature_ids))
         features = features.all()
-        feature_map = {str(id): name for id, name in features}
+        feature_map = {str(f.id): f.name for f in features}
+
+        if self.array_feature_values:
+            features = sorted(features, key=lambda f: f.array_index)
+            records = session.query(
+                    FeatureValues.mapobject_id,
+                    literal_column(
+                        FeatureValues.build_array_values_sql(
+                            [f.array_index for f in features]
+                        )
+                    ).label('values')
+                ).\
+                join(Mapobject).\
+                join(MapobjectSegmentation).\
+                filter(
+                    Mapobject.mapobject_type_id == self.id,
+                    FeatureValues.tpoint == tpoint,
+                    FeatureValues.partition_key == site_id
+                ).\
+                order_by(Mapobject.id).\
+                all()
+            values = FeatureValues.decode_array_values(
+                [r.values for r in records], len(features)
+            )
+            return pd.DataFrame(
+                values, index=[r.mapobject_id for r in records],
+                columns=[f.name for f in features]
+            )
 
         if feature_ids is not None:
             records = session.query(
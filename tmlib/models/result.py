@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
 from cStringIO import StringIO
+from struct import pack
 import csv
 import numpy as np
 import pandas as pd
@@ -26,10 +27,55 @@ from sqlalchemy.dialects.postgresql import HSTORE, JSON
 from sqlalchemy.orm import relationship, backref, Session
 
 from tmlib.models.base import ExperimentModel, IdMixIn
-from tmlib.models.feature import FeatureValues
+from tmlib.models.feature import Feature, FeatureValues
 
 logger = logging.getLogger(__name__)
 
+#: int: number of label values that are encoded at once for binary ``COPY``
+COPY_CHUNK_SIZE = 2**16
+
+#: numpy.dtype: big-endian layout of the fixed-size part of an encoded record
+_COPY_PREFIX_DTYPE = np.dtype([
+    ('n_fields', '>i2'),
+    ('partition_key_size', '>i4'), ('partition_key', '>i4'),
+    ('mapobject_id_size', '>i4'), ('mapobject_id', '>i8'),
+    ('tpoint_size', '>i4'), ('tpoint', '>i4'),
+    ('value_size', '>i4')
+])
+
+
+class _ChunkReader(object):
+
+    '''File-like object that reads from an iterable of strings, which allows
+    streaming data via ``COPY`` without holding all of it in memory.
+    '''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = b''
+        self._position = 0
+
+    def read(self, size=-1):
+        parts = list()
+        n = 0
+        while size < 0 or n < size:
+            if self._position >= len(self._chunk):
+                try:
+                    self._chunk = next(self._chunks)
+                except StopIteration:
+                    break
+                self._position = 0
+                continue
+            if size < 0:
+                end = len(self._chunk)
+            else:
+                end = self._position + size - n
+            part = self._chunk[self._position:end]
+            self._position += len(part)
+            n += len(part)
+            parts.append(part)
+        return b''.join(parts)
+
 
 class ToolResult(ExperimentModel, IdMixIn):
 
@@ -290,11 +336,15 @@ class HeatmapToolResult(ContinuousToolResult):
         '''
         session = Session.object_session(self)
         feature_id = self.attributes['feature_id']
+        feature = session.query(Feature.array_index).\
+            filter(Feature.id == feature_id).\
+            one()
+        if feature.array_index is not None:
+            value = FeatureValues.array_values[feature.array_index + 1]
+        else:
+            value = FeatureValues.values[str(feature_id)]
         return dict(
-            session.query(
-                FeatureValues.mapobject_id,
-                FeatureValues.values[str(feature_id)]
-            ).
+            session.query(FeatureValues.mapobject_id, value).
             filter(FeatureValues.mapobject_id.in_(mapobject_ids)).
             all()
         )
@@ -376,6 +426,136 @@ class LabelValues(ExperimentModel):
             'tpoint': instance.tpoint
         })
 
+    @staticmethod
+    def _encode_binary_copy(partition_keys, mapobject_ids, tpoints, values):
+        '''Encodes label values in the *PostgreSQL* binary ``COPY`` format.
+
+        Parameters
+        ----------
+        partition_keys: numpy.ndarray[int]
+            partition key of each mapobject
+        mapobject_ids: numpy.ndarray[int]
+            ID of each mapobject
+        tpoints: numpy.ndarray[int]
+            time point of each label value
+        values: numpy.ndarray[str]
+            label values encoded as text
+
+        Returns
+        -------
+        Generator[str]
+            encoded records in chunks of :const:`COPY_CHUNK_SIZE`,
+            preceded by the header and followed by the trailer
+
+        Note
+        ----
+        Each record consists of the columns
+        ``partition_key, mapobject_id, tpoint, value`` in that order.
+        Records are encoded without iterating over them in Python.
+        '''
+        # Signature, flags field and length of header extension area
+        yield b'PGCOPY\n\xff\r\n\x00' + pack('!ii', 0, 0)
+        values = np.asarray(values, dtype=np.string_)
+        prefix_size = _COPY_PREFIX_DTYPE.itemsize
+        for start in range(0, len(values), COPY_CHUNK_SIZE):
+            end = start + COPY_CHUNK_SIZE
+            chunk = values[start:end]
+            n = len(chunk)
+            sizes = np.char.str_len(chunk)
+            prefix = np.empty(n, dtype=_COPY_PREFIX_DTYPE)
+            prefix['n_fields'] = 4
+            prefix['partition_key_size'] = 4
+            prefix['partition_key'] = partition_keys[start:end]
+            prefix['mapobject_id_size'] = 8
+            prefix['mapobject_id'] = mapobject_ids[start:end]
+            prefix['tpoint_size'] = 4
+            prefix['tpoint'] = tpoints[start:end]
+            prefix['value_size'] = sizes
+            record_sizes = prefix_size + sizes
+            offsets = np.cumsum(record_sizes) - record_sizes
+            buf = np.empty(record_sizes.sum(), dtype=np.uint8)
+            buf[
+                (offsets[:, np.newaxis] + np.arange(prefix_size)).ravel()
+            ] = prefix.view(np.uint8)
+            # Values are copied from the fixed-width array without the
+            # padding of shorter strings.
+            width = chunk.dtype.itemsize
+            chars = chunk.view(np.uint8).reshape(n, width)
+            mask = np.arange(width) < sizes[:, np.newaxis]
+            positions = (
+                offsets[:, np.newaxis] + prefix_size + np.arange(width)
+            )
+            buf[positions[mask]] = chars[mask]
+            yield buf.tostring()
+        # File trailer
+        yield pack('!h', -1)
+
+    @classmethod
+    def _bulk_upsert_shards(cls, connection, shards, result_id,
+            partition_keys, mapobject_ids, tpoints, values):
+        '''Inserts label values of a tool result into shards located on
+        the same worker server or adds them to existing rows.
+
+        Parameters
+        ----------
+        connection: tmlib.models.utils.ExperimentWorkerConnection
+            connection to the worker server
+        shards: Dict[int, List[int]]
+            partition keys of the label values for each shard ID
+        result_id: int
+            ID of the :class:`ToolResult <tmlib.models.result.ToolResult>`
+        partition_keys: numpy.ndarray[int]
+            partition key of each mapobject
+        mapobject_ids: numpy.ndarray[int]
+            ID of each mapobject
+        tpoints: numpy.ndarray[int]
+            time point of each label value
+        values: numpy.ndarray[str]
+            label values encoded as text
+
+        Note
+        ----
+        Values are streamed in binary format into a temporary staging table
+        with a single ``COPY`` and then upserted into each shard with a
+        set-based statement.
+        '''
+        connection.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS label_values_staging (
+                partition_key integer, mapobject_id bigint, tpoint integer,
+                value text
+            );
+            TRUNCATE label_values_staging;
+        ''')
+        f = _ChunkReader(
+            cls._encode_binary_copy(
+                partition_keys, mapobject_ids, tpoints, values
+            )
+        )
+        connection.copy_expert('''
+            COPY label_values_staging (
+                partition_key, mapobject_id, tpoint, value
+            )
+            FROM STDIN WITH (FORMAT binary)
+        ''', f, size=2**20)
+        for shard_id, shard_partition_keys in shards.iteritems():
+            logger.debug('upsert label values into shard %d', shard_id)
+            connection.execute('''
+                INSERT INTO label_values_{shard} AS v (
+                    partition_key, mapobject_id, values, tpoint
+                )
+                SELECT partition_key, mapobject_id, hstore(%(key)s, value),
+                    tpoint
+                FROM label_values_staging
+                WHERE partition_key = ANY(%(partition_keys)s)
+                ON CONFLICT ON CONSTRAINT label_values_pkey_{shard}
+                DO UPDATE
+                SET values = v.values || EXCLUDED.values
+            '''.format(shard=shard_id), {
+                'key': str(result_id),
+                'partition_keys': shard_partition_keys
+            })
+        connection.execute('TRUNCATE label_values_staging;')
+
     @classmethod
     def _bulk_ingest(cls, connection, instances):
         f = StringIO()
@@ -0,0 +1,535 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Reproducible random sampling of table rows.
+
+Sorting rows by ``random()`` requires a scan and sort of the whole table.
+Instead, a pool of candidate rows is drawn via ``TABLESAMPLE`` with a
+``REPEATABLE`` seed, which only reads a fraction of the table, and the sample
+is selected from the pool by means of a seeded random number generator.
+Distributed tables are sampled shard by shard on the database worker servers.
+In case a table cannot be sampled, the pool is drawn by priority
+sampling, i.e. each row gets a pseudo-random priority derived from its ID and
+the seed and the database server keeps the rows with the lowest priorities.
+This requires a scan of the table, but not more work than sorting by
+``random()``.
+'''
+import logging
+import collections
+import numpy as np
+import psycopg2
+import sqlalchemy.exc
+from multiprocessing.pool import ThreadPool
+from sqlalchemy import func, literal, tablesample, text, cast, Text
+
+from tmlib.models.site import Site
+from tmlib.models.utils import ExperimentConnection
+from tmlib.models.utils import ExperimentWorkerConnection
+from tmlib.models.utils import ExperimentSession
+from tmlib.models.utils import POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+#: Tuple[str]: supported sampling methods
+SAMPLING_METHODS = ('system', 'bernoulli', 'priority')
+
+#: float: factor by which the expected number of sampled rows exceeds the
+#: number of required candidates
+_OVERSAMPLING = 1.5
+
+#: int: factor by which the candidate pool exceeds the requested sample size
+#: in case the sample gets stratified
+_STRATIFIED_POOL_FACTOR = 2
+
+#: float: sampling percentage in case the size of the table is unknown
+_DEFAULT_PERCENTAGE = 1.0
+
+
+def _allocate(counts, n):
+    '''Allocates a sample size to strata in proportion to their sizes using
+    the largest remainder method.
+
+    Parameters
+    ----------
+    counts: numpy.ndarray[int]
+        number of candidates per stratum
+    n: int
+        total sample size; must not exceed the total number of candidates
+
+    Returns
+    -------
+    numpy.ndarray[int]
+        sample size per stratum
+    '''
+    quotas = n * counts / float(counts.sum())
+    sizes = np.floor(quotas).astype(int)
+    remainder = n - sizes.sum()
+    if remainder > 0:
+        # Stable sorting breaks ties in favor of the first stratum.
+        order = np.argsort(-(quotas - sizes), kind='mergesort')
+        sizes[order[:remainder]] += 1
+    return sizes
+
+
+def _select(ids, strata, n, seed):
+    '''Selects a random sample from a pool of candidates.
+
+    Parameters
+    ----------
+    ids: numpy.ndarray[int]
+        IDs of candidates
+    strata: numpy.ndarray[int], optional
+        stratum of each candidate
+    n: int
+        sample size
+    seed: int
+        seed of the random number generator
+
+    Returns
+    -------
+    numpy.ndarray[int]
+        sorted IDs of selected candidates
+    '''
+    # Priorities are assigned in order of IDs, such that the selection
+    # doesn't depend on the order in which the database returned rows.
+    order = np.argsort(ids, kind='mergesort')
+    ids = ids[order]
+    priorities = np.random.RandomState(seed).random_sample(len(ids))
+    if n >= len(ids):
+        return ids
+    if strata is None:
+        return np.sort(ids[np.argsort(priorities, kind='mergesort')[:n]])
+    strata = strata[order]
+    labels, counts = np.unique(strata, return_counts=True)
+    sizes = _allocate(counts, n)
+    selected = list()
+    for label, size in zip(labels, sizes):
+        index = np.where(strata == label)[0]
+        top = np.argsort(priorities[index], kind='mergesort')[:size]
+        selected.append(ids[index[top]])
+    return np.sort(np.concatenate(selected))
+
+
+def _get_columns(table, site_column):
+    columns = [table.c.id]
+    if site_column is not None:
+        columns.append(table.c[site_column])
+    return columns
+
+
+def _estimate_row_count(session, table_name):
+    # Planner statistics are cheap to query, but they are not available
+    # for the (empty) table of a distributed table on the coordinator node.
+    count = session.execute(
+        text(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = to_regclass(:name)'
+        ),
+        {'name': table_name}
+    ).scalar()
+    if count is None or count <= 0:
+        return None
+    return count
+
+
+def _draw_table_sample(session, model, size, seed, method, site_column,
+        criteria):
+    table = model.__table__
+    n_rows = _estimate_row_count(session, table.name)
+    if n_rows is None:
+        percentage = _DEFAULT_PERCENTAGE
+    else:
+        percentage = min(100.0, _OVERSAMPLING * size / float(n_rows) * 100)
+    while True:
+        sampled = tablesample(
+            table, getattr(func, method)(percentage), name='sampled',
+            seed=literal(seed)
+        )
+        query = session.query(*_get_columns(sampled, site_column)).\
+            filter(*[sampled.c[k] == v for k, v in criteria.iteritems()])
+        logger.debug(
+            'sample %.4f%% of table "%s"', percentage, table.name
+        )
+        if session.autocommit:
+            rows = query.all()
+        else:
+            # Failure of the query must not abort the enclosing transaction.
+            with session.begin_nested():
+                rows = query.all()
+        if len(rows) >= size or percentage >= 100:
+            return rows
+        # Extrapolate the percentage from the fraction of matching rows.
+        if rows:
+            percentage *= _OVERSAMPLING * size / float(len(rows))
+        else:
+            percentage *= 10
+        percentage = min(100.0, percentage)
+
+
+def _draw_priority_sample(session, model, size, seed, site_column,
+        criteria):
+    table = model.__table__
+    priority = func.md5(cast(table.c.id, Text) + literal(':%d' % seed))
+    rows = session.query(*_get_columns(table, site_column)).\
+        filter(*[table.c[k] == v for k, v in criteria.iteritems()]).\
+        order_by(priority).\
+        limit(size).\
+        all()
+    logger.debug(
+        'drew %d rows of table "%s" with lowest priority',
+        len(rows), table.name
+    )
+    return rows
+
+
+def sample_ids(session, model, n, seed=0, method='system', site_column=None,
+        **criteria):
+    '''Draws a random sample of rows of a table, which is reproducible for a
+    given `seed` as long as the table doesn't change.
+
+    Parameters
+    ----------
+    session: tmlib.models.utils.ExperimentSession
+        database session
+    model: type
+        class derived from
+        :class:`ExperimentModel <tmlib.models.base.ExperimentModel>`
+        with an ``id`` column
+    n: int
+        sample size
+    seed: int, optional
+        seed of the random number generator (default: ``0``)
+    method: str, optional
+        ``"system"`` for block-level or ``"bernoulli"`` for row-level
+        sampling of the table, which falls back to ``"priority"``, i.e.
+        a scan of the entire table on the database server, in case the
+        table can't be sampled (default: ``"system"``)
+    site_column: str, optional
+        name of the column of `model` that references
+        :class:`Site <tmlib.models.site.Site>`; when provided, the sample is
+        stratified by :class:`Well <tmlib.models.well.Well>`, i.e. each
+        well contributes in proportion to its number of rows
+    **criteria: dict
+        values that columns of selected rows must be equal to
+
+    Returns
+    -------
+    List[int]
+        sorted IDs of sampled rows; all IDs in case there are no more than
+        `n` rows matching `criteria`
+
+    Raises
+    ------
+    ValueError
+        when `method` is not supported or when the table of `model` is
+        distributed
+
+    Note
+    ----
+    Block-level sampling only reads the sampled pages of the table, but takes
+    all rows of a page. Rows that were inserted together, e.g. objects of
+    the same site, are therefore sampled together and the sample is
+    clustered by site and well. The pool only exceeds `n` by the
+    oversampling of the table (about 1.5 fold), or two fold for a
+    stratified sample, which is not sufficient to compensate for this bias.
+    Row-level sampling is unbiased, but reads the entire table.
+
+    See also
+    --------
+    :func:`tmlib.models.sampling.sample_distributed_ids`
+    '''
+    _check_method(method)
+    if model.__table__.info.get('is_distributed', False):
+        raise ValueError(
+            'Rows of distributed table "%s" must be sampled per shard.'
+            % model.__tablename__
+        )
+    size = _get_pool_size(n, site_column is not None)
+    rows = None
+    if method != 'priority':
+        try:
+            rows = _draw_table_sample(
+                session, model, size, seed, method, site_column, criteria
+            )
+        except sqlalchemy.exc.DBAPIError as error:
+            logger.warning(
+                'table "%s" cannot be sampled, use priority sampling: %s',
+                model.__tablename__, str(error.orig).strip()
+            )
+    if rows is None:
+        rows = _draw_priority_sample(
+            session, model, size, seed, site_column, criteria
+        )
+    logger.debug('drew a pool of %d candidates', len(rows))
+    wells = None
+    if site_column is not None and len(rows) > n:
+        site_ids = {r[1] for r in rows}
+        wells = dict(
+            session.query(Site.id, Site.well_id).
+            filter(Site.id.in_(list(site_ids))).
+            all()
+        )
+    return _select_from_pool(rows, wells, n, seed)
+
+
+def _check_method(method):
+    if method not in SAMPLING_METHODS:
+        raise ValueError(
+            'Argument "method" must be one of the following: "%s"'
+            % '", "'.join(SAMPLING_METHODS)
+        )
+
+
+def _get_pool_size(n, stratify):
+    if stratify:
+        return n * _STRATIFIED_POOL_FACTOR
+    return n
+
+
+def _select_from_pool(rows, wells, n, seed):
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    strata = None
+    if wells is not None:
+        strata = np.array([wells.get(r[1], -1) for r in rows], dtype=np.int64)
+    return _select(ids, strata, n, seed).tolist()
+
+
+def _build_shard_sample_sql(table_name, shard_id, site_column, criteria,
+        method):
+    '''Builds a statement that samples rows of a shard of a distributed
+    table on a database worker server.
+
+    Parameters
+    ----------
+    table_name: str
+        name of the distributed table
+    shard_id: int
+        ID of the shard
+    site_column: str
+        name of the column that references
+        :class:`Site <tmlib.models.site.Site>`, which is selected in addition
+        to the ID
+    criteria: List[str]
+        names of columns that must be equal to the parameter of the same name
+    method: str
+        ``"system"``, ``"bernoulli"`` or ``"priority"``; the statement has the
+        parameters "percentage" and "seed" for the former and "priority_seed"
+        and "size" for the latter
+
+    Returns
+    -------
+    str
+        SQL statement
+    '''
+    columns = ['id']
+    if site_column is not None:
+        columns.append(site_column)
+    sql = 'SELECT {columns} FROM {table}_{shard}'.format(
+        columns=', '.join(columns), table=table_name, shard=int(shard_id)
+    )
+    if method != 'priority':
+        sql += (
+            ' TABLESAMPLE {method} (%(percentage)s) REPEATABLE (%(seed)s)'.
+            format(method=method.upper())
+        )
+    if criteria:
+        sql += ' WHERE ' + ' AND '.join([
+            '{0} = %({0})s'.format(c) for c in criteria
+        ])
+    if method == 'priority':
+        # The same priorities as in "_draw_priority_sample()".
+        sql += ' ORDER BY md5(id::text || %(priority_seed)s) LIMIT %(size)s'
+    return sql
+
+
+def _sample_shards(experiment_id, host, port, shards, parameters, method,
+        sql):
+    rows = list()
+    with ExperimentWorkerConnection(experiment_id, host, port) as connection:
+        for shard_id, shard_sql in zip(shards, sql):
+            try:
+                connection.execute(shard_sql, parameters)
+            except psycopg2.DatabaseError as error:
+                if method == 'priority':
+                    raise
+                logger.warning(
+                    'shard %d cannot be sampled on worker %s:%s, use '
+                    'priority sampling: %s', shard_id, host, port,
+                    str(error).strip()
+                )
+                return None
+            rows.extend([tuple(r) for r in connection.fetchall()])
+    return rows
+
+
+def _estimate_shard_row_counts(experiment_id, host, port, table_name,
+        shards):
+    with ExperimentWorkerConnection(experiment_id, host, port) as connection:
+        connection.execute('''
+            SELECT sum(greatest(reltuples, 0))::bigint AS count FROM pg_class
+            WHERE oid = ANY(%(tables)s::regclass[])
+        ''', {
+            'tables': ['%s_%d' % (table_name, s) for s in shards]
+        })
+        return connection.fetchone().count or 0
+
+
+def _map_servers(func, servers):
+    if len(servers) > 1:
+        pool = ThreadPool(min(len(servers), POOL_SIZE))
+        try:
+            return pool.map(func, servers.items())
+        finally:
+            pool.close()
+            pool.join()
+    return map(func, servers.items())
+
+
+def sample_distributed_ids(experiment_id, model, n, seed=0, method='system',
+        stratify=False, **criteria):
+    '''Draws a random sample of rows of a distributed table, which is
+    reproducible for a given `seed` as long as the table doesn't change.
+
+    Each shard of the table is sampled on its database worker server, with
+    one connection per server. The same percentage of rows is sampled from
+    all shards, such that all rows have the same chance to be selected.
+
+    Parameters
+    ----------
+    experiment_id: int
+        ID of the experiment
+    model: type
+        class derived from
+        :class:`DistributedExperimentModel <tmlib.models.base.DistributedExperimentModel>`
+        with an ``id`` column that is distributed by
+        :class:`Site <tmlib.models.site.Site>`
+    n: int
+        sample size
+    seed: int, optional
+        seed of the random number generator (default: ``0``)
+    method: str, optional
+        ``"system"`` for block-level or ``"bernoulli"`` for row-level
+        sampling of shards, which falls back to ``"priority"``, i.e. a scan
+        of each shard on its database worker server, in case a shard can't be
+        sampled (default: ``"system"``)
+    stratify: bool, optional
+        whether each :class:`Well <tmlib.models.well.Well>` should contribute
+        in proportion to its number of rows (default: ``False``)
+    **criteria: dict
+        values that columns of selected rows must be equal to
+
+    Returns
+    -------
+    List[int]
+        sorted IDs of sampled rows; all IDs in case there are no more than
+        `n` rows matching `criteria`
+
+    Raises
+    ------
+    ValueError
+        when `method` is not supported
+
+    Note
+    ----
+    Block-level sampling takes all rows of a sampled page, such that the
+    sample is clustered by site and well, since objects of a site are
+    inserted together. Stratification only balances the number of rows per
+    well, but doesn't prevent that the rows of a well stem from few sites.
+    Use row-level sampling when the sample should be representative.
+
+    See also
+    --------
+    :func:`tmlib.models.sampling.sample_ids`
+    :meth:`tmlib.models.utils.ExperimentConnection.locate_partitions`
+    '''
+    _check_method(method)
+    table = model.__table__
+    site_column = table.info['distribute_by'] if stratify else None
+    for name in criteria:
+        # Column names become part of the statement.
+        if name not in table.c:
+            raise ValueError(
+                'Table "%s" has no column "%s".' % (table.name, name)
+            )
+    size = _get_pool_size(n, stratify)
+
+    with ExperimentSession(experiment_id) as session:
+        wells = dict(session.query(Site.id, Site.well_id).all())
+    with ExperimentConnection(experiment_id) as connection:
+        locations = connection.locate_partitions(model, wells.keys())
+    servers = collections.OrderedDict()
+    for partition_key, host, port, shard_id in locations:
+        shards = servers.setdefault((host, port), list())
+        if shard_id not in shards:
+            shards.append(shard_id)
+    if not servers:
+        return list()
+
+    parameters = dict(criteria)
+    parameters.update({
+        'seed': seed, 'priority_seed': ':%d' % seed, 'size': size
+    })
+
+    def estimate(server):
+        (host, port), shards = server
+        return _estimate_shard_row_counts(
+            experiment_id, host, port, table.name, shards
+        )
+
+    def sample(server, method):
+        (host, port), shards = server
+        sql = [
+            _build_shard_sample_sql(
+                table.name, s, site_column, criteria.keys(), method
+            )
+            for s in shards
+        ]
+        return _sample_shards(
+            experiment_id, host, port, shards, parameters, method, sql
+        )
+
+    rows = None
+    if method != 'priority':
+        n_rows = sum(_map_servers(estimate, servers))
+        if n_rows > 0:
+            percentage = min(100.0, _OVERSAMPLING * size / float(n_rows) * 100)
+        else:
+            percentage = _DEFAULT_PERCENTAGE
+        while True:
+            logger.debug(
+                'sample %.4f%% of shards of table "%s"', percentage, table.name
+            )
+            parameters['percentage'] = percentage
+            results = _map_servers(lambda s: sample(s, method), servers)
+            if any([r is None for r in results]):
+                break
+            rows = [r for server_rows in results for r in server_rows]
+            if len(rows) >= size or percentage >= 100:
+                break
+            if rows:
+                percentage *= _OVERSAMPLING * size / float(len(rows))
+            else:
+                percentage *= 10
+            percentage = min(100.0, percentage)
+            rows = None
+    if rows is None:
+        # Each shard provides its rows with the lowest priorities, which
+        # include the rows with the lowest priorities of the whole table.
+        results = _map_servers(lambda s: sample(s, 'priority'), servers)
+        rows = [r for server_rows in results for r in server_rows]
+    logger.debug('drew a pool of %d candidates', len(rows))
+    if not stratify or len(rows) <= n:
+        wells = None
+    return _select_from_pool(rows, wells, n, seed)
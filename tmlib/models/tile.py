@@ -123,26 +123,94 @@ class ChannelLayerTile(DistributedExperimentModel):
 
     @classmethod
     def _add(cls, connection, instance):
-        # This is expensive because the pixels data array gets included twice
-        # in the query
         connection.execute('''
             INSERT INTO channel_layer_tiles AS t (
                 channel_layer_id, z, y, x, pixels
             )
             VALUES (%(channel_layer_id)s, %(z)s, %(y)s, %(x)s, %(pixels)s)
             ON CONFLICT ON CONSTRAINT channel_layer_tiles_pkey
-            DO UPDATE SET pixels = %(pixels)s
+            DO UPDATE SET pixels = EXCLUDED.pixels
         ''', {
             'channel_layer_id': instance.channel_layer_id,
             'z': instance.z, 'y': instance.y, 'x': instance.x,
             'pixels': psycopg2.Binary(instance._pixels.tostring())
         })
 
+    @classmethod
+    def _encode_binary_copy(cls, instances):
+        '''Encodes tiles in the *PostgreSQL* binary ``COPY`` format.
+
+        Parameters
+        ----------
+        instances: List[tmlib.models.tile.ChannelLayerTile]
+            tiles that should be encoded
+
+        Returns
+        -------
+        io.BytesIO
+            buffer holding the encoded records
+
+        Note
+        ----
+        Each record consists of the columns
+        ``channel_layer_id, z, y, x, pixels`` in that order.
+        '''
+        f = BytesIO()
+        # Signature, flags field and length of header extension area
+        f.write(b'PGCOPY\n\xff\r\n\x00')
+        f.write(pack('!ii', 0, 0))
+        for obj in instances:
+            pixels = obj._pixels.tostring()
+            f.write(pack(
+                '!h9i', 5,
+                4, int(obj.channel_layer_id), 4, int(obj.z),
+                4, int(obj.y), 4, int(obj.x), len(pixels)
+            ))
+            f.write(pixels)
+        # File trailer
+        f.write(pack('!h', -1))
+        f.seek(0)
+        return f
+
     @classmethod
     def _bulk_ingest(cls, connection, instances):
-        # TODO: figure out how to COPY the binary pixel data
+        if not instances:
+            return
+        # Tiles are first copied into a temporary staging table in binary
+        # format and then upserted with a single set-based statement. This
+        # avoids a round trip per tile and transmits pixels only once.
+        # Duplicates within the same batch must be removed, because a row
+        # can only be affected once by "INSERT ... ON CONFLICT DO UPDATE".
+        records = collections.OrderedDict()
         for obj in instances:
-            cls._add(connection, obj)
+            if not isinstance(obj, cls):
+                raise TypeError('Object must have type %s' % cls.__name__)
+            records[(obj.channel_layer_id, obj.z, obj.y, obj.x)] = obj
+        connection.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS channel_layer_tiles_staging (
+                channel_layer_id integer, z integer, y integer, x integer,
+                pixels bytea
+            );
+            TRUNCATE channel_layer_tiles_staging;
+        ''')
+        f = cls._encode_binary_copy(records.values())
+        connection.copy_expert('''
+            COPY channel_layer_tiles_staging (
+                channel_layer_id, z, y, x, pixels
+            )
+            FROM STDIN WITH (FORMAT binary)
+        ''', f)
+        f.close()
+        connection.execute('''
+            INSERT INTO channel_layer_tiles AS t (
+                channel_layer_id, z, y, x, pixels
+            )
+            SELECT channel_layer_id, z, y, x, pixels
+            FROM channel_layer_tiles_staging
+            ON CONFLICT ON CONSTRAINT channel_layer_tiles_pkey
+            DO UPDATE SET pixels = EXCLUDED.pixels;
+            TRUNCATE channel_layer_tiles_staging;
+        ''')
 
     def __repr__(self):
         return '<%s(z=%r, y=%r, x=%r, channel_layer_id=%r)>' % (
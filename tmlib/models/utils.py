@@ -110,6 +110,21 @@ def create_db_engine(db_uri, cache=True):
     return engine
 
 
+def dispose_db_engines():
+    '''Closes pooled connections of all cached database engines of the
+    current Python process.
+
+    Note
+    ----
+    Should be called before the process gets forked, since database
+    connections must not be shared between processes. New connections
+    are opened upon the next request.
+    '''
+    for engine in DATABASE_ENGINES.itervalues():
+        logger.debug('dispose database engine for process %d', os.getpid())
+        engine.dispose()
+
+
 def create_db_tables(engine):
     '''Creates all tables in the *public* schema.
 
@@ -200,6 +215,121 @@ def _create_experiment_db_tables(connection, schema_name):
     experiment_specific_metadata.create_all(connection)
 
 
+#: List[str]: names of tables that were added to experiment-specific schemas
+#: after their creation
+_EXPERIMENT_DB_TABLE_UPGRADES = [
+    'feature_statistics',
+]
+
+#: List[Tuple[str]]: table name, column name and column definition of columns
+#: that were added to tables of experiment-specific schemas after their
+#: creation
+_EXPERIMENT_DB_COLUMN_UPGRADES = [
+    ('features', 'array_index', 'integer'),
+    ('mapobject_types', 'array_feature_values', 'boolean DEFAULT FALSE'),
+    ('feature_values', 'array_values', 'real[]'),
+    ('feature_statistics', 'histogram_bins', 'integer[]'),
+]
+
+#: Set[str]: experiment-specific schemas that have already been upgraded by
+#: the current process
+_UPGRADED_SCHEMAS = set()
+
+
+def _find_missing_experiment_db_objects(connection, schema_name):
+    existing_columns = set(connection.execute('''
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = %(schema)s;
+    ''', {
+        'schema': schema_name
+    }).fetchall())
+    existing_tables = {table for table, column in existing_columns}
+    missing_tables = [
+        table for table in _EXPERIMENT_DB_TABLE_UPGRADES
+        if table not in existing_tables
+    ]
+    # Columns of tables that get created don't need to be added.
+    missing_columns = [
+        (table, column, definition)
+        for table, column, definition in _EXPERIMENT_DB_COLUMN_UPGRADES
+        if (table, column) not in existing_columns
+        and table not in missing_tables
+    ]
+    return (missing_tables, missing_columns)
+
+
+def _upgrade_experiment_db_tables(engine, schema_name):
+    '''Adds tables and columns that are missing in an existing
+    experiment-specific schema, because they were introduced after the
+    schema had been created.
+
+    The check is performed only once per process and schema. Tables and
+    columns are added outside of a transaction, since distributed tables
+    cannot be altered within a transaction context, and concurrent upgrades
+    of the same schema are serialized by an advisory lock.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        database engine
+    schema_name: str
+        name of the experiment-specific schema
+    '''
+    if schema_name in _UPGRADED_SCHEMAS:
+        return
+    connection = engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT'
+    )
+    try:
+        missing_tables, missing_columns = _find_missing_experiment_db_objects(
+            connection, schema_name
+        )
+        if missing_tables or missing_columns:
+            connection.execute('''
+                SELECT pg_advisory_lock(hashtext(%(schema)s));
+            ''', {
+                'schema': schema_name
+            })
+            try:
+                # Another process may have upgraded the schema in the
+                # meantime.
+                missing_tables, missing_columns = \
+                    _find_missing_experiment_db_objects(connection, schema_name)
+                experiment_specific_metadata = sqlalchemy.MetaData(
+                    schema=schema_name
+                )
+                for name, table in ExperimentModel.metadata.tables.iteritems():
+                    table.tometadata(experiment_specific_metadata)
+                for table in missing_tables:
+                    logger.info(
+                        'create table "%s" of schema "%s"', table, schema_name
+                    )
+                    experiment_specific_metadata.tables[
+                        '%s.%s' % (schema_name, table)
+                    ].create(connection)
+                for table, column, definition in missing_columns:
+                    logger.info(
+                        'add column "%s" to table "%s" of schema "%s"',
+                        column, table, schema_name
+                    )
+                    connection.execute('''
+                        ALTER TABLE {schema}.{table}
+                        ADD COLUMN IF NOT EXISTS {column} {definition};
+                    '''.format(
+                        schema=schema_name, table=table, column=column,
+                        definition=definition
+                    ))
+            finally:
+                connection.execute('''
+                    SELECT pg_advisory_unlock(hashtext(%(schema)s));
+                ''', {
+                    'schema': schema_name
+                })
+    finally:
+        connection.close()
+    _UPGRADED_SCHEMAS.add(schema_name)
+
+
 # def _create_distributed_experiment_db_tables(connection, schema_name):
 #     logger.debug(
 #         'create distributed tables of models derived from %s for schema "%s"',
@@ -552,6 +682,35 @@ class _SQLAlchemy_Session(object):
         with connection.connection.cursor() as c:
             cls._bulk_ingest(c, instances)
 
+    def bulk_ingest_dataframe(self, model, data, **kwargs):
+        '''Ingests a table of values of a distributed model class in bulk
+        without creating an instance of the model class for each row.
+
+        Parameters
+        ----------
+        model: type
+            distributed model class that implements ``_bulk_ingest_dataframe``,
+            e.g. :class:`FeatureValues <tmlib.models.feature.FeatureValues>`
+        data: pandas.DataFrame
+            values that should be ingested
+        **kwargs: dict
+            additional model-specific arguments
+
+        See also
+        --------
+        :meth:`tmlib.models.feature.FeatureValues._bulk_ingest_dataframe`
+        '''
+        if data.empty:
+            return
+        if not issubclass(model, DistributedExperimentModel):
+            raise TypeError(
+                'Bulk ingestion is only supported for instances of type "%s"' %
+                DistributedExperimentModel.__name__
+            )
+        connection = self._session.get_bind()
+        with connection.connection.cursor() as c:
+            model._bulk_ingest_dataframe(c, data, **kwargs)
+
     def add(self, instance):
         '''Adds an instance of a model class.
 
@@ -728,6 +887,8 @@ class ExperimentSession(_Session):
         exists = _create_schema_if_not_exists(connection, self._schema)
         if not exists:
             _create_experiment_db_tables(connection, self._schema)
+        else:
+            _upgrade_experiment_db_tables(self._engine, self._schema)
         if not self._transaction:
             connection = connection.execution_options(
                 autocommit=True, isolation_level='AUTOCOMMIT'
@@ -871,6 +1032,8 @@ class ExperimentConnection(_Connection):
         exists = _create_schema_if_not_exists(self._connection, self._schema)
         if not exists:
             _create_experiment_db_tables(self._connection, self._schema)
+        else:
+            _upgrade_experiment_db_tables(self._engine, self._schema)
         _set_search_path(self._connection, self._schema)
         self._cursor = self._connection.cursor(cursor_factory=NamedTupleCursor)
         # NOTE: To achieve high throughput on UPDATE or DELETE, we
@@ -919,6 +1082,44 @@ class ExperimentConnection(_Connection):
         node, port = self._cursor.fetchone()
         return (node, port, shard_id)
 
+    def locate_partitions(self, model, partition_keys):
+        '''Determines the locations of several table partitions (shards)
+        with a single query.
+
+        Parameters
+        ----------
+        model: class
+            class derived from
+            :class:`ExperimentModel <tmlib.models.base.ExperimentModel>`
+        partition_keys: List[int]
+            values of the distribution column
+
+        Returns
+        -------
+        List[Tuple[Union[int, str]]]
+            partition key, host and port of the worker server and the ID of
+            the shard for each of the distinct `partition_keys`
+
+        See also
+        --------
+        :meth:`tmlib.models.utils.ExperimentConnection.locate_partition`
+        '''
+        self._cursor.execute('''
+            SELECT p.partition_key, s.nodename, s.nodeport, s.shardid
+            FROM (
+                SELECT DISTINCT unnest(%(partition_keys)s::integer[])
+                AS partition_key
+            ) AS p
+            JOIN pg_dist_shard_placement AS s
+            ON s.shardid = get_shard_id_for_distribution_column(
+                %(table)s, p.partition_key
+            )
+        ''', {
+            'table': model.__table__.name,
+            'partition_keys': list(partition_keys)
+        })
+        return [tuple(r) for r in self._cursor.fetchall()]
+
     def get_unique_ids(self, model, n):
         '''Gets a unique, but shard-specific value for the distribution column.
 
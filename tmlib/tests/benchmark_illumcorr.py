@@ -0,0 +1,71 @@
+'''Compares the runtime of illumination correction with the fused kernel of
+:class:`ChannelImage <tmlib.image.ChannelImage>` to the float64
+implementation it replaced.
+
+Usage::
+
+    python benchmark_illumcorr.py [--size 2160 2560] [--repeat 10]
+'''
+import timeit
+import argparse
+import numpy as np
+
+from tmlib.image import ChannelImage
+
+
+def correct_illumination_reference(img, mean, std):
+    img_type = img.dtype
+    img = img.astype(np.float64)
+    img[img == 0] = 10**-10
+    img = np.log10(img)
+    img[img == 0] = 0
+    img = (img - mean) / std
+    img = (img * np.mean(std)) + np.mean(mean)
+    img = 10 ** img
+    return img.astype(img_type)
+
+
+def correct_and_scale_reference(img, mean, std, lower, upper):
+    img = correct_illumination_reference(img, mean, std)
+    img = np.clip(img, lower, upper)
+    return ChannelImage._map_to_uint8(img, lower, upper)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', nargs=2, type=int, default=[2160, 2560])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    shape = tuple(args.size)
+    img = np.random.randint(0, 4000, shape).astype(np.uint16)
+    mean = np.random.normal(2.5, 0.1, shape)
+    std = np.random.normal(0.2, 0.01, shape)
+    scale, offset = ChannelImage._compute_correction_terms(mean, std)
+
+    cases = [
+        ('correct (reference)',
+            lambda: correct_illumination_reference(img, mean, std)),
+        ('correct (fused)',
+            lambda: ChannelImage._apply_correction_terms(img, scale, offset)),
+        ('correct + clip + scale (reference)',
+            lambda: correct_and_scale_reference(img, mean, std, 100, 3000)),
+        ('correct + clip + scale (fused)',
+            lambda: ChannelImage._apply_correction_terms(
+                img, scale, offset, lower=100, upper=3000
+            )),
+    ]
+    for name, func in cases:
+        t = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print '%-40s %8.1f ms' % (name, t * 1000)
+
+    expected = correct_illumination_reference(img, mean, std).astype(int)
+    actual = ChannelImage._apply_correction_terms(img, scale, offset)
+    diff = np.abs(actual.astype(int) - expected)
+    print 'max. absolute difference: %d (%.4f%% of pixels differ)' % (
+        diff.max(), 100.0 * np.mean(diff > 0)
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''Compares the runtime of polygon extraction for all objects of a
+:class:`SegmentationImage <tmlib.image.SegmentationImage>` with the
+extraction for each object individually.
+
+Usage::
+
+    python benchmark_polygons.py [--size 2160 2560] [--objects 5000] [--repeat 3]
+'''
+import timeit
+import argparse
+import numpy as np
+import mahotas as mh
+import scipy.ndimage as ndi
+
+from tmlib.image import SegmentationImage
+
+
+def create_label_image(shape, n):
+    # Nuclei-like objects: Voronoi regions of random seeds within a
+    # limited distance, such that neighbouring objects may touch
+    markers = np.zeros(shape, dtype=np.int32)
+    y = np.random.randint(0, shape[0], n)
+    x = np.random.randint(0, shape[1], n)
+    markers[y, x] = np.arange(1, n + 1)
+    distances, (iy, ix) = ndi.distance_transform_edt(
+        markers == 0, return_indices=True
+    )
+    array = markers[iy, ix]
+    array[distances > 10] = 0
+    return array.astype(np.int32)
+
+
+def extract_polygons_per_label(image, y_offset, x_offset):
+    plane = image.array.copy()
+    plane[0, :] = 0
+    plane[-1, :] = 0
+    plane[:, 0] = 0
+    plane[:, -1] = 0
+    bboxes = mh.labeled.bbox(image.array)
+    return [
+        (label, image._extract_polygon(plane, label, bboxes[label], y_offset, x_offset))
+        for label in np.unique(plane[plane > 0])
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', nargs=2, type=int, default=[2160, 2560])
+    parser.add_argument('--objects', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    image = SegmentationImage(create_label_image(tuple(args.size), args.objects))
+    cases = [
+        ('per label',
+            lambda: extract_polygons_per_label(image, 0, 0)),
+        ('whole image',
+            lambda: list(image.extract_polygons(0, 0))),
+    ]
+    for name, func in cases:
+        t = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print '%-40s %8.1f ms' % (name, t * 1000)
+
+    actual = list(image.extract_polygons(0, 0))
+    expected = extract_polygons_per_label(image, 0, 0)
+    n_diff = sum(
+        not np.array_equal(
+            np.array(p.exterior.coords), np.array(q.exterior.coords)
+        )
+        for (_, p), (_, q) in zip(actual, expected)
+    )
+    print 'objects: %d, differing polygons: %d' % (len(actual), n_diff)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import numpy as np
+
+from tmlib.models.feature import FeatureStatistics
+
+
+def test_summarize():
+    values = np.array([0.0, 1.0, 2.0, -4.0, np.nan, np.inf])
+    summary = FeatureStatistics.summarize(values)
+    assert summary['count'] == 4
+    assert summary['nan_count'] == 2
+    assert summary['minimum'] == -4.0
+    assert summary['maximum'] == 2.0
+    assert summary['mean'] == -0.25
+    assert sum(summary['histogram']) == 4
+    assert summary['histogram_bins'] == sorted(summary['histogram_bins'])
+    assert summary['histogram_bins'][0] < 0
+    assert 0 in summary['histogram_bins']
+
+
+def test_summarize_missing_values():
+    summary = FeatureStatistics.summarize(np.array([np.nan]))
+    assert summary['count'] == 0
+    assert summary['nan_count'] == 1
+    assert summary['minimum'] is None
+    assert summary['histogram_bins'] == []
+    assert summary['histogram'] == []
+
+
+def test_digitize_and_get_bin_edges():
+    values = np.array([-1e70, -3.7, -1e-3, 0.0, 1e-3, 1.0, 3.7, 1e5])
+    bins = FeatureStatistics.digitize(values)
+    lower, upper = FeatureStatistics.get_bin_edges(bins)
+    assert bins[3] == 0
+    assert np.all(np.sign(bins) == np.sign(values))
+    inside = np.abs(values) < 1e10
+    assert np.all(lower[inside] <= values[inside])
+    assert np.all(values[inside] <= upper[inside])
+    # Values beyond the range are assigned to the outermost bin.
+    assert bins[0] == FeatureStatistics.digitize([-1e100])[0]
+
+
+def test_merge_many_times_is_exact():
+    values = np.random.RandomState(0).lognormal(3, 2, size=10000)
+    values[::3] *= -1
+    values[::100] = np.nan
+    expected = FeatureStatistics.summarize(values)
+    # Summaries are merged sequentially, like sites of a job, and the
+    # summaries of several jobs are merged afterwards.
+    jobs = list()
+    for job_values in np.array_split(values, 7):
+        summary = FeatureStatistics.summarize(job_values[:10])
+        for site_values in np.array_split(job_values[10:], 50):
+            summary = FeatureStatistics.merge([
+                summary, FeatureStatistics.summarize(site_values)
+            ])
+        jobs.append(summary)
+    merged = FeatureStatistics.merge(jobs)
+    assert merged['count'] == expected['count']
+    assert merged['nan_count'] == expected['nan_count']
+    assert merged['minimum'] == expected['minimum']
+    assert merged['maximum'] == expected['maximum']
+    assert np.isclose(merged['mean'], expected['mean'])
+    assert merged['histogram_bins'] == expected['histogram_bins']
+    assert merged['histogram'] == expected['histogram']
+
+
+def test_merge_empty():
+    merged = FeatureStatistics.merge([
+        FeatureStatistics.summarize(np.array([np.nan]))
+    ])
+    assert merged['count'] == 0
+    assert merged['nan_count'] == 1
+    assert merged['histogram'] == []
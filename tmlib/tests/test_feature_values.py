@@ -0,0 +1,53 @@
+import numpy as np
+
+from tmlib.models.feature import FeatureValues
+
+
+def _encode(values):
+    # Binary representation of values as returned by "float4send()"
+    return buffer(np.asarray(values, dtype=np.float32).astype('>f4').tobytes())
+
+
+def test_build_array_values_sql():
+    sql = FeatureValues.build_array_values_sql([0, 2], alias='v')
+    assert sql == (
+        "coalesce(float4send(v.array_values[1]), '\\x7fc00000'::bytea) || "
+        "coalesce(float4send(v.array_values[3]), '\\x7fc00000'::bytea)"
+    )
+
+
+def test_decode_array_values():
+    values = FeatureValues.decode_array_values(
+        [_encode([1, 2.5]), _encode([np.nan, -3])], 2
+    )
+    assert values.shape == (2, 2)
+    assert values[0, 1] == 2.5
+    assert np.isnan(values[1, 0])
+    assert values[1, 1] == -3
+
+
+def test_decode_array_values_missing():
+    # Missing values are selected as the binary representation of NaN.
+    missing = buffer(b'\x7f\xc0\x00\x00')
+    values = FeatureValues.decode_array_values([missing], 1)
+    assert np.isnan(values[0, 0])
+
+
+def test_decode_array_values_round_trip():
+    stored = np.random.RandomState(0).normal(1000, 300, (50, 7)).\
+        astype(np.float32)
+    stored[3, 4] = 1.2345678e-20
+    values = FeatureValues.decode_array_values(
+        [_encode(row) for row in stored], stored.shape[1]
+    )
+    assert values.dtype == np.float64
+    assert np.array_equal(values, stored)
+    values = FeatureValues.decode_array_values(
+        [_encode(row) for row in stored], stored.shape[1], dtype=np.float32
+    )
+    assert np.array_equal(values, stored)
+
+
+def test_decode_array_values_empty():
+    values = FeatureValues.decode_array_values([], 3)
+    assert values.shape == (0, 3)
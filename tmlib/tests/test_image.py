@@ -0,0 +1,130 @@
+import numpy as np
+import mahotas as mh
+
+from tmlib.image import ChannelImage
+from tmlib.image import SegmentationImage
+from tmlib.image import IllumstatsImage
+from tmlib.image import IllumstatsContainer
+from tmlib.metadata import ChannelImageMetadata
+from tmlib.metadata import IllumstatsImageMetadata
+
+
+def correct_illumination_reference(img, mean, std):
+    # Float64 implementation the fused kernel is compared against
+    img_type = img.dtype
+    img = img.astype(np.float64)
+    img[img == 0] = 10**-10
+    img = np.log10(img)
+    img = (img - mean) / std
+    img = (img * np.mean(std)) + np.mean(mean)
+    img = 10 ** img
+    return img.astype(img_type)
+
+
+def create_stats(shape, channel_id=1):
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    mean = 2.5 + 0.3 * np.sin(y / 50.0) * np.cos(x / 70.0)
+    std = 0.2 + 0.02 * np.cos(y / 30.0)
+    metadata = IllumstatsImageMetadata(channel_id)
+    return IllumstatsContainer(
+        IllumstatsImage(mean, metadata), IllumstatsImage(std, metadata), {}
+    )
+
+
+def create_image(shape, channel_id=1):
+    array = np.random.randint(0, 3000, shape).astype(np.uint16)
+    metadata = ChannelImageMetadata(
+        channel_id=channel_id, site_id=1, cycle_id=1,
+        tpoint=0, zplane=0
+    )
+    return ChannelImage(array, metadata)
+
+
+def test_correct_matches_reference():
+    stats = create_stats((200, 300))
+    img = create_image((200, 300))
+    expected = correct_illumination_reference(
+        img.array, stats.mean.array, stats.std.array
+    )
+    corrected = img.correct(stats, inplace=False)
+    diff = np.abs(corrected.array.astype(int) - expected.astype(int))
+    assert corrected.array.dtype == np.uint16
+    assert diff.max() <= 1
+    assert np.mean(diff > 0) < 0.01
+
+
+def test_correct_and_scale_matches_consecutive_steps():
+    stats = create_stats((200, 300))
+    img = create_image((200, 300))
+    expected = img.correct(stats, inplace=False)
+    expected = expected.clip(100, 2000).scale(100, 2000)
+    scaled = img.correct_and_scale(stats, 100, 2000, inplace=False)
+    diff = np.abs(scaled.array.astype(int) - expected.array.astype(int))
+    assert scaled.array.dtype == np.uint8
+    assert diff.max() <= 1
+    assert scaled.metadata.is_rescaled
+
+
+def create_label_image(shape, n, seed=0):
+    # Randomly placed disks that may overlap and thus touch each other
+    rs = np.random.RandomState(seed)
+    array = np.zeros(shape, dtype=np.int32)
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    for label in range(1, n + 1):
+        cy, cx = rs.randint(0, shape[0]), rs.randint(0, shape[1])
+        radius = rs.randint(2, 12)
+        array[(y - cy)**2 + (x - cx)**2 <= radius**2] = label
+    # Object with a hole, an object consisting of a single pixel and a thin
+    # object that vanishes upon opening
+    array[10:30, 10:30] = n + 1
+    array[15:25, 15:25] = 0
+    array[40, 40] = n + 2
+    array[50, 5:25] = n + 3
+    return array
+
+
+def extract_polygons_per_label(image, y_offset, x_offset):
+    plane = image.array.copy()
+    plane[0, :] = 0
+    plane[-1, :] = 0
+    plane[:, 0] = 0
+    plane[:, -1] = 0
+    bboxes = mh.labeled.bbox(image.array)
+    for label in np.unique(plane[plane > 0]):
+        yield (
+            int(label),
+            image._extract_polygon(plane, label, bboxes[label], y_offset, x_offset)
+        )
+
+
+def test_extract_polygons_matches_per_label_extraction():
+    image = SegmentationImage(create_label_image((300, 400), 300))
+    polygons = list(image.extract_polygons(100, 200))
+    expected = list(extract_polygons_per_label(image, 100, 200))
+    assert [p[0] for p in polygons] == [p[0] for p in expected]
+    for (label, poly), (_, expected_poly) in zip(polygons, expected):
+        assert poly.is_valid
+        assert np.array_equal(
+            np.array(poly.exterior.coords),
+            np.array(expected_poly.exterior.coords)
+        )
+        assert len(poly.interiors) == len(expected_poly.interiors)
+
+
+def test_open_labels_matches_opening_per_label():
+    plane = create_label_image((100, 120), 60, seed=1)
+    plane[0, :] = 0
+    plane[-1, :] = 0
+    plane[:, 0] = 0
+    plane[:, -1] = 0
+    opened = SegmentationImage._open_labels(plane)
+    for label in np.unique(plane[plane > 0]):
+        mask = plane == label
+        if np.sum(mask) > 1:
+            mask = mh.open(mask)
+        assert np.array_equal(opened == label, mask)
+
+
+def test_extract_polygons_of_empty_image():
+    image = SegmentationImage(np.zeros((10, 10), dtype=np.int32))
+    assert list(image.extract_polygons(0, 0)) == []
@@ -0,0 +1,27 @@
+from struct import pack
+import numpy as np
+
+from tmlib.models.result import LabelValues
+
+
+def test_encode_binary_copy():
+    partition_keys = np.array([1, 2, 2])
+    mapobject_ids = np.array([10, 2**40, 12])
+    tpoints = np.array([0, 0, 3])
+    values = np.round(np.array([1.0, 1 / 3.0, 25.5]), 6).astype(np.string_)
+    encoded = b''.join(LabelValues._encode_binary_copy(
+        partition_keys, mapobject_ids, tpoints, values
+    ))
+    expected = b'PGCOPY\n\xff\r\n\x00' + pack('!ii', 0, 0)
+    for k, m, t, v in zip(partition_keys, mapobject_ids, tpoints, values):
+        expected += pack('!hiiiqiii', 4, 4, k, 8, m, 4, t, len(v)) + v
+    expected += pack('!h', -1)
+    assert encoded == expected
+
+
+def test_encode_binary_copy_empty():
+    empty = np.array([], dtype=int)
+    encoded = b''.join(LabelValues._encode_binary_copy(
+        empty, empty, empty, np.array([], dtype=np.string_)
+    ))
+    assert encoded == b'PGCOPY\n\xff\r\n\x00' + pack('!iih', 0, 0, -1)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from tmlib.models.sampling import _allocate, _select, _select_from_pool
+from tmlib.models.sampling import _build_shard_sample_sql
+
+
+def test_allocate():
+    sizes = _allocate(np.array([50, 30, 20]), 7)
+    assert sizes.tolist() == [4, 2, 1]
+    assert _allocate(np.array([1, 1, 1]), 2).tolist() == [1, 1, 0]
+
+
+def test_select_is_deterministic():
+    ids = np.arange(1000, dtype=np.int64)
+    shuffled = np.random.RandomState(1).permutation(ids)
+    sample = _select(ids, None, 10, seed=3)
+    assert len(sample) == 10
+    assert np.all(np.diff(sample) > 0)
+    assert sample.tolist() == _select(shuffled, None, 10, seed=3).tolist()
+    assert sample.tolist() != _select(ids, None, 10, seed=4).tolist()
+
+
+def test_select_stratified():
+    ids = np.arange(100, dtype=np.int64)
+    strata = np.repeat([1, 2], [80, 20])
+    sample = _select(ids, strata, 10, seed=0)
+    assert np.sum(sample < 80) == 8
+    assert np.sum(sample >= 80) == 2
+
+
+def test_select_from_pool():
+    rows = [(1, 10), (2, 10), (3, 11), (4, 12)]
+    wells = {10: 1, 11: 2, 12: 2}
+    assert _select_from_pool(rows, None, 10, seed=0) == [1, 2, 3, 4]
+    sample = _select_from_pool(rows, wells, 2, seed=0)
+    assert len([i for i in sample if i <= 2]) == 1
+
+
+def test_build_shard_sample_sql():
+    sql = _build_shard_sample_sql(
+        'mapobjects', 102008, 'partition_key', ['mapobject_type_id'], 'system'
+    )
+    assert sql == (
+        'SELECT id, partition_key FROM mapobjects_102008 '
+        'TABLESAMPLE SYSTEM (%(percentage)s) REPEATABLE (%(seed)s) '
+        'WHERE mapobject_type_id = %(mapobject_type_id)s'
+    )
+
+
+def test_build_shard_sample_sql_priority():
+    sql = _build_shard_sample_sql('mapobjects', 102008, None, [], 'priority')
+    assert sql == (
+        'SELECT id FROM mapobjects_102008 '
+        'ORDER BY md5(id::text || %(priority_seed)s) LIMIT %(size)s'
+    )
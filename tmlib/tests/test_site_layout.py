@@ -0,0 +1,140 @@
+import itertools
+
+from tmlib.models.channel import build_site_layout
+
+
+SITE_HEIGHT = 10
+SITE_WIDTH = 12
+VERTICAL_DISPLACEMENT = 2
+HORIZONTAL_DISPLACEMENT = 3
+WELL_SPACER_SIZE = 5
+# Wells are identified by their ID and positioned by their *y*, *x*
+# coordinate within the plate. Row 1 of the plate is empty.
+WELLS = {1: (0, 0), 2: (0, 2), 3: (2, 0), 4: (2, 2)}
+# Wells may contain a different number of sites.
+WELL_DIMENSIONS = {1: (2, 3), 2: (2, 3), 3: (3, 2), 4: (1, 1)}
+
+
+def _create_sites():
+    sites = list()
+    site_id = 1
+    for well_id in sorted(WELLS):
+        rows, cols = WELL_DIMENSIONS[well_id]
+        for y, x in itertools.product(range(rows), range(cols)):
+            omitted = site_id == 5
+            # Every seventh site is missing an image file.
+            file_id = None if site_id % 7 == 0 else site_id + 100
+            sites.append((
+                site_id, well_id, y, x, SITE_HEIGHT, SITE_WIDTH, omitted,
+                file_id
+            ))
+            site_id += 1
+    return sites
+
+
+def _calculate_well_offset(well_id):
+    # Reproduces Well.offset for a single plate located at the origin.
+    nonempty_rows = sorted({w[0] for w in WELLS.values()})
+    nonempty_columns = sorted({w[1] for w in WELLS.values()})
+    rows = max(d[0] for d in WELL_DIMENSIONS.values())
+    cols = max(d[1] for d in WELL_DIMENSIONS.values())
+    well_height = rows * SITE_HEIGHT + (rows - 1) * VERTICAL_DISPLACEMENT
+    well_width = cols * SITE_WIDTH + (cols - 1) * HORIZONTAL_DISPLACEMENT
+    n_rows = nonempty_rows.index(WELLS[well_id][0])
+    n_columns = nonempty_columns.index(WELLS[well_id][1])
+    return (
+        n_rows * well_height + n_rows * WELL_SPACER_SIZE,
+        n_columns * well_width + n_columns * WELL_SPACER_SIZE
+    )
+
+
+def _calculate_site_offset(site):
+    # Reproduces Site.offset.
+    site_id, well_id, y, x, height, width = site[:6]
+    well_offset = _calculate_well_offset(well_id)
+    return (
+        y * height + y * VERTICAL_DISPLACEMENT + well_offset[0],
+        x * width + x * HORIZONTAL_DISPLACEMENT + well_offset[1]
+    )
+
+
+def _find_neighbour(sites, site, dy, dx):
+    for s in sites:
+        if s[1] == site[1] and s[2] == site[2] + dy and s[3] == site[3] + dx:
+            return s[0]
+    return -1
+
+
+def _build_layout():
+    sites = _create_sites()
+    wells = [(i, ) + _calculate_well_offset(i) for i in WELLS]
+    layout = build_site_layout(
+        sites, wells, VERTICAL_DISPLACEMENT, HORIZONTAL_DISPLACEMENT
+    )
+    return sites, layout
+
+
+def test_build_site_layout_offsets():
+    sites, layout = _build_layout()
+    assert sorted(layout.index) == [s[0] for s in sites]
+    for site in sites:
+        record = layout.loc[site[0]]
+        expected = _calculate_site_offset(site)
+        assert (record.y_offset, record.x_offset) == expected
+
+
+def test_build_site_layout_well_spacers():
+    sites, layout = _build_layout()
+    # The first site of a well starts after the widest well and the spacer,
+    # independent of the number of sites in the well.
+    first = layout[(layout.y == 0) & (layout.x == 0)]
+    well_height = 3 * SITE_HEIGHT + 2 * VERTICAL_DISPLACEMENT
+    well_width = 3 * SITE_WIDTH + 2 * HORIZONTAL_DISPLACEMENT
+    offsets = dict(zip(first.well_id, zip(first.y_offset, first.x_offset)))
+    assert offsets[1] == (0, 0)
+    assert offsets[2] == (0, well_width + WELL_SPACER_SIZE)
+    # The empty row of the plate doesn't take up any space.
+    assert offsets[3] == (well_height + WELL_SPACER_SIZE, 0)
+    assert offsets[4] == (
+        well_height + WELL_SPACER_SIZE, well_width + WELL_SPACER_SIZE
+    )
+
+
+def test_build_site_layout_neighbours():
+    sites, layout = _build_layout()
+    neighbours = {
+        'upper_site_id': (-1, 0), 'lower_site_id': (1, 0),
+        'left_site_id': (0, -1), 'right_site_id': (0, 1),
+        'upper_left_site_id': (-1, -1)
+    }
+    for site in sites:
+        record = layout.loc[site[0]]
+        for name, (dy, dx) in neighbours.iteritems():
+            assert record[name] == _find_neighbour(sites, site, dy, dx)
+
+
+def test_build_site_layout_edges():
+    sites, layout = _build_layout()
+    # Sites at the edges of a well don't have neighbours in adjacent wells.
+    assert layout.loc[3].right_site_id == -1
+    assert layout.loc[7].left_site_id == -1
+    assert layout.loc[4].lower_site_id == -1
+    # A well with a single site doesn't have any neighbours at all.
+    single = layout[layout.well_id == 4].iloc[0]
+    assert single.upper_site_id == -1
+    assert single.lower_site_id == -1
+    assert single.left_site_id == -1
+    assert single.right_site_id == -1
+    assert single.upper_left_site_id == -1
+    assert single.well_rows == 1
+    assert single.well_columns == 1
+
+
+def test_build_site_layout_files():
+    sites, layout = _build_layout()
+    assert layout.loc[7].file_id == -1
+    assert layout.loc[8].file_id == 108
+    assert layout.loc[5].omitted
+    assert not layout.loc[6].omitted
+    assert list(layout.loc[layout.well_id == 3].well_rows.unique()) == [3]
+    assert list(layout.loc[layout.well_id == 3].well_columns.unique()) == [2]
@@ -22,12 +22,14 @@ import simplejson
 import numpy as np
 import pandas as pd
 import collections
+import functools
+from multiprocessing.pool import ThreadPool
 from abc import ABCMeta
 from abc import abstractmethod
 from abc import abstractproperty
-from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import FLOAT
-from psycopg2.extras import execute_values
+import sqlalchemy.exc
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import FLOAT, REAL
 from psycopg2.sql import SQL, Identifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import SGDClassifier
@@ -39,10 +41,11 @@ from sklearn.cluster import KMeans
 
 from tmlib import cfg
 import tmlib.models as tm
+from tmlib.models.sampling import sample_distributed_ids
 from tmlib.config import DEFAULT_LIB, IMPLEMENTED_LIBS
+from tmlib.tools.pipeline import PredictionPipeline, QUEUE_DEPTH
 from tmlib.utils import (
-    same_docstring_as, autocreate_directory_property, assert_type,
-    create_partitions
+    same_docstring_as, autocreate_directory_property, assert_type
 )
 
 logger = logging.getLogger(__name__)
@@ -103,9 +106,15 @@ class Tool(object):
             ID of the experiment for which the tool request is made
         '''
         self.experiment_id = experiment_id
+        #: int: number of processes that should be used for computations
+        #: on batches of mapobjects
+        self.n_workers = 1
+        #: int: maximal number of batches of mapobjects waiting between
+        #: stages of a :class:`PredictionPipeline <tmlib.tools.pipeline.PredictionPipeline>`
+        self.queue_depth = QUEUE_DEPTH
 
     def load_feature_values(self, mapobject_type_name, feature_names,
-            mapobject_ids=None):
+            mapobject_ids=None, mapobject_id_range=None):
         '''Loads values for each given feature of the given mapobject type.
 
         Parameters
@@ -120,6 +129,10 @@ class Tool(object):
             ID of each :class:`Mapobject <tmlib.models.mapobject.Mapobject>`
             for which values should be selected; if ``None`` values for
             all objects will be loaded (default: ``None``)
+        mapobject_id_range: Tuple[int], optional
+            lowest and highest ID of mapobjects for which values should be
+            selected (inclusive), as generated by :meth:`partition_mapobjects`
+            (default: ``None``)
 
         Returns
         -------
@@ -135,12 +148,20 @@ class Tool(object):
         )
         if mapobject_ids is not None:
             logger.debug('load values for %d objects', len(mapobject_ids))
+        elif mapobject_id_range is not None:
+            logger.debug(
+                'load values for objects with IDs %d to %d',
+                *mapobject_id_range
+            )
         else:
             logger.debug('load values for all objects')
         # FIXME: Use ExperimentSession
         with tm.utils.ExperimentConnection(self.experiment_id) as conn:
             conn.execute('''
-                SELECT t.id AS mapobject_type_id, f.id AS feature_id, f.name
+                SELECT
+                    t.id AS mapobject_type_id,
+                    t.array_feature_values,
+                    f.id AS feature_id, f.name, f.array_index
                 FROM features AS f
                 JOIN mapobject_types AS t ON t.id = f.mapobject_type_id
                 WHERE f.name = ANY(%(feature_names)s)
@@ -151,39 +172,68 @@ class Tool(object):
             })
             records = conn.fetchall()
             mapobject_type_id = records[0].mapobject_type_id
-            feature_map = {str(r.feature_id): r.name for r in records}
+            array_feature_values = records[0].array_feature_values
+            if array_feature_values:
+                features = sorted(records, key=lambda r: r.array_index)
+                values_sql = tm.FeatureValues.build_array_values_sql(
+                    [r.array_index for r in features], alias='v'
+                )
+            else:
+                feature_map = {str(r.feature_id): r.name for r in records}
+                values_sql = 'slice(v.values, %(feature_ids)s)'
             sql = '''
                 SELECT
                     v.mapobject_id, v.tpoint,
-                    slice(v.values, %(feature_ids)s) AS values
+                    {values} AS values
                 FROM feature_values AS v
                 JOIN mapobjects AS m
                 ON m.id = v.mapobject_id AND m.partition_key = v.partition_key
                 WHERE m.mapobject_type_id = %(mapobject_type_id)s
-            '''
+            '''.format(values=values_sql)
             if mapobject_ids is not None:
                 sql += '''
                 AND m.id = ANY(%(mapobject_ids)s)
                 '''
+            if mapobject_id_range is not None:
+                # Range predicates keep the size of the statement constant
+                # and allow index range scans on both tables.
+                sql += '''
+                AND m.id BETWEEN %(lower_id)s AND %(upper_id)s
+                AND v.mapobject_id BETWEEN %(lower_id)s AND %(upper_id)s
+                '''
+                lower_id, upper_id = mapobject_id_range
+            else:
+                lower_id, upper_id = None, None
             conn.execute(sql, {
-                'feature_ids': feature_map.keys(),
+                'feature_ids': [str(r.feature_id) for r in records],
                 'mapobject_type_id': mapobject_type_id,
-                'mapobject_ids': mapobject_ids
+                'mapobject_ids': mapobject_ids,
+                'lower_id': lower_id,
+                'upper_id': upper_id
             })
             records = conn.fetchall()
-            values = list()
-            index = list()
-            for r in records:
-                values.append(r.values)
-                index.append((r.mapobject_id, r.tpoint))
             index = pd.MultiIndex.from_tuples(
-                index, names=['mapobject_id', 'tpoint']
+                [(r.mapobject_id, r.tpoint) for r in records],
+                names=['mapobject_id', 'tpoint']
             )
+            if array_feature_values:
+                # Values are decoded straight into an array rather than
+                # parsing each value individually.
+                values = tm.FeatureValues.decode_array_values(
+                    [r.values for r in records], len(features)
+                )
+            else:
+                values = [r.values for r in records]
 
-        # TODO: This probably creates a copy in memory. Can we avoid this?
-        df = pd.DataFrame(values, index=index).astype(float)
-        column_map = {i: name for i, name in feature_map.iteritems()}
-        df.rename(columns=column_map, inplace=True)
+        if array_feature_values:
+            df = pd.DataFrame(
+                values, index=index, columns=[r.name for r in features]
+            )
+        else:
+            # TODO: This probably creates a copy in memory. Can we avoid this?
+            df = pd.DataFrame(values, index=index).astype(float)
+            column_map = {i: name for i, name in feature_map.iteritems()}
+            df.rename(columns=column_map, inplace=True)
 
         # TODO: How shall we deal with NaN values? Ideally we would expose
         # the option to users to either filter rows (mapobjects) or columns
@@ -212,39 +262,77 @@ class Tool(object):
         -------
         Tuple[float]
             min and max
+
+        Note
+        ----
+        Extrema are taken from
+        :class:`FeatureStatistics <tmlib.models.feature.FeatureStatistics>`
+        if available and only calculated from all feature values otherwise.
         '''
-        logger.info(
-            'calculate min/max for objects of type "%s" and feature "%s"',
-            mapobject_type_name, feature_name
-        )
         with tm.utils.ExperimentSession(self.experiment_id) as session:
             mapobject_type = session.query(tm.MapobjectType.id).\
                 filter_by(name=mapobject_type_name).\
                 one()
-            feature = session.query(tm.Feature.id).\
+            feature = session.query(tm.Feature.id, tm.Feature.array_index).\
                 filter_by(
                     name=feature_name, mapobject_type_id=mapobject_type.id
                 ).\
                 one()
 
-            lower, upper = session.query(
-                    func.min(
-                        tm.FeatureValues.values[str(feature.id)].cast(FLOAT)
-                    ),
-                    func.max(
-                        tm.FeatureValues.values[str(feature.id)].cast(FLOAT)
-                    )
-                ).\
+            try:
+                # Failure of the query must not abort the transaction.
+                with session.begin_nested():
+                    statistics = session.query(
+                            tm.FeatureStatistics.minimum,
+                            tm.FeatureStatistics.maximum
+                        ).\
+                        filter(
+                            tm.FeatureStatistics.feature_id == feature.id,
+                            tm.FeatureStatistics.job_id == None
+                        ).\
+                        all()
+            except sqlalchemy.exc.ProgrammingError as error:
+                logger.warning(
+                    'feature statistics are not available: %s',
+                    str(error.orig).strip()
+                )
+                statistics = list()
+            if statistics:
+                logger.info(
+                    'get min/max for objects of type "%s" and feature "%s" '
+                    'from feature statistics', mapobject_type_name,
+                    feature_name
+                )
+                lower = [s.minimum for s in statistics if s.minimum is not None]
+                upper = [s.maximum for s in statistics if s.maximum is not None]
+                return (
+                    min(lower) if lower else None,
+                    max(upper) if upper else None
+                )
+
+            logger.info(
+                'calculate min/max for objects of type "%s" and feature "%s"',
+                mapobject_type_name, feature_name
+            )
+            if feature.array_index is not None:
+                value = tm.FeatureValues.array_values[feature.array_index + 1]
+                is_nan = value == literal('NaN').cast(REAL)
+            else:
+                value = tm.FeatureValues.values[str(feature.id)]
+                is_nan = value == 'nan'
+                value = value.cast(FLOAT)
+            lower, upper = session.query(func.min(value), func.max(value)).\
                 join(tm.Mapobject).\
                 filter(
                     tm.Mapobject.mapobject_type_id == mapobject_type.id,
-                    tm.FeatureValues.values[str(feature.id)] != 'nan'
+                    ~is_nan
                 ).\
                 one()
 
         return (lower, upper)
 
-    def get_random_mapobject_subset(self, mapobject_type_name, n):
+    def get_random_mapobject_subset(self, mapobject_type_name, n, seed=0,
+            method='bernoulli', stratify=False):
         '''Selects a random subset of mapobjects.
 
         Parameters
@@ -254,22 +342,34 @@ class Tool(object):
             :class:`MapobjectType <tmlib.models.mapobject.MapobjectType>`
         n: int
             number of mapobjects that should be selected at random
+        seed: int, optional
+            seed of the random number generator; the same mapobjects are
+            selected for the same seed (default: ``0``)
+        method: str, optional
+            ``"bernoulli"`` for row-level or ``"system"`` for block-level
+            sampling; block-level sampling is faster, but selects mapobjects
+            of few sites (default: ``"bernoulli"``)
+        stratify: bool, optional
+            whether each well should contribute mapobjects in proportion to
+            its number of mapobjects (default: ``False``)
 
         Returns
         -------
-        Tuple[int]
-            IDs of selected mapobject
+        List[int]
+            IDs of selected mapobjects
+
+        See also
+        --------
+        :func:`tmlib.models.sampling.sample_distributed_ids`
         '''
         with tm.utils.ExperimentSession(self.experiment_id) as session:
             mapobject_type = session.query(tm.MapobjectType.id).\
                 filter_by(name=mapobject_type_name).\
                 one()
-            mapobjects = session.query(tm.Mapobject.id).\
-                filter_by(mapobject_type_id=mapobject_type.id).\
-                order_by(func.random()).\
-                limit(n).\
-                all()
-            return [m.id for m in mapobjects]
+        return sample_distributed_ids(
+            self.experiment_id, tm.Mapobject, n, seed=seed, method=method,
+            stratify=stratify, mapobject_type_id=mapobject_type.id
+        )
 
     def partition_mapobjects(self, mapobject_type_name, n):
         '''Splits mapobjects into partitions of size `n`.
@@ -284,22 +384,41 @@ class Tool(object):
 
         Returns
         -------
-        List[List[int]]
-            mapobject IDs
+        Generator[Tuple[int]]
+            lowest and highest mapobject ID of each partition (inclusive)
 
         Note
         ----
-        Mapobjects are ordered by ID.
+        Mapobjects are ordered by ID. Partitions are determined lazily by
+        keyset pagination, i.e. each partition is selected starting from the
+        highest ID of the previous one, such that neither the IDs of all
+        mapobjects need to be held in memory nor an increasing number of
+        rows needs to be skipped.
         '''
         with tm.utils.ExperimentSession(self.experiment_id) as session:
             mapobject_type = session.query(tm.MapobjectType.id).\
                 filter_by(name=mapobject_type_name).\
                 one()
-            mapobjects = session.query(tm.Mapobject.id).\
-                filter_by(mapobject_type_id=mapobject_type.id).\
-                order_by(tm.Mapobject.id).\
-                all()
-            return create_partitions([m.id for m in mapobjects], n)
+        last_id = None
+        while True:
+            with tm.utils.ExperimentSession(self.experiment_id) as session:
+                query = session.query(tm.Mapobject.id).\
+                    filter_by(mapobject_type_id=mapobject_type.id)
+                if last_id is not None:
+                    query = query.filter(tm.Mapobject.id > last_id)
+                page = query.\
+                    order_by(tm.Mapobject.id).\
+                    limit(n).\
+                    subquery()
+                lower, upper = session.query(
+                        func.min(page.c.id), func.max(page.c.id)
+                    ).\
+                    one()
+            if lower is None:
+                return
+            logger.debug('partition mapobjects %d to %d', lower, upper)
+            yield (lower, upper)
+            last_id = upper
 
     def identify_features_with_null_values(self, feature_data):
         '''Identifies features with NULL values (including NaNs).
@@ -319,7 +438,8 @@ class Tool(object):
             null_indices.append((name, np.sum(values)))
         return null_indices
 
-    def save_result_values(self, mapobject_type_name, result_id, data):
+    def save_result_values(self, mapobject_type_name, result_id, data,
+            parallel=False):
         '''Saves generated label values.
 
         Parameters
@@ -332,14 +452,22 @@ class Tool(object):
             :class:`ToolResult <tmlib.models.result.ToolResult>`
         data: pandas.Series
             series with multi-level index for "mapobject_id" and "tpoint"
+        parallel: bool, optional
+            whether values should be written to different database worker
+            servers in parallel (default: ``False``)
+
+        Note
+        ----
+        Shard placements are resolved once and values are written with one
+        connection per database worker server.
 
         See also
         --------
         :class:`tmlib.models.result.LabelValues`
         '''
         logger.info('save label values for result %d', result_id)
-        mapobject_ids = data.index.levels[0].tolist()
-        tpoints = data.index.levels[1]
+        index_mapobject_ids = data.index.get_level_values(0).values
+        index_tpoints = data.index.get_level_values(1).values
         with tm.utils.ExperimentConnection(self.experiment_id) as connection:
             connection.execute('''
                 SELECT id FROM mapobject_types
@@ -357,57 +485,84 @@ class Tool(object):
                 GROUP BY partition_key
             ''', {
                 'mapobject_type_id': mapobject_type_id,
-                'mapobject_ids': mapobject_ids
+                'mapobject_ids': np.unique(index_mapobject_ids).tolist()
             })
             records = connection.fetchall()
+            if not records:
+                logger.warn('no mapobjects found for label values')
+                return
+            locations = connection.locate_partitions(
+                tm.LabelValues, [r.partition_key for r in records]
+            )
 
-        # Grouping mapobject IDs per partition_key allows us
-        # to target individual shards of the label_values table directly
-        # on the worker nodes with full SQL support, including multi-row
-        # insert/update statements.
-        for tpoint in tpoints:
-            for partition_key, mapobject_ids in records:
-                with tm.utils.ExperimentConnection(self.experiment_id) as conn:
-                    host, port, shard_id = conn.locate_partition(
-                        tm.LabelValues, partition_key
-                    )
-                worker_connection = tm.utils.ExperimentWorkerConnection(
-                    self.experiment_id, host, port
+        # Look up the partition key of each mapobject.
+        mapobject_ids = np.concatenate([
+            np.array(r.mapobject_ids, dtype=np.int64) for r in records
+        ])
+        partition_keys = np.repeat(
+            [r.partition_key for r in records],
+            [len(r.mapobject_ids) for r in records]
+        )
+        index = np.argsort(mapobject_ids)
+        mapobject_ids = mapobject_ids[index]
+        partition_keys = partition_keys[index]
+        index = np.searchsorted(mapobject_ids, index_mapobject_ids)
+        index[index == len(mapobject_ids)] = 0
+        is_found = mapobject_ids[index] == index_mapobject_ids
+        if not np.all(is_found):
+            logger.warn(
+                'skip %d label values of unknown mapobjects',
+                np.sum(~is_found)
+            )
+        index = index[is_found]
+        mapobject_ids = mapobject_ids[index]
+        partition_keys = partition_keys[index]
+        tpoints = index_tpoints[is_found]
+        values = np.round(data.values[is_found], 6).astype(np.string_)
+
+        # Group values per database worker server, such that each server
+        # receives all its values with a single COPY.
+        servers = collections.OrderedDict()
+        server_lut = dict()
+        for partition_key, host, port, shard_id in locations:
+            shards = servers.setdefault((host, port), dict())
+            shards.setdefault(shard_id, list()).append(partition_key)
+            server_lut[partition_key] = servers.keys().index((host, port))
+        keys = np.array(sorted(server_lut.keys()))
+        key_servers = np.array([server_lut[k] for k in keys])
+        value_servers = key_servers[np.searchsorted(keys, partition_keys)]
+        index = np.argsort(value_servers, kind='mergesort')
+        bounds = np.searchsorted(
+            value_servers[index], np.arange(len(servers) + 1)
+        )
+
+        def upsert(i):
+            (host, port), shards = servers.items()[i]
+            subset = index[bounds[i]:bounds[i+1]]
+            logger.debug(
+                'upsert %d label values on worker %s:%s',
+                len(subset), host, port
+            )
+            worker_connection = tm.utils.ExperimentWorkerConnection(
+                self.experiment_id, host, port
+            )
+            with worker_connection as connection:
+                tm.LabelValues._bulk_upsert_shards(
+                    connection, shards, result_id,
+                    partition_keys[subset], mapobject_ids[subset],
+                    tpoints[subset], values[subset]
                 )
-                with worker_connection as connection:
-                    logger.debug(
-                        'upsert label values for partition %d', partition_key
-                    )
-                    sql = '''
-                        INSERT INTO label_values_{shard} AS v (
-                            partition_key, mapobject_id, values, tpoint
-                        )
-                        VALUES %s
-                        ON CONFLICT ON CONSTRAINT label_values_pkey_{shard}
-                        DO UPDATE
-                        SET values = v.values || EXCLUDED.values
-                    '''.format(shard=shard_id)
-                    template = '''
-                        (
-                            %(partition_key)s, %(mapobject_id)s,
-                            %(values)s, %(tpoint)s
-                        )
-                    '''
-                    args = [
-                        {
-                            'values': {
-                                str(result_id):
-                                    str(np.round(data.ix[(mid, tpoint)], 6))
-                            },
-                            'mapobject_id': mid,
-                            'partition_key': partition_key,
-                            'tpoint': tpoint
-                        }
-                        for mid in mapobject_ids
-                    ]
-                    execute_values(
-                        connection, sql, args, template=template, page_size=500
-                    )
+
+        if parallel and len(servers) > 1:
+            pool = ThreadPool(min(len(servers), tm.utils.POOL_SIZE))
+            try:
+                pool.map(upsert, range(len(servers)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for i in range(len(servers)):
+                upsert(i)
 
     def register_result(self, submission_id, mapobject_type_name,
             result_type, **result_attributes):
@@ -489,6 +644,15 @@ class Tool(object):
         pass
 
 
+def _predict_labels(feature_data, model, scaler=None):
+    # Defined at module level, such that it can be called by worker processes.
+    X = feature_data
+    if scaler is not None:
+        X = scaler.transform(X)
+    predictions = model.predict(X)
+    return pd.Series(predictions, index=feature_data.index)
+
+
 class Classifier(Tool):
 
     '''Abstract base class for classification tools.'''
@@ -638,8 +802,49 @@ class Classifier(Tool):
             predicted labels for each mapobject
         '''
         logger.info('predict labels')
-        X = feature_data
-        if scaler is not None:
-            X = scaler.transform(X)
-        predictions = model.predict(X)
-        return pd.Series(predictions, index=feature_data.index)
+        return _predict_labels(feature_data, model, scaler)
+
+    def predict_and_save_result_values(self, mapobject_type_name,
+            feature_names, result_id, model, scaler=None, batch_size=10**5):
+        '''Predicts labels for all mapobjects of the given type and saves them.
+
+        Mapobjects are processed in batches, which are streamed through a
+        :class:`PredictionPipeline <tmlib.tools.pipeline.PredictionPipeline>`,
+        such that feature values of the next batch are loaded and labels of
+        the previous batch are saved while labels of the current batch are
+        predicted by :attr:`n_workers` processes.
+
+        Parameters
+        ----------
+        mapobject_type_name: str
+            name of the selected
+            :class:`MapobjectType <tmlib.models.mapobject.MapobjectType>`
+        feature_names: List[str]
+            names of features based on which labels should be predicted
+        result_id: int
+            ID of a registerd
+            :class:`ToolResult <tmlib.models.result.ToolResult>`
+        model: sklearn.base.BaseEstimator
+            model fitted on training data
+        scaler: sklearn.preprocessing.data.RobustScaler, optional
+            scaler fitted on training data
+        batch_size: int, optional
+            number of mapobjects per batch (default: ``10**5``)
+        '''
+        logger.debug('set batch size to %d', batch_size)
+        batches = self.partition_mapobjects(mapobject_type_name, batch_size)
+
+        def load(mapobject_id_range):
+            return self.load_feature_values(
+                mapobject_type_name, feature_names,
+                mapobject_id_range=mapobject_id_range
+            )
+
+        def save(labels):
+            self.save_result_values(mapobject_type_name, result_id, labels)
+
+        pipeline = PredictionPipeline(
+            load, functools.partial(_predict_labels, model=model, scaler=scaler),
+            save, n_workers=self.n_workers, queue_depth=self.queue_depth
+        )
+        pipeline.run(batches)
@@ -102,15 +102,6 @@ class Classification(Classifier):
             training_set, labels, method, n_fold_cv
         )
 
-        n_test = 10**5
-        logger.debug('set batch size to %d', n_test)
-        batches = self.partition_mapobjects(mapobject_type_name, n_test)
-        for i, mapobject_ids in enumerate(batches):
-            logger.info('predict labels for batch #%d', i)
-            test_set = self.load_feature_values(
-                mapobject_type_name, feature_names, mapobject_ids
-            )
-            predicted_labels = self.predict(test_set, model, scaler)
-            self.save_result_values(
-                mapobject_type_name, result_id, predicted_labels
-            )
+        self.predict_and_save_result_values(
+            mapobject_type_name, feature_names, result_id, model, scaler
+        )
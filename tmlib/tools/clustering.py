@@ -83,17 +83,6 @@ class Clustering(Classifier):
         )
         model, scaler = self.train_unsupervised(training_set, k, method)
 
-        n_test = 10**5
-        logger.debug('set batch size to %d', n_test)
-        batches = self.partition_mapobjects(mapobject_type_name, n_test)
-        counter = 0
-        for mapobject_ids in batches:
-            logger.info('predict labels for batch #%d', counter)
-            counter += 1
-            test_set = self.load_feature_values(
-                mapobject_type_name, feature_names, mapobject_ids
-            )
-            predicted_labels = self.predict(test_set, model, scaler)
-            self.save_result_values(
-                mapobject_type_name, result_id, predicted_labels
-            )
+        self.predict_and_save_result_values(
+            mapobject_type_name, feature_names, result_id, model, scaler
+        )
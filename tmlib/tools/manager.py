@@ -18,6 +18,7 @@ from tmlib.readers import JsonReader
 from tmlib.utils import autocreate_directory_property
 from tmlib.log import configure_logging, map_logging_verbosity
 from tmlib.tools import get_tool_class, get_available_tools
+from tmlib.tools.pipeline import QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
 
@@ -70,12 +71,13 @@ class ToolRequestManager(SubmissionManager):
         filename = '%s_%d.json' % (self.__class__.__name__, submission_id)
         return os.path.join(self._batches_location, filename)
 
-    def _build_command(self, submission_id):
+    def _build_command(self, submission_id, cores=1):
         command = [
             'tm_tool',
             str(self.experiment_id),
             '--name', self.tool_name,
-            '--submission_id', str(submission_id)
+            '--submission_id', str(submission_id),
+            '--workers', str(cores)
         ]
         command.extend(['-v' for x in range(self.verbosity)])
         logger.debug('submit tool request: %s', ' '.join(command))
@@ -153,7 +155,7 @@ class ToolRequestManager(SubmissionManager):
         logger.debug('allocated cores for job: %d', cores)
         job = ToolJob(
             tool_name=self.tool_name,
-            arguments=self._build_command(submission_id),
+            arguments=self._build_command(submission_id, cores),
             output_dir=self._log_location,
             submission_id=submission_id,
             user_name=user_name
@@ -261,6 +263,15 @@ class ToolRequestManager(SubmissionManager):
             '--submission_id', '-s', type=int, required=True,
             help='ID of the corresponding submission'
         )
+        parser.add_argument(
+            '--workers', dest='n_workers', type=int, default=1,
+            help='number of processes that should predict labels'
+        )
+        parser.add_argument(
+            '--queue-depth', dest='queue_depth', type=int,
+            default=QUEUE_DEPTH,
+            help='maximal number of batches waiting between stages'
+        )
         return parser
 
     @classmethod
@@ -304,6 +315,8 @@ class ToolRequestManager(SubmissionManager):
         payload = manager.get_payload(args.submission_id)
         tool_cls = get_tool_class(args.name)
         tool = tool_cls(args.experiment_id)
+        tool.n_workers = args.n_workers
+        tool.queue_depth = args.queue_depth
         tool.process_request(args.submission_id, payload)
 
         logger.info('done')
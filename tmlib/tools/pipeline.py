@@ -0,0 +1,232 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Streaming of batches of mapobjects through the stages of a tool.
+
+Feature values of the next batch are loaded while labels of the current batch
+are predicted and labels of the previous batch are saved. Stages are
+connected by bounded queues, such that only a limited number of batches is
+held in memory at any time.
+'''
+import sys
+import time
+import Queue
+import logging
+import threading
+import collections
+import multiprocessing
+import multiprocessing.pool
+
+logger = logging.getLogger(__name__)
+
+#: int: default maximal number of batches waiting between two stages
+QUEUE_DEPTH = 2
+
+
+def _call_timed(func, data):
+    start = time.time()
+    output = func(data)
+    return (output, time.time() - start)
+
+
+class PredictionPipeline(object):
+
+    '''Pipeline that loads feature values, predicts labels and saves them for
+    batches of mapobjects.
+
+    Loading and saving are performed by separate threads, since these stages
+    are bound by database I/O. Prediction is performed by a pool of
+    processes in case more than one worker is requested.
+
+    Examples
+    --------
+    >>> pipeline = PredictionPipeline(load, predict, save, n_workers=4)
+    >>> pipeline.run(batches)
+    '''
+
+    def __init__(self, load, predict, save, n_workers=1,
+            queue_depth=QUEUE_DEPTH):
+        '''
+        Parameters
+        ----------
+        load: function
+            function that loads feature values for a batch of mapobjects
+            and returns a :class:`pandas.DataFrame`
+        predict: function
+            function that predicts labels for feature values and
+            returns a :class:`pandas.Series`; must be picklable in case
+            `n_workers` is greater than one
+        save: function
+            function that saves predicted labels
+        n_workers: int, optional
+            number of processes that should predict labels (default: ``1``)
+        queue_depth: int, optional
+            maximal number of batches waiting between two stages
+            (default: :const:`QUEUE_DEPTH`)
+        '''
+        if n_workers < 1:
+            raise ValueError('Argument "n_workers" must be positive.')
+        if queue_depth < 1:
+            raise ValueError('Argument "queue_depth" must be positive.')
+        self.load = load
+        self.predict = predict
+        self.save = save
+        self.n_workers = n_workers
+        self.queue_depth = queue_depth
+        self._times = collections.defaultdict(float)
+        self._counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._errors = list()
+
+    def _record(self, stage, n, seconds):
+        with self._lock:
+            self._counts[stage] += n
+            self._times[stage] += seconds
+        logger.debug(
+            'stage "%s": %d objects in %.2f s', stage, n, seconds
+        )
+
+    def _fail(self):
+        self._errors.append(sys.exc_info())
+        self._stop.set()
+
+    def _put(self, queue, item):
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def _get(self, queue):
+        while not self._stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+        return None
+
+    def _load_batches(self, batches, queue):
+        try:
+            for i, batch in enumerate(batches):
+                start = time.time()
+                data = self.load(batch)
+                self._record('load', len(data), time.time() - start)
+                if not self._put(queue, (i, data)):
+                    return
+        except Exception:
+            self._fail()
+        finally:
+            self._put(queue, None)
+
+    def _save_batches(self, queue):
+        try:
+            while True:
+                item = self._get(queue)
+                if item is None:
+                    break
+                i, labels = item
+                logger.info('save labels of batch #%d', i)
+                start = time.time()
+                self.save(labels)
+                self._record('save', len(labels), time.time() - start)
+        except Exception:
+            self._fail()
+
+    def run(self, batches):
+        '''Runs the pipeline.
+
+        Parameters
+        ----------
+        batches: Iterable
+            batches of mapobjects, e.g. ranges of mapobject IDs, which are
+            consumed lazily
+
+        Raises
+        ------
+        Exception
+            the first exception raised by any of the stages
+        '''
+        loaded = Queue.Queue(self.queue_depth)
+        predicted = Queue.Queue(self.queue_depth)
+        loader = threading.Thread(
+            target=self._load_batches, args=(batches, loaded)
+        )
+        writer = threading.Thread(target=self._save_batches, args=(predicted,))
+        pool = None
+        if self.n_workers > 1:
+            pool = multiprocessing.Pool(self.n_workers)
+        start = time.time()
+        loader.start()
+        writer.start()
+        try:
+            pending = collections.deque()
+            # Keep at most one batch per worker process in flight.
+            n_in_flight = self.n_workers if pool is not None else 0
+            while True:
+                item = self._get(loaded)
+                if item is None:
+                    break
+                i, data = item
+                logger.info('predict labels of batch #%d', i)
+                if pool is None:
+                    pending.append(
+                        (i, len(data), _call_timed(self.predict, data))
+                    )
+                else:
+                    pending.append((
+                        i, len(data),
+                        pool.apply_async(_call_timed, (self.predict, data))
+                    ))
+                while len(pending) > n_in_flight:
+                    if not self._hand_over(pending.popleft(), predicted):
+                        break
+            while pending and not self._stop.is_set():
+                self._hand_over(pending.popleft(), predicted)
+        except Exception:
+            self._fail()
+        finally:
+            if not self._stop.is_set():
+                self._put(predicted, None)
+            writer.join()
+            self._stop.set()
+            loader.join()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        if self._errors:
+            exc_type, exc_value, tb = self._errors[0]
+            raise exc_type, exc_value, tb
+        self._log_throughput(time.time() - start)
+
+    def _hand_over(self, item, queue):
+        i, n, result = item
+        if isinstance(result, multiprocessing.pool.ApplyResult):
+            result = result.get()
+        labels, seconds = result
+        self._record('predict', n, seconds)
+        return self._put(queue, (i, labels))
+
+    def _log_throughput(self, total_time):
+        for stage in ('load', 'predict', 'save'):
+            seconds = self._times[stage]
+            n = self._counts[stage]
+            logger.info(
+                'stage "%s": %d objects in %.1f s (%.0f objects/s)',
+                stage, n, seconds, n / seconds if seconds > 0 else 0
+            )
+        logger.info('pipeline completed in %.1f s', total_time)
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from tmlib.tools.pipeline import PredictionPipeline
+
+
+def load(mapobject_ids):
+    return pd.DataFrame({'area': mapobject_ids}, index=mapobject_ids)
+
+
+def predict(feature_data):
+    return feature_data['area'] * 2
+
+
+def create_batches():
+    return [range(i, i + 10) for i in range(0, 100, 10)]
+
+
+def run_pipeline(n_workers):
+    saved = list()
+    pipeline = PredictionPipeline(
+        load, predict, saved.append, n_workers=n_workers, queue_depth=1
+    )
+    pipeline.run(create_batches())
+    return saved
+
+
+def test_pipeline_saves_batches_in_order():
+    saved = run_pipeline(1)
+    assert len(saved) == 10
+    labels = pd.concat(saved)
+    assert labels.index.tolist() == range(100)
+    assert labels.tolist() == [2 * i for i in range(100)]
+
+
+def test_pipeline_with_worker_processes():
+    saved = run_pipeline(3)
+    labels = pd.concat(saved)
+    assert labels.tolist() == [2 * i for i in range(100)]
+
+
+def test_pipeline_raises_error_of_stage():
+    def save(labels):
+        raise ValueError('database is gone')
+
+    pipeline = PredictionPipeline(load, predict, save, queue_depth=1)
+    with pytest.raises(ValueError):
+        pipeline.run(create_batches())
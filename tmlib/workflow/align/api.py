@@ -14,7 +14,10 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import logging
+import functools
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+from sqlalchemy.orm import joinedload
 
 import tmlib.models as tm
 from tmlib.utils import notimplemented
@@ -22,6 +25,7 @@ from tmlib.utils import same_docstring_as
 from tmlib.errors import NotSupportedError
 from sqlalchemy.orm.exc import NoResultFound
 from tmlib.errors import JobDescriptionError
+from tmlib.errors import WorkflowError
 from tmlib.workflow.align import registration as reg
 from tmlib.workflow.api import WorkflowStepAPI
 from tmlib.workflow import register_step_api
@@ -79,9 +83,38 @@ class ImageRegistrator(WorkflowStepAPI):
                     'Cycle index must not exceed total number of cycles.'
                 )
 
+            logger.debug('query image files of reference wavelength')
+            image_files = session.query(
+                    tm.ChannelImageFile.site_id, tm.ChannelImageFile.cycle_id,
+                    tm.ChannelImageFile.id
+                ).\
+                join(tm.Channel).\
+                join(tm.Site).\
+                filter(tm.Channel.wavelength == args.ref_wavelength).\
+                filter(~tm.Site.omitted).\
+                order_by(
+                    tm.ChannelImageFile.site_id, tm.ChannelImageFile.cycle_id,
+                    tm.ChannelImageFile.id
+                ).\
+                all()
+            file_ids_lut = defaultdict(lambda: defaultdict(list))
+            n_files_per_cycle = defaultdict(int)
+            for site_id, cycle_id, file_id in image_files:
+                file_ids_lut[site_id][cycle_id].append(file_id)
+                n_files_per_cycle[cycle_id] += 1
+
+            for cycle in cycles:
+                if n_files_per_cycle[cycle.id] == 0:
+                    raise ValueError(
+                        'No image files found for cycle %d and '
+                        'wavelength "%s"'
+                        % (cycle.id, args.ref_wavelength)
+                    )
+
             site_ids = session.query(tm.Site.id).\
                 order_by(tm.Site.id).\
                 all()
+            site_ids = [s.id for s in site_ids]
 
             batches = self._create_batches(site_ids, args.batch_size)
             for batch in batches:
@@ -94,34 +127,10 @@ class ImageRegistrator(WorkflowStepAPI):
 
                 for cycle in cycles:
 
-                    n = session.query(tm.ChannelImageFile.id).\
-                        join(tm.Cycle).\
-                        join(tm.Channel).\
-                        filter(tm.Cycle.id == cycle.id).\
-                        filter(tm.Channel.wavelength == args.ref_wavelength).\
-                        filter(~tm.Site.omitted).\
-                        count()
-
-                    if n == 0:
-                        raise ValueError(
-                            'No image files found for cycle %d and '
-                            'wavelength "%s"'
-                            % (cycle.id, args.ref_wavelength)
-                        )
-
                     for s in batch:
 
-                        files = session.query(tm.ChannelImageFile.id).\
-                            join(tm.Site).\
-                            join(tm.Cycle).\
-                            join(tm.Channel).\
-                            filter(tm.Site.id == s).\
-                            filter(tm.Cycle.id == cycle.id).\
-                            filter(tm.Channel.wavelength == args.ref_wavelength).\
-                            filter(~tm.Site.omitted).\
-                            all()
-
-                        if not files:
+                        ids = file_ids_lut[s][cycle.id]
+                        if not ids:
                             # We don't raise an Execption here, because
                             # there may be situations were an aquisition
                             # failed at a given site in one cycle, but
@@ -132,7 +141,6 @@ class ImageRegistrator(WorkflowStepAPI):
                             )
                             continue
 
-                        ids = [f.id for f in files]
                         if cycle.index == args.ref_cycle:
                             input_ids['reference_file_ids'].extend(ids)
                         input_ids['target_file_ids'][cycle.id].extend(ids)
@@ -140,6 +148,9 @@ class ImageRegistrator(WorkflowStepAPI):
                 yield {
                     'id': job_count,
                     'input_ids': input_ids,
+                    'method': args.method,
+                    'subpixel': args.subpixel,
+                    'n_threads': args.n_threads,
                     'illumcorr': args.illumcorr,
                     'robust_align': args.robust_align,
                     'rescale_percentile': args.rescale_percentile
@@ -176,11 +187,26 @@ class ImageRegistrator(WorkflowStepAPI):
         with tm.utils.ExperimentSession(self.experiment_id) as session:
             reference_file_ids = batch['input_ids']['reference_file_ids']
             target_file_ids = batch['input_ids']['target_file_ids']
+            # NOTE: Keys get converted to strings upon serialization of the
+            # job description.
+            cycle_ids = sorted(target_file_ids.keys())
+
+            logger.debug('prefetch image files')
+            file_ids = list(reference_file_ids)
+            for tids in target_file_ids.itervalues():
+                file_ids.extend(tids)
+            image_files = session.query(tm.ChannelImageFile).\
+                options(joinedload(tm.ChannelImageFile.site)).\
+                filter(tm.ChannelImageFile.id.in_(file_ids)).\
+                all()
+            image_files = {f.id: f for f in image_files}
+
+            reference_stats = None
+            target_stats = defaultdict(lambda: None)
             if batch['illumcorr'] or batch['robust_align']:
                 logger.info('correct images for illumination artifacts')
 
-                rid = reference_file_ids[0]
-                reference_file = session.query(tm.ChannelImageFile).get(rid)
+                reference_file = image_files[reference_file_ids[0]]
                 try:
                     logger.debug(
                         'load illumination statistics for channel %d of '
@@ -197,9 +223,8 @@ class ImageRegistrator(WorkflowStepAPI):
                     )
                 reference_stats = illumstats_file.get()
 
-                target_stats = dict()
-                for cycle_id, tids in target_file_ids.iteritems():
-                    target_file = session.query(tm.ChannelImageFile).get(tids[0])
+                for cycle_id in cycle_ids:
+                    target_file = image_files[target_file_ids[cycle_id][0]]
                     try:
                         logger.debug(
                             'load illumination statistics for channel %d of'
@@ -217,70 +242,91 @@ class ImageRegistrator(WorkflowStepAPI):
                         )
                     target_stats[cycle_id] = illumstats_file.get()
 
-            
-
-            for i, rid in enumerate(reference_file_ids):
-                reference_file = session.query(tm.ChannelImageFile).get(rid)
-                logger.info('register images at site %d', reference_file.site_id)
-                logger.debug('load reference image %d', rid)
-                reference_img = reference_file.get()
+            if not assume_clean_state:
+                site_ids = [
+                    image_files[rid].site_id for rid in reference_file_ids
+                ]
+                logger.debug('delete existing site shifts')
+                session.query(tm.SiteShift).\
+                    filter(tm.SiteShift.site_id.in_(site_ids)).\
+                    delete(synchronize_session=False)
+
+            def load_image(file_id, stats):
+                image_file = image_files[file_id]
+                logger.debug('load image %d', file_id)
+                img = image_file.get()
                 if batch['illumcorr']:
-                    logger.debug('correct reference image')
-                    reference_img = reference_img.correct(reference_stats)
-                
+                    logger.debug('correct image')
+                    img = img.correct(stats)
                 if batch['robust_align']:
                     logger.debug('clip image for robust alignment')
-                    clip_max = reference_stats.get_closest_percentile(
-                                batch['rescale_percentile']
-                            )
+                    clip_max = stats.get_closest_percentile(
+                        batch['rescale_percentile']
+                    )
                     logger.info('clip value: %d', clip_max)
-                    clip_min = 0
-                    reference_img = reference_img.clip(clip_min, clip_max)
-
-                y_shifts = list()
-                x_shifts = list()
-                for cycle_id, tids in target_file_ids.iteritems():
-                    logger.info('calculate shifts for cycle %s', cycle_id)
-                    logger.debug('load target image %d', tids[i])
-                    target_file = session.query(tm.ChannelImageFile).get(tids[i])
-                    target_img = target_file.get()
-                    if batch['illumcorr']:
-                        logger.debug('correct target image')
-                        target_img = target_img.correct(target_stats[cycle_id])
-
-                    if batch['robust_align']:
-                        logger.debug('clip image for robust alignment')
-                        clip_max = target_stats[cycle_id].get_closest_percentile(
-                                    batch['rescale_percentile']
+                    img = img.clip(0, clip_max)
+                return img.array
+
+            register = functools.partial(
+                reg.calculate_shifts,
+                method=batch['method'], subpixel=batch['subpixel']
+            )
+            n_threads = batch.get('n_threads', 1)
+            pool = ThreadPool(n_threads)
+            site_shifts = list()
+            try:
+                # Images are loaded by the main thread, since the session must
+                # not be shared between threads, and shifts are calculated
+                # in parallel for a few sites at a time.
+                n_sites = len(reference_file_ids)
+                chunk_size = n_threads * 2
+                for start in range(0, n_sites, chunk_size):
+                    indices = range(start, min(start + chunk_size, n_sites))
+                    site_images = list()
+                    for i in indices:
+                        rid = reference_file_ids[i]
+                        logger.info(
+                            'register images at site %d',
+                            image_files[rid].site_id
+                        )
+                        reference_img = load_image(rid, reference_stats)
+                        target_imgs = [
+                            load_image(target_file_ids[c][i], target_stats[c])
+                            for c in cycle_ids
+                        ]
+                        site_images.append((reference_img, target_imgs))
+                    shifts = pool.map(lambda a: register(*a), site_images)
+
+                    for i, site_shifts_yx in zip(indices, shifts):
+                        site = image_files[reference_file_ids[i]].site
+                        for cycle_id, (y, x) in zip(cycle_ids, site_shifts_yx):
+                            target_file = image_files[
+                                target_file_ids[cycle_id][i]
+                            ]
+                            site_shifts.append(
+                                tm.SiteShift(
+                                    x=x, y=y, site_id=target_file.site_id,
+                                    cycle_id=target_file.cycle_id
                                 )
-                        logger.info('clip value: %d', clip_max)
-                        clip_min = 0
-                        target_img = target_img.clip(clip_min, clip_max)
-
-                    y, x = reg.calculate_shift(
-                        target_img.array, reference_img.array
-                    )
-
-                    session.get_or_create(
-                        tm.SiteShift,
-                        x=x, y=y,
-                        site_id=target_file.site_id,
-                        cycle_id=target_file.cycle_id
-                    )
-
-                    y_shifts.append(y)
-                    x_shifts.append(x)
-
-                logger.info('calculate intersection of sites across cycles')
-                bottom, top, left, right = reg.calculate_overlap(
-                    y_shifts, x_shifts
-                )
-
-                site = session.query(tm.Site).get(reference_file.site_id)
-                site.bottom_residue = bottom
-                site.top_residue = top
-                site.left_residue = left
-                site.right_residue = right
+                            )
+                        logger.info(
+                            'calculate intersection of site %d across cycles',
+                            site.id
+                        )
+                        bottom, top, left, right = reg.calculate_overlap(
+                            [yx[0] for yx in site_shifts_yx],
+                            [yx[1] for yx in site_shifts_yx]
+                        )
+                        site.bottom_residue = bottom
+                        site.top_residue = top
+                        site.left_residue = left
+                        site.right_residue = right
+            finally:
+                pool.close()
+                pool.join()
+
+            logger.info('insert %d site shifts', len(site_shifts))
+            session.bulk_save_objects(site_shifts)
 
     @notimplemented
     def collect_job_output(self, batch):
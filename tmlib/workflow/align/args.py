@@ -40,6 +40,25 @@ class AlignBatchArguments(BatchArguments):
         help='number of acquisition sites that should be processed per job'
     )
 
+    method = Argument(
+        type=str, default='chi2', choices={'chi2', 'phase_correlation'},
+        help='''algorithm for calculating shifts: "chi2" performs an upsampled
+            chi2 search, "phase_correlation" is considerably faster
+        '''
+    )
+
+    subpixel = Argument(
+        type=bool, default=False,
+        help='''whether the phase correlation peak should be located with
+            subpixel precision before shifts get rounded
+        '''
+    )
+
+    n_threads = Argument(
+        type=int, default=1, flag='n-threads',
+        help='number of threads that should register sites in parallel'
+    )
+
     illumcorr = Argument(
         type=bool, default=False, short_flag='i',
         help='whether images should be corrected for illumination artifacts'
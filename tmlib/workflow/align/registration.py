@@ -41,6 +41,88 @@ def calculate_shift(target_image, reference_image):
     return (int(np.round(y)), int(np.round(x)))
 
 
+def calculate_shifts(reference_image, target_images, method='chi2',
+        subpixel=False):
+    '''Calculates the displacement of several images acquired at the same
+    site in different cycles relative to the same reference image.
+
+    Parameters
+    ----------
+    reference_image: numpy.ndarray
+        image that should be used as a reference
+    target_images: List[numpy.ndarray]
+        images that should be registered
+    method: str, optional
+        ``"chi2"`` for an upsampled chi2 search
+        (see :func:`calculate_shift <tmlib.workflow.align.registration.calculate_shift>`)
+        or ``"phase_correlation"`` (default: ``"chi2"``)
+    subpixel: bool, optional
+        whether the location of the phase correlation peak should be refined
+        with subpixel precision before it gets rounded; only relevant for
+        method ``"phase_correlation"`` (default: ``False``)
+
+    Returns
+    -------
+    List[Tuple[int]]
+        shift in y and x direction for each target image
+
+    Raises
+    ------
+    ValueError
+        when `method` is not supported
+
+    Note
+    ----
+    Phase correlation computes the Fourier transform of the reference image
+    only once for all target images.
+    '''
+    if method == 'chi2':
+        return [calculate_shift(t, reference_image) for t in target_images]
+    elif method == 'phase_correlation':
+        logger.debug('calculate Fourier transform of reference image')
+        reference_fft = np.fft.rfft2(reference_image)
+        return [
+            _calculate_shift_by_phase_correlation(
+                t, reference_fft, reference_image.shape, subpixel
+            )
+            for t in target_images
+        ]
+    else:
+        raise ValueError('Unknown registration method "%s".' % method)
+
+
+def _calculate_shift_by_phase_correlation(target_image, reference_fft, shape,
+        subpixel):
+    if target_image.shape != shape:
+        raise ValueError('Target and reference images must have same shape.')
+    logger.debug('calculate shift between target and reference image')
+    cross_power = np.fft.rfft2(target_image)
+    np.conjugate(cross_power, out=cross_power)
+    cross_power *= reference_fft
+    cross_power /= np.abs(cross_power) + np.finfo(float).eps
+    correlation = np.fft.irfft2(cross_power, s=shape)
+    peak = np.unravel_index(np.argmax(correlation), shape)
+    shift = list()
+    for axis, p in enumerate(peak):
+        n = shape[axis]
+        position = float(p)
+        if subpixel:
+            # Fit a parabola through the peak and its (periodic) neighbours
+            before = list(peak)
+            before[axis] = (p - 1) % n
+            after = list(peak)
+            after[axis] = (p + 1) % n
+            c_before = correlation[tuple(before)]
+            c_after = correlation[tuple(after)]
+            denominator = c_before - 2 * correlation[peak] + c_after
+            if denominator != 0:
+                position += 0.5 * (c_before - c_after) / denominator
+        if position > n / 2.0:
+            position -= n
+        shift.append(int(np.round(position)))
+    return tuple(shift)
+
+
 def calculate_overlap(y_shifts, x_shifts):
     '''Calculates the overlap of images acquired at the same site
     across different acquisition cycles.
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from tmlib.workflow.align import registration
+
+
+SHAPE = (64, 80)
+
+SHIFTS = [(0, 0), (3, 5), (-3, 5), (3, -5), (-7, -11), (31, -39), (-31, 39)]
+
+
+def _create_image():
+    return np.random.RandomState(0).randint(0, 2**12, SHAPE).astype(float)
+
+
+def _shift_image(image, shift):
+    # Shifts the image by a (possibly fractional) number of pixels in the
+    # same direction as numpy.roll.
+    ky = np.fft.fftfreq(image.shape[0])[:, np.newaxis]
+    kx = np.fft.fftfreq(image.shape[1])[np.newaxis, :]
+    phase = np.exp(-2j * np.pi * (ky * shift[0] + kx * shift[1]))
+    return np.real(np.fft.ifft2(np.fft.fft2(image) * phase))
+
+
+@pytest.mark.parametrize('shift', SHIFTS)
+@pytest.mark.parametrize('subpixel', [False, True])
+def test_calculate_shifts_by_phase_correlation(shift, subpixel):
+    reference = _create_image()
+    target = np.roll(np.roll(reference, shift[0], axis=0), shift[1], axis=1)
+    shifts = registration.calculate_shifts(
+        reference, [target], method='phase_correlation', subpixel=subpixel
+    )
+    # The shift is the one that needs to be applied to the target image
+    # to align it with the reference image.
+    assert shifts == [(-shift[0], -shift[1])]
+
+
+@pytest.mark.parametrize('subpixel', [False, True])
+def test_calculate_shifts_by_phase_correlation_matches_chi2(subpixel):
+    reference = _create_image()
+    targets = [
+        np.roll(np.roll(reference, s[0], axis=0), s[1], axis=1)
+        for s in SHIFTS
+    ]
+    expected = registration.calculate_shifts(reference, targets, method='chi2')
+    shifts = registration.calculate_shifts(
+        reference, targets, method='phase_correlation', subpixel=subpixel
+    )
+    assert shifts == expected
+
+
+@pytest.mark.parametrize('subpixel', [False, True])
+def test_calculate_shifts_by_phase_correlation_at_half_image_size(subpixel):
+    reference = _create_image()
+    # Shifting by half the image size is ambiguous, the positive shift is
+    # reported.
+    target = np.roll(np.roll(reference, 32, axis=0), -40, axis=1)
+    shifts = registration.calculate_shifts(
+        reference, [target], method='phase_correlation', subpixel=subpixel
+    )
+    assert shifts == [(32, 40)]
+
+
+@pytest.mark.parametrize('shift', [(2.3, -4.6), (-2.3, 4.6), (-0.4, 0.7)])
+def test_calculate_shifts_by_phase_correlation_with_subpixel(shift):
+    reference = _create_image()
+    target = _shift_image(reference, shift)
+    shifts = registration.calculate_shifts(
+        reference, [target], method='phase_correlation', subpixel=True
+    )
+    assert shifts == [(
+        int(np.round(-shift[0])), int(np.round(-shift[1]))
+    )]
+
+
+def test_calculate_shifts_by_phase_correlation_with_subpixel_wraps_around():
+    reference = _create_image()
+    # The correlation peak lies between pixel 32 and 33 (or 40 and 41), just
+    # beyond half the image size. Only the refined position of the peak
+    # wraps around to the negative shift.
+    target = _shift_image(reference, (31.7, 39.7))
+    shifts = registration.calculate_shifts(
+        reference, [target], method='phase_correlation', subpixel=True
+    )
+    assert shifts == [(-32, -40)]
+    shifts = registration.calculate_shifts(
+        reference, [target], method='phase_correlation', subpixel=False
+    )
+    assert shifts == [(32, 40)]
+
+
+def test_calculate_shifts_with_different_shape():
+    reference = _create_image()
+    with pytest.raises(ValueError):
+        registration.calculate_shifts(
+            reference, [reference[:32, :]], method='phase_correlation'
+        )
+
+
+def test_calculate_shifts_with_unknown_method():
+    reference = _create_image()
+    with pytest.raises(ValueError):
+        registration.calculate_shifts(reference, [reference], method='foo')
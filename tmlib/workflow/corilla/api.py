@@ -14,13 +14,16 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import glob
 import logging
-from sqlalchemy import func
+import collections
+import numpy as np
 
 import tmlib.models as tm
-from tmlib.utils import notimplemented
+from tmlib import utils
 from tmlib.image import IllumstatsContainer
 from tmlib.models.utils import delete_location
+from tmlib.models.sampling import sample_ids
 from tmlib.workflow.api import WorkflowStepAPI
 from tmlib.workflow.corilla.stats import OnlineStatistics
 from tmlib.workflow import register_step_api
@@ -42,6 +45,18 @@ class IllumstatsCalculator(WorkflowStepAPI):
         '''
         super(IllumstatsCalculator, self).__init__(experiment_id)
 
+    @utils.autocreate_directory_property
+    def stats_location(self):
+        '''str: location where partial statistics of individual jobs are
+        stored until they get merged in the *collect* phase
+        '''
+        return os.path.join(self.step_location, 'stats')
+
+    def _build_partial_stats_filename(self, job_id):
+        return os.path.join(
+            self.stats_location, 'partial_stats_%0.5d.h5' % job_id
+        )
+
     def create_run_batches(self, args):
         '''Creates job descriptions for parallel computing.
 
@@ -54,6 +69,12 @@ class IllumstatsCalculator(WorkflowStepAPI):
         -------
         generator
             job descriptions
+
+        Note
+        ----
+        Image files of each channel get distributed across several jobs,
+        which compute partial statistics that are merged in the *collect*
+        phase.
         '''
         count = 0
 
@@ -76,11 +97,12 @@ class IllumstatsCalculator(WorkflowStepAPI):
                         'illumination statistics for channel "%s"', limit,
                         ch.name
                     )
-                    file_ids = session.query(tm.ChannelImageFile.id).\
-                        filter_by(channel_id=ch.id).\
-                        order_by(func.random()).\
-                        limit(limit).\
-                        all()
+                    # Images of all wells should be represented, since
+                    # imaging conditions may vary across the plate.
+                    file_ids = sample_ids(
+                        session, tm.ChannelImageFile, limit,
+                        site_column='site_id', channel_id=ch.id
+                    )
                 else:
                     if n < 100:
                         logger.warn(
@@ -91,18 +113,21 @@ class IllumstatsCalculator(WorkflowStepAPI):
                     file_ids = session.query(tm.ChannelImageFile.id).\
                         filter_by(channel_id=ch.id).\
                         all()
+                    file_ids = [f.id for f in file_ids]
                 if not file_ids:
                     logger.warning(
                         'no image files found for channel "%s"', ch.name
                     )
                     continue
 
-                count += 1
-                yield {
-                    'id': count,
-                    'channel_image_files_ids': file_ids,
-                    'channel_id': ch.id,
-                }
+                for batch in self._create_batches(file_ids, args.batch_size):
+                    count += 1
+                    yield {
+                        'id': count,
+                        'channel_image_files_ids': batch,
+                        'channel_id': ch.id,
+                        'single_precision': args.single_precision
+                    }
 
     def delete_previous_job_output(self):
         '''Deletes all :class:`tmlib.models.file.IllumstatsFile` instances
@@ -111,9 +136,16 @@ class IllumstatsCalculator(WorkflowStepAPI):
         logger.info('delete existing illumination statistics files')
         with tm.utils.ExperimentSession(self.experiment_id) as session:
             session.query(tm.IllumstatsFile).delete()
+        logger.info('delete existing partial statistics files')
+        filenames = glob.glob(
+            os.path.join(self.stats_location, 'partial_stats_*.h5')
+        )
+        for f in filenames:
+            os.remove(f)
 
     def run_job(self, batch, assume_clean_state=False):
-        '''Calculates illumination statistics.
+        '''Calculates partial illumination statistics for a subset of
+        image files of a channel.
 
         Parameters
         ----------
@@ -124,28 +156,63 @@ class IllumstatsCalculator(WorkflowStepAPI):
         '''
         file_ids = batch['channel_image_files_ids']
         logger.info('calculate illumination statistics')
+        stats = None
         with tm.utils.ExperimentSession(self.experiment_id) as session:
-            img_file = session.query(tm.ChannelImageFile).get(file_ids[0])
-            img = img_file.get()
-        stats = OnlineStatistics(image_dimensions=img.dimensions[0:2])
-        for fid in file_ids:
-            with tm.utils.ExperimentSession(self.experiment_id) as session:
-                img_file = session.query(tm.ChannelImageFile).get(fid)
+            image_files = session.query(tm.ChannelImageFile).\
+                filter(tm.ChannelImageFile.id.in_(file_ids)).\
+                order_by(tm.ChannelImageFile.id).\
+                all()
+            for img_file in image_files:
                 logger.info('update statistics for image: %d', img_file.id)
                 img = img_file.get()
+                if stats is None:
+                    if batch['single_precision']:
+                        dtype = np.float32
+                    else:
+                        dtype = np.float64
+                    stats = OnlineStatistics(
+                        image_dimensions=img.dimensions[0:2], dtype=dtype
+                    )
                 stats.update(img)
 
-        with tm.utils.ExperimentSession(self.experiment_id) as session:
-            stats_file = session.get_or_create(
-                tm.IllumstatsFile, channel_id=batch['channel_id']
-            )
-            logger.info('write calculated statistics to file')
-            illumstats = IllumstatsContainer(
-                stats.mean, stats.std, stats.percentiles
-            )
-            stats_file.put(illumstats)
+        filename = self._build_partial_stats_filename(batch['id'])
+        logger.info('write partial statistics to file: %s', filename)
+        stats.write(filename)
 
-    @notimplemented
     def collect_job_output(self, batch):
-        pass
+        '''Merges partial illumination statistics of all jobs that processed
+        image files of the same channel and stores the final statistics.
 
+        Parameters
+        ----------
+        batch: dict
+            job description
+        '''
+        channel_job_ids = collections.defaultdict(list)
+        for job_id in self.get_run_job_ids():
+            run_batch = self.get_run_batch(job_id)
+            channel_job_ids[run_batch['channel_id']].append(job_id)
+
+        for channel_id, job_ids in channel_job_ids.iteritems():
+            logger.info(
+                'merge partial statistics of %d jobs for channel %d',
+                len(job_ids), channel_id
+            )
+            stats = None
+            for job_id in sorted(job_ids):
+                filename = self._build_partial_stats_filename(job_id)
+                partial_stats = OnlineStatistics.read(filename)
+                if stats is None:
+                    stats = partial_stats
+                else:
+                    stats.merge(partial_stats)
+
+            with tm.utils.ExperimentSession(self.experiment_id) as session:
+                stats_file = session.get_or_create(
+                    tm.IllumstatsFile, channel_id=channel_id
+                )
+                logger.info('write calculated statistics to file')
+                illumstats = IllumstatsContainer(
+                    stats.mean, stats.std, stats.percentiles
+                )
+                stats_file.put(illumstats)
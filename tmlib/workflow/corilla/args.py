@@ -13,6 +13,7 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from tmlib.workflow.args import Argument
 from tmlib.workflow.args import BatchArguments
 from tmlib.workflow.args import SubmissionArguments
 from tmlib.workflow import register_step_batch_args
@@ -22,7 +23,17 @@ from tmlib.workflow import register_step_submission_args
 @register_step_batch_args('corilla')
 class CorillaBatchArguments(BatchArguments):
 
-    pass
+    batch_size = Argument(
+        type=int, default=1000, flag='batch-size', short_flag='b',
+        help='number of image files that should be processed per job'
+    )
+
+    single_precision = Argument(
+        type=bool, default=False, flag='single-precision',
+        help='''whether mean and variance should be accumulated in single
+            instead of double precision to reduce memory consumption
+        '''
+    )
 
 
 @register_step_submission_args('corilla')
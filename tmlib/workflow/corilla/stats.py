@@ -20,6 +20,7 @@ References
 ----------
 .. [1] Stoeger T, Battich N, Herrmann MD, Yakimovich Y, Pelkmans L. 2015. "Computer vision for image-based transcriptomics". Methods.
 .. [2] Welford BP. 1962. "Note on a method for calculating corrected sums of squares and products". Technometrics 4(3):419-420.
+.. [3] Chan TF, Golub GH, LeVeque RJ. 1979. "Updating formulae and a pairwise algorithm for computing sample variances". Technical Report STAN-CS-79-773, Stanford University.
 
 '''
 
@@ -28,6 +29,8 @@ import logging
 
 from tmlib.utils import assert_type
 from tmlib.image import IllumstatsImage
+from tmlib.readers import DatasetReader
+from tmlib.writers import DatasetWriter
 
 logger = logging.getLogger(__name__)
 
@@ -38,9 +41,15 @@ class OnlineStatistics(object):
     element-by-element on a series of numpy arrays based on
     Welford's method [2] . For more information see Wikipedia article
     `"Algorithms for calculating variance" <https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Online_algorithm>`_.
+
+    Percentiles are computed over the pooled pixel intensities of all images
+    from a histogram with one bin for each possible 16-bit intensity value.
     '''
 
-    def __init__(self, image_dimensions, decimals=3):
+    #: int: number of bins of the intensity histogram
+    N_BINS = 2**16
+
+    def __init__(self, image_dimensions, decimals=3, dtype=np.float64):
         '''
         Parameters
         ----------
@@ -49,17 +58,26 @@ class OnlineStatistics(object):
         decimals: int
             precision after the comma that determines the number of percentiles
             that will be calculated
+        dtype: type, optional
+            floating point data type of the accumulated mean and variance;
+            ``numpy.float32`` halves memory consumption at the cost of
+            precision (default: ``numpy.float64``)
         '''
         self.n = 0
         self.image_dimensions = image_dimensions
-        self._mean = np.zeros(image_dimensions, dtype=float)
-        self._M2 = np.zeros(image_dimensions, dtype=float)
+        if dtype not in {np.float32, np.float64}:
+            raise ValueError(
+                'Argument "dtype" must be either numpy.float32 or numpy.float64.'
+            )
+        self._mean = np.zeros(image_dimensions, dtype=dtype)
+        self._M2 = np.zeros(image_dimensions, dtype=dtype)
         if not(0 <= decimals <= 3):
             raise ValueError('Argument "decimals" must lie in range [0, 3].')
+        self.decimals = decimals
         precision = 10**(decimals+2)
         self._q = np.linspace(0, 100, precision)
-        self._percentiles = np.zeros((precision, ), dtype=np.float)
         self._keys = [round(x, decimals) for x in self._q]
+        self._histogram = np.zeros((self.N_BINS, ), dtype=np.int64)
 
     @assert_type(image='tmlib.image.ChannelImage')
     def update(self, image, log_transform=True):
@@ -72,40 +90,114 @@ class OnlineStatistics(object):
         log_transform: bool, optional
             log10 transform image (default: ``True``)
         '''
-        # Calculate percentiles with unsigned integer data type
-        self._percentiles += np.percentile(image.array, self._q)
+        # Count pixel intensities with unsigned integer data type
+        self._histogram += np.bincount(
+            image.array.ravel(), minlength=self.N_BINS
+        )
         # The other statistics require float data type
-        array = image.array.astype(float)
+        array = image.array.astype(self._mean.dtype)
         if log_transform:
             is_zero = array == 0
             if np.any(is_zero):
                 logger.warn('image contains zero values')
-            array = np.log10(array)
             # The log10 transform sets zero pixel values to -inf
+            with np.errstate(divide='ignore'):
+                np.log10(array, out=array)
             array[is_zero] = 0
         if np.any(np.isinf(array)):
             logger.warn('skip image because it contains infinite values')
         else:
             self.n += 1
             array.resize(self._mean.shape)
-            delta_mean = (array - self._mean).astype(np.float32)
-            try:
-                # update self._mean by in-place operations (conserve memory)
-                norm_delta_mean = np.array(delta_mean, copy=True)
-                norm_delta_mean /= self.n
-                self._mean += norm_delta_mean
-            except Exception as ex:
-                raise MemoryError(
-                    "unsufficiant memory available for updating "
-                    "online statistics"
-                )
-            self._M2 = self._M2 + delta_mean * (array - self._mean)
+            # Update statistics by in-place operations (conserve memory)
+            delta_mean = np.subtract(array, self._mean)
+            self._mean += delta_mean / self.n
+            array -= self._mean
+            array *= delta_mean
+            self._M2 += array
+
+    @assert_type(other='tmlib.workflow.corilla.stats.OnlineStatistics')
+    def merge(self, other):
+        '''Merges statistics that were calculated for a disjoint series of
+        images into the statistics of this object based on the parallel
+        algorithm of Chan et al. [3] .
+
+        Parameters
+        ----------
+        other: tmlib.workflow.corilla.stats.OnlineStatistics
+            statistics of another series of images
+
+        Returns
+        -------
+        tmlib.workflow.corilla.stats.OnlineStatistics
+            merged statistics
+
+        Note
+        ----
+        Statistics are modified in place.
+        '''
+        if tuple(other.image_dimensions) != tuple(self.image_dimensions):
+            raise ValueError('Image dimensions don\'t match.')
+        if other.decimals != self.decimals:
+            raise ValueError('Precision of percentiles doesn\'t match.')
+        self._histogram += other._histogram
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta_mean = other._mean - self._mean
+        self._M2 += other._M2
+        self._M2 += delta_mean**2 * (float(self.n) * other.n / n)
+        self._mean += delta_mean * (float(other.n) / n)
+        self.n = n
+        return self
+
+    def write(self, filename):
+        '''Writes the (partial) statistics to a file, such that they can
+        later be merged with statistics of other images.
+
+        Parameters
+        ----------
+        filename: str
+            absolute path to the HDF5 file
+        '''
+        with DatasetWriter(filename, truncate=True) as f:
+            f.write('n', self.n)
+            f.write('decimals', self.decimals)
+            f.write('mean', self._mean)
+            f.write('M2', self._M2)
+            f.write('histogram', self._histogram)
+
+    @classmethod
+    def read(cls, filename):
+        '''Reads (partial) statistics from a file.
+
+        Parameters
+        ----------
+        filename: str
+            absolute path to the HDF5 file
+
+        Returns
+        -------
+        tmlib.workflow.corilla.stats.OnlineStatistics
+            statistics
+        '''
+        with DatasetReader(filename) as f:
+            mean = f.read('mean')
+            stats = cls(
+                image_dimensions=mean.shape, decimals=int(f.read('decimals')),
+                dtype=mean.dtype.type
+            )
+            stats.n = int(f.read('n'))
+            stats._mean = mean
+            stats._M2 = f.read('M2')
+            stats._histogram = f.read('histogram')
+        return stats
 
     @property
     def var(self):
         '''numpy.ndarray[float]: variance'''
         if self.n < 2:
-            var = np.zeros(self.image_dimensions, dtype=float)
+            var = np.zeros(self.image_dimensions, dtype=self._M2.dtype)
             var[:] = np.nan
         else:
             var = self._M2 / (self.n - 1)
@@ -114,18 +206,31 @@ class OnlineStatistics(object):
     @property
     def mean(self):
         '''tmlib.image.IllumstatsImage: mean values'''
-        return IllumstatsImage(self._mean)
+        return IllumstatsImage(self._mean.astype(float))
 
     @property
     def std(self):
         '''tmlib.image.IllumstatsImage: standard deviation values'''
-        return IllumstatsImage(np.sqrt(self.var))
+        return IllumstatsImage(np.sqrt(self.var).astype(float))
 
     @property
     def percentiles(self):
         '''Dict[float, int]: calculated percentiles (rounded to integer values)
+
+        Note
+        ----
+        Values are linearly interpolated between the closest ranks in the
+        same way as :func:`numpy.percentile`.
         '''
+        cdf = np.cumsum(self._histogram)
+        total = cdf[-1]
+        if total == 0:
+            return {k: 0 for k in self._keys}
+        rank = self._q / 100.0 * (total - 1)
+        lower_rank = np.floor(rank)
+        lower = np.searchsorted(cdf, lower_rank, side='right')
+        upper = np.searchsorted(cdf, np.ceil(rank), side='right')
+        values = lower + (upper - lower) * (rank - lower_rank)
         return {
-            self._keys[i]: int(x/self.n)
-            for i, x in enumerate(self._percentiles)
+            self._keys[i]: int(x) for i, x in enumerate(values)
         }
@@ -0,0 +1,75 @@
+import numpy as np
+
+from tmlib.image import ChannelImage
+from tmlib.workflow.corilla.stats import OnlineStatistics
+
+
+def _create_images(n):
+    return [
+        ChannelImage(np.random.randint(1, 2**16, (10, 12)).astype(np.uint16))
+        for i in range(n)
+    ]
+
+
+def test_merge_equals_sequential_update():
+    images = _create_images(7)
+    expected = OnlineStatistics((10, 12))
+    for img in images:
+        expected.update(img)
+    stats = OnlineStatistics((10, 12))
+    for img in images[:3]:
+        stats.update(img)
+    other = OnlineStatistics((10, 12))
+    for img in images[3:]:
+        other.update(img)
+    stats.merge(other)
+    assert stats.n == expected.n
+    assert np.allclose(stats.mean.array, expected.mean.array)
+    assert np.allclose(stats.std.array, expected.std.array)
+    assert stats.percentiles == expected.percentiles
+
+
+def test_merge_empty():
+    stats = OnlineStatistics((10, 12))
+    for img in _create_images(2):
+        stats.update(img)
+    mean = stats.mean.array.copy()
+    stats.merge(OnlineStatistics((10, 12)))
+    assert stats.n == 2
+    assert np.array_equal(stats.mean.array, mean)
+
+
+def test_write_and_read(tmpdir):
+    stats = OnlineStatistics((10, 12))
+    for img in _create_images(3):
+        stats.update(img)
+    filename = str(tmpdir.join('stats.h5'))
+    stats.write(filename)
+    restored = OnlineStatistics.read(filename)
+    assert restored.n == 3
+    assert np.array_equal(restored.mean.array, stats.mean.array)
+    assert np.array_equal(restored.std.array, stats.std.array)
+
+
+def test_percentiles_of_pooled_intensities():
+    images = _create_images(4)
+    stats = OnlineStatistics((10, 12), decimals=0)
+    for img in images:
+        stats.update(img)
+    pixels = np.concatenate([img.array.ravel() for img in images])
+    expected = np.percentile(pixels, stats._q)
+    assert [stats.percentiles[k] for k in stats._keys] == [
+        int(v) for v in expected
+    ]
+
+
+def test_single_precision():
+    images = _create_images(5)
+    expected = OnlineStatistics((10, 12))
+    stats = OnlineStatistics((10, 12), dtype=np.float32)
+    for img in images:
+        expected.update(img)
+        stats.update(img)
+    assert stats._mean.dtype == np.float32
+    assert np.allclose(stats.mean.array, expected.mean.array, rtol=1e-5)
+    assert np.allclose(stats.std.array, expected.std.array, rtol=1e-3)
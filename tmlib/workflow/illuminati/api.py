@@ -39,6 +39,8 @@ from tmlib.workflow.jobs import SingleRunPhase
 from tmlib.workflow.jobs import MultiRunPhase
 from tmlib.workflow.jobs import CollectJob
 from tmlib.workflow import register_step_api
+from tmlib.workflow.illuminati import pyramid
+from tmlib.workflow.illuminati.cache import ImageCache
 
 logger = logging.getLogger(__name__)
 
@@ -107,9 +109,21 @@ class PyramidBuilder(WorkflowStepAPI):
                 tpoints = [r.tpoint for r in results]
                 for t, z in itertools.product(tpoints, zplanes):
                     logger.info('create layer for tpoint %d, zplane %d', t, z)
+                    # Sort images according to the position of sites within
+                    # wells (row-major), such that neighbouring images tend
+                    # to be processed by the same job.
                     image_files = session.query(tm.ChannelImageFile.id).\
-                        filter_by(channel_id=channel.id, tpoint=t, zplane=z).\
-                        order_by(tm.ChannelImageFile.site_id).\
+                        join(tm.Site).\
+                        join(tm.Well).\
+                        filter(
+                            tm.ChannelImageFile.channel_id == channel.id,
+                            tm.ChannelImageFile.tpoint == t,
+                            tm.ChannelImageFile.zplane == z
+                        ).\
+                        order_by(
+                            tm.Well.plate_id, tm.Well.name,
+                            tm.Site.y, tm.Site.x
+                        ).\
                         all()
                     image_file_ids = [f.id for f in image_files]
                     layer = session.get_or_create(
@@ -177,6 +191,9 @@ class PyramidBuilder(WorkflowStepAPI):
                     count += 1
                     n_levels = experiment.pyramid_depth
                     max_zoomlevel_index = n_levels - 1
+                    # Zoom levels directly below the base can optionally be
+                    # computed in memory for entire blocks of base tiles.
+                    block_depth = min(args.block_depth, max_zoomlevel_index)
                     for index, level in enumerate(reversed(range(n_levels))):
                         logger.info('create batches for pyramid level %d', level)
                         # The layer "level" increases from top to bottom.
@@ -197,6 +214,38 @@ class PyramidBuilder(WorkflowStepAPI):
                                 batch_size *= 25
                             else:
                                 batch_size /= 4
+                            if index == 1 and block_depth > 0:
+                                logger.info(
+                                    'create block batches for pyramid levels '
+                                    '%d to %d', level, level - block_depth + 1
+                                )
+                                origins = pyramid.get_block_origins(
+                                    layer.dimensions[max_zoomlevel_index][0],
+                                    layer.dimensions[max_zoomlevel_index][1],
+                                    block_depth
+                                )
+                                n_blocks = max(
+                                    1, batch_size / 4**(block_depth - 1)
+                                )
+                                for blocks in self._create_batches(
+                                        origins, n_blocks):
+                                    job_count += 1
+                                    yield {
+                                        'id': job_count,
+                                        'layer_id': layer.id,
+                                        'level': level,
+                                        'index': index,
+                                        'blocks': blocks,
+                                        'block_depth': block_depth,
+                                        'ingest_size': args.ingest_size
+                                    }
+                                continue
+                            elif index <= block_depth:
+                                # Tiles have already been created by the
+                                # jobs processing blocks.
+                                continue
+                            elif block_depth > 0:
+                                index -= block_depth - 1
                             batches = self._create_batches(
                                 np.arange(np.prod(layer.dimensions[level])),
                                 batch_size
@@ -218,7 +267,9 @@ class PyramidBuilder(WorkflowStepAPI):
                                     'image_file_ids': batch,
                                     'align': args.align,
                                     'illumcorr': args.illumcorr,
-                                    'illumcorr_exceptions': args.illumcorr_exceptions
+                                    'illumcorr_exceptions': args.illumcorr_exceptions,
+                                    'ingest_size': args.ingest_size,
+                                    'cache_size': args.cache_size
                                 }
                             else:
                                 rows = np.arange(layer.dimensions[level][0])
@@ -231,7 +282,8 @@ class PyramidBuilder(WorkflowStepAPI):
                                     'layer_id': layer.id,
                                     'level': level,
                                     'index': index,
-                                    'coordinates': coordinates
+                                    'coordinates': coordinates,
+                                    'ingest_size': args.ingest_size
                                 }
 
     def delete_previous_job_output(self):
@@ -355,6 +407,44 @@ class PyramidBuilder(WorkflowStepAPI):
 
         return job_collection
 
+    @staticmethod
+    def _ingest_tiles(session, tiles):
+        # Tiles are buffered and written in chunks, since inserting them one
+        # by one requires a round trip to the database for each tile.
+        if not tiles:
+            return
+        logger.debug('insert %d tiles', len(tiles))
+        session.bulk_ingest(tiles)
+        del tiles[:]
+
+    @staticmethod
+    def _load_processed_image(image_file, image_cache, stats, align,
+            clip_min, clip_max):
+        # Images get corrected, aligned and rescaled to 8-bit only once per
+        # job, since they may be required for tiles of neighbouring sites.
+        image = image_cache.get(image_file.id)
+        if image is not None:
+            logger.debug('use cached image %d', image_file.id)
+            return image
+        image = image_file.get()
+        if stats is not None and image.is_uint16:
+            # Alignment pads images with zeros, which are mapped to zero
+            # upon rescaling. Pixel-wise operations can thus be performed
+            # before the image gets aligned.
+            logger.debug('correct and rescale image')
+            image = image.correct_and_scale(stats, clip_min, clip_max)
+        elif stats is not None:
+            logger.debug('correct image')
+            image = image.correct(stats)
+        if align:
+            logger.debug('align image')
+            image = image.align(crop=False)
+        if not image.is_uint8:
+            image = image.clip(clip_min, clip_max)
+            image = image.scale(clip_min, clip_max)
+        image_cache.set(image_file.id, image)
+        return image
+
     def _create_maxzoom_level_tiles(self, batch, assume_clean_state):
         exp_id = self.experiment_id
         with tm.utils.ExperimentSession(exp_id, transaction=False) as session:
@@ -387,7 +477,14 @@ class PyramidBuilder(WorkflowStepAPI):
                         'No illumination statistics file found for channel %d'
                         % layer.channel_id
                     )
-                stats = stats_file.get()
+                if layer.channel.name in non_illumcorr_channels:
+                    logger.info(
+                        'Not applying illumination correction for channel %s',
+                        layer.channel.name
+                    )
+                    stats = None
+                else:
+                    stats = stats_file.get()
             else:
                 stats = None
 
@@ -397,25 +494,20 @@ class PyramidBuilder(WorkflowStepAPI):
             clip_min = layer.min_intensity
             clip_max = layer.max_intensity
 
+            # Images of neighbouring sites are required for tiles that span
+            # multiple images. Preprocessed images are therefore cached for the
+            # whole job. Since batches are sorted according to the position of
+            # sites within wells, neighbours are usually still cached.
+            image_cache = ImageCache(batch['cache_size'])
+            tiles_to_ingest = list()
             for fid in batch['image_file_ids']:
                 file = session.query(tm.ChannelImageFile).get(fid)
                 logger.info('process image %d', file.id)
                 tiles = layer.map_image_to_base_tiles(file)
-                image_store = dict()
-                image = file.get()
-                if batch['illumcorr']:
-                    if layer.channel.name in non_illumcorr_channels:
-                        logger.info('Not applying illumination correction for channel %s', layer.channel.name)
-                    else:
-                        logger.debug('correct image')
-                        image = image.correct(stats)
-                if batch['align']:
-                    logger.debug('align image')
-                    image = image.align(crop=False)
-                if not image.is_uint8:
-                    image = image.clip(clip_min, clip_max)
-                    image = image.scale(clip_min, clip_max)
-                image_store[file.id] = image
+                image = self._load_processed_image(
+                    file, image_cache, stats, batch['align'],
+                    clip_min, clip_max
+                )
 
                 extra_file_map = layer.map_base_tile_to_images(file.site)
                 for t in tiles:
@@ -426,7 +518,7 @@ class PyramidBuilder(WorkflowStepAPI):
                         'create tile: z=%d, y=%d, x=%d', level, row, column
                     )
                     tile = layer.extract_tile_from_image(
-                        image_store[file.id], t['y_offset'], t['x_offset']
+                        image, t['y_offset'], t['x_offset']
                     )
 
                     # Determine files that contain overlapping pixels,
@@ -439,25 +531,16 @@ class PyramidBuilder(WorkflowStepAPI):
                     for efid in extra_file_ids:
                         extra_file = session.query(tm.ChannelImageFile).\
                             get(efid)
-                        if extra_file.id not in image_store:
-                            image = extra_file.get()
-                            if batch['illumcorr']:
-                                logger.debug('correct image')
-                                image = image.correct(stats)
-                            if batch['align']:
-                                logger.debug('align image')
-                                image = image.align(crop=False)
-                            if not image.is_uint8:
-                                image = image.clip(clip_min, clip_max)
-                                image = image.scale(clip_min, clip_max)
-                            image_store[extra_file.id] = image
+                        pixels = self._load_processed_image(
+                            extra_file, image_cache, stats, batch['align'],
+                            clip_min, clip_max
+                        )
 
                         extra_file_coordinate = np.array((
                             extra_file.site.y, extra_file.site.x
                         ))
 
                         condition = file_coordinate > extra_file_coordinate
-                        pixels = image_store[extra_file.id]
                         if all(condition):
                             logger.debug('insert pixels from top left image')
                             y = file.site.image_size[0] - abs(t['y_offset'])
@@ -509,8 +592,15 @@ class PyramidBuilder(WorkflowStepAPI):
                         channel_layer_id=layer.id,
                         z=level, y=row, x=column, pixels=tile
                     )
-                    session.add(channel_layer_tile)
+                    tiles_to_ingest.append(channel_layer_tile)
+                    if len(tiles_to_ingest) >= batch['ingest_size']:
+                        self._ingest_tiles(session, tiles_to_ingest)
 
+            self._ingest_tiles(session, tiles_to_ingest)
+            logger.info(
+                'image cache: %d hits, %d misses',
+                image_cache.hits, image_cache.misses
+            )
 
     def _create_lower_zoom_level_tiles(self, batch, assume_clean_state):
         exp_id = self.experiment_id
@@ -522,6 +612,7 @@ class PyramidBuilder(WorkflowStepAPI):
             layer_id = layer.id
             zoom_factor = layer.zoom_factor
 
+            tiles_to_ingest = list()
             for coordinates in batch['coordinates']:
                 row = coordinates[0]
                 column = coordinates[1]
@@ -582,7 +673,81 @@ class PyramidBuilder(WorkflowStepAPI):
                     channel_layer_id=layer_id,
                     z=level, y=row, x=column, pixels=tile
                 )
-                session.add(channel_layer_tile)
+                tiles_to_ingest.append(channel_layer_tile)
+                if len(tiles_to_ingest) >= batch['ingest_size']:
+                    self._ingest_tiles(session, tiles_to_ingest)
+
+            self._ingest_tiles(session, tiles_to_ingest)
+
+    def _create_lower_zoom_level_tiles_in_memory(self, batch,
+            assume_clean_state):
+        exp_id = self.experiment_id
+        with tm.utils.ExperimentSession(exp_id, transaction=False) as session:
+            layer = session.query(tm.ChannelLayer).get(batch['layer_id'])
+            logger.info('processing layer for channel %s', layer.channel.name)
+            layer_id = layer.id
+            tile_size = layer.tile_size
+            depth = batch['block_depth']
+            block_size = 2**depth
+            max_zoomlevel_index = layer.maxzoom_level_index
+            max_row, max_column = layer.dimensions[max_zoomlevel_index]
+            logger.info(
+                'creating tiles at zoom levels %d to %d in memory',
+                max_zoomlevel_index - 1, max_zoomlevel_index - depth
+            )
+
+            tiles_to_ingest = list()
+            for row_offset, column_offset in batch['blocks']:
+                logger.debug(
+                    'process block: y=%d, x=%d', row_offset, column_offset
+                )
+                n_rows = min(block_size, max_row - row_offset)
+                n_columns = min(block_size, max_column - column_offset)
+                # Tiles at maxzoom level might not exist in case they did not
+                # fall into a region of the map occupied by an image.
+                # These are represented by background pixels.
+                pixels = np.zeros(
+                    (n_rows * tile_size, n_columns * tile_size), dtype=np.uint8
+                )
+                base_tiles = session.query(tm.ChannelLayerTile).\
+                    filter(
+                        tm.ChannelLayerTile.channel_layer_id == layer_id,
+                        tm.ChannelLayerTile.z == max_zoomlevel_index,
+                        tm.ChannelLayerTile.y >= row_offset,
+                        tm.ChannelLayerTile.y < row_offset + n_rows,
+                        tm.ChannelLayerTile.x >= column_offset,
+                        tm.ChannelLayerTile.x < column_offset + n_columns
+                    )
+                for base_tile in base_tiles:
+                    tile = base_tile.pixels
+                    y = (base_tile.y - row_offset) * tile_size
+                    x = (base_tile.x - column_offset) * tile_size
+                    height, width = tile.dimensions
+                    pixels[y:y+height, x:x+width] = tile.array
+
+                levels = pyramid.compute_block_levels(pixels, depth)
+                for i, level_pixels in enumerate(levels):
+                    level = max_zoomlevel_index - i - 1
+                    level_max_row, level_max_column = layer.dimensions[level]
+                    for r, c, array in pyramid.iter_tiles(
+                            level_pixels, tile_size):
+                        row = (row_offset >> (i + 1)) + r
+                        column = (column_offset >> (i + 1)) + c
+                        if row >= level_max_row or column >= level_max_column:
+                            continue
+                        logger.debug(
+                            'creating tile: z=%d, y=%d, x=%d',
+                            level, row, column
+                        )
+                        channel_layer_tile = tm.ChannelLayerTile(
+                            channel_layer_id=layer_id,
+                            z=level, y=row, x=column, pixels=PyramidTile(array)
+                        )
+                        tiles_to_ingest.append(channel_layer_tile)
+                        if len(tiles_to_ingest) >= batch['ingest_size']:
+                            self._ingest_tiles(session, tiles_to_ingest)
+
+            self._ingest_tiles(session, tiles_to_ingest)
 
     def run_job(self, batch, assume_clean_state=False):
         '''Creates 8-bit grayscale JPEG layer tiles.
@@ -596,6 +761,10 @@ class PyramidBuilder(WorkflowStepAPI):
         '''
         if batch['index'] == 0:
             self._create_maxzoom_level_tiles(batch, assume_clean_state)
+        elif 'blocks' in batch:
+            self._create_lower_zoom_level_tiles_in_memory(
+                batch, assume_clean_state
+            )
         else:
             self._create_lower_zoom_level_tiles(batch, assume_clean_state)
 
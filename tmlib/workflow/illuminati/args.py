@@ -28,6 +28,26 @@ class IlluminatiBatchArguments(BatchArguments):
         help='number of image files that should be processed per job'
     )
 
+    ingest_size = Argument(
+        type=int, default=1000, flag='ingest-size',
+        help='number of tiles that should be inserted into the database at once'
+    )
+
+    cache_size = Argument(
+        type=int, default=32, flag='cache-size',
+        help='''maximal number of preprocessed images that should be kept in
+            memory per job for creation of tiles spanning neighbouring images
+        '''
+    )
+
+    block_depth = Argument(
+        type=int, default=0, flag='block-depth',
+        help='''number of zoom levels below the base of the pyramid that
+            should be computed in memory for blocks of 2^depth x 2^depth base
+            tiles instead of tile by tile (zero disables in-memory computation)
+        '''
+    )
+
     align = Argument(
         type=bool, default=False, short_flag='a',
         help='whether images should be aligned between multiplexing cycles'
@@ -0,0 +1,90 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import logging
+import collections
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache(object):
+
+    '''Bounded cache for images that discards the least recently used
+    image once the maximum number of images is reached.
+
+    Examples
+    --------
+    >>> cache = ImageCache(2)
+    >>> cache.set(1, image)
+    >>> cache.get(1)
+    '''
+
+    def __init__(self, size):
+        '''
+        Parameters
+        ----------
+        size: int
+            maximal number of images that should be held in the cache
+        '''
+        if size < 1:
+            raise ValueError('Argument "size" must be a positive integer.')
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._images = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+    def get(self, key):
+        '''Gets an image from the cache and marks it as most recently used.
+
+        Parameters
+        ----------
+        key: hashable
+            identifier of the image, e.g. the ID of the corresponding file
+
+        Returns
+        -------
+        tmlib.image.Image
+            cached image or ``None`` if the image is not in the cache
+        '''
+        image = self._images.pop(key, None)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._images[key] = image
+        return image
+
+    def set(self, key, image):
+        '''Puts an image into the cache and discards the least recently used
+        image in case the cache is full.
+
+        Parameters
+        ----------
+        key: hashable
+            identifier of the image, e.g. the ID of the corresponding file
+        image: tmlib.image.Image
+            image that should be cached
+        '''
+        self._images.pop(key, None)
+        self._images[key] = image
+        while len(self._images) > self.size:
+            discarded_key, _ = self._images.popitem(last=False)
+            logger.debug('discard image %s from cache', discarded_key)
@@ -0,0 +1,132 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Utility functions for building pyramid zoom levels in memory.
+
+A *block* is a square region of ``2**depth`` x ``2**depth`` tiles at the
+maximum zoom level. Since tiles of lower zoom levels are computed from
+non-overlapping 2x2 neighbourhoods of tiles of the next higher level, all
+tiles of the `depth` levels below the base that fall into a block can be
+computed from the pixels of the block alone.
+'''
+import logging
+import itertools
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def downsample(array):
+    '''Shrinks a 2D array by a factor of two along both axes by averaging
+    non-overlapping 2x2 neighbourhoods of pixels.
+
+    Parameters
+    ----------
+    array: numpy.ndarray[numpy.uint8]
+        2D pixels array
+
+    Returns
+    -------
+    numpy.ndarray[numpy.uint8]
+        downsampled array
+
+    Note
+    ----
+    Rounding is equivalent to area interpolation of *OpenCV* for a scale
+    factor of exactly two. In case of an odd number of rows or columns,
+    the last row or column is discarded.
+    '''
+    height = (array.shape[0] // 2) * 2
+    width = (array.shape[1] // 2) * 2
+    a = array[:height, :width].astype(np.uint16)
+    out = a[0::2, 0::2] + a[1::2, 0::2]
+    out += a[0::2, 1::2]
+    out += a[1::2, 1::2]
+    out += 2
+    out >>= 2
+    return out.astype(np.uint8)
+
+
+def compute_block_levels(array, depth):
+    '''Computes all lower resolution representations of a block.
+
+    Parameters
+    ----------
+    array: numpy.ndarray[numpy.uint8]
+        pixels of the block at the maximum zoom level
+    depth: int
+        number of lower zoom levels that should be computed
+
+    Returns
+    -------
+    List[numpy.ndarray[numpy.uint8]]
+        downsampled pixels arrays, sorted from highest to lowest resolution
+    '''
+    levels = list()
+    for i in range(depth):
+        array = downsample(array)
+        levels.append(array)
+    return levels
+
+
+def iter_tiles(array, tile_size):
+    '''Chops a 2D array into tiles.
+
+    Parameters
+    ----------
+    array: numpy.ndarray
+        2D pixels array
+    tile_size: int
+        maximal number of pixels along each axis of a tile
+
+    Returns
+    -------
+    Generator[Tuple[Union[int, numpy.ndarray]]]
+        zero-based row and column index of the tile relative to `array` and
+        the corresponding pixels; tiles at the lower and right border of
+        `array` may be smaller than `tile_size`
+    '''
+    n_rows = int(np.ceil(array.shape[0] / float(tile_size)))
+    n_cols = int(np.ceil(array.shape[1] / float(tile_size)))
+    for r, c in itertools.product(range(n_rows), range(n_cols)):
+        y = r * tile_size
+        x = c * tile_size
+        yield (
+            r, c,
+            np.ascontiguousarray(array[y:y+tile_size, x:x+tile_size])
+        )
+
+
+def get_block_origins(n_rows, n_cols, depth):
+    '''Determines the coordinates of the upper left tile of each block.
+
+    Parameters
+    ----------
+    n_rows: int
+        number of tiles along the vertical axis at the maximum zoom level
+    n_cols: int
+        number of tiles along the horizontal axis at the maximum zoom level
+    depth: int
+        number of zoom levels spanned by a block
+
+    Returns
+    -------
+    List[Tuple[int]]
+        row and column index of the upper left tile of each block
+    '''
+    block_size = 2**depth
+    return list(itertools.product(
+        range(0, n_rows, block_size), range(0, n_cols, block_size)
+    ))
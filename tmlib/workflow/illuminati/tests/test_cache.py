@@ -0,0 +1,21 @@
+from tmlib.workflow.illuminati.cache import ImageCache
+
+
+def test_image_cache_discards_least_recently_used():
+    cache = ImageCache(2)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert 1 in cache
+    assert 2 not in cache
+    assert 3 in cache
+
+
+def test_image_cache_counts_hits_and_misses():
+    cache = ImageCache(1)
+    cache.set(1, 'a')
+    assert cache.get(1) == 'a'
+    assert cache.get(2) is None
+    assert cache.hits == 1
+    assert cache.misses == 1
@@ -0,0 +1,33 @@
+import numpy as np
+import cv2
+
+from tmlib.workflow.illuminati import pyramid
+
+
+def test_downsample_matches_area_interpolation():
+    array = np.random.randint(0, 256, (512, 768)).astype(np.uint8)
+    expected = cv2.resize(array, (384, 256), interpolation=cv2.INTER_AREA)
+    assert np.array_equal(pyramid.downsample(array), expected)
+
+
+def test_downsample_odd_dimensions():
+    array = np.ones((5, 7), dtype=np.uint8)
+    assert pyramid.downsample(array).shape == (2, 3)
+
+
+def test_compute_block_levels():
+    array = np.zeros((1024, 512), dtype=np.uint8)
+    levels = pyramid.compute_block_levels(array, 3)
+    assert [a.shape for a in levels] == [(512, 256), (256, 128), (128, 64)]
+
+
+def test_iter_tiles():
+    array = np.zeros((256, 384), dtype=np.uint8)
+    tiles = [(r, c, t.shape) for r, c, t in pyramid.iter_tiles(array, 256)]
+    assert tiles == [(0, 0, (256, 256)), (0, 1, (256, 128))]
+
+
+def test_get_block_origins():
+    assert pyramid.get_block_origins(5, 3, 1) == [
+        (0, 0), (0, 2), (2, 0), (2, 2), (4, 0), (4, 2)
+    ]
@@ -16,16 +16,19 @@
 import os
 import re
 import sys
+import glob
 import shutil
 import logging
+import traceback
 import subprocess
+import multiprocessing
 import numpy as np
 import pandas as pd
 import collections
 import shapely.geometry
 import shapely.ops
 from cached_property import cached_property
-from sqlalchemy.orm.exc import NoResultFound
+from natsort import natsorted
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import FLOAT
 from psycopg2 import ProgrammingError
@@ -41,10 +44,16 @@ from tmlib.writers import TextWriter
 from tmlib.models.types import ST_GeomFromText
 from tmlib.workflow.api import WorkflowStepAPI
 from tmlib.errors import PipelineDescriptionError
+from tmlib.errors import PipelineRunError
 from tmlib.errors import JobDescriptionError
 from tmlib.workflow.jterator.project import Project, AvailableModules
 from tmlib.workflow.jterator.module import ImageAnalysisModule
 from tmlib.workflow.jterator.handles import SegmentedObjects
+from tmlib.workflow.jterator.inputs import PipelineInputPlan
+from tmlib.workflow.jterator.cache import ModuleResultCache
+from tmlib.workflow.jterator.profiling import ModuleProfiler
+from tmlib.workflow.jterator.profiling import PROFILE_COLUMNS
+from tmlib.workflow.jterator.profiling import summarize_profiles
 from tmlib.workflow.jobs import SingleRunPhase
 from tmlib.workflow.jterator.jobs import DebugRunJob
 from tmlib.workflow import register_step_api
@@ -217,14 +226,16 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                 yield {
                     'id': j + 1,  # job IDs are one-based!
                     'site_ids': batch,
-                    'plot': args.plot
+                    'plot': args.plot,
+                    'cache': args.cache
                 }
 
     def delete_previous_job_output(self):
         '''Deletes all instances of
         :class:`MapobjectType <tmlib.models.mapobject.MapobjectType>`
         that were generated by a prior run of the same pipeline as well as all
-        children instances for the processed experiment.
+        children instances for the processed experiment as well as profiles
+        of modules.
         '''
         logger.info('delete existing mapobjects and mapobject types')
         with tm.utils.ExperimentSession(self.experiment_id, False) as session:
@@ -240,8 +251,35 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                 filter(tm.MapobjectType.id.in_(mapobject_type_ids)).\
                 delete()
 
-    def _load_pipeline_input(self, site_id):
+        logger.info('delete existing module profiles')
+        for f in glob.glob(os.path.join(self.log_location, '*.profile.csv')):
+            os.remove(f)
+
+    def _plan_pipeline_input(self, site_ids):
+        '''Fetches everything that is required to load pipeline inputs for
+        the given sites from the database.
+
+        Parameters
+        ----------
+        site_ids: List[int]
+            IDs of sites that should be processed
+
+        Returns
+        -------
+        tmlib.workflow.jterator.inputs.PipelineInputPlan
+        '''
+        plan = PipelineInputPlan(
+            self.experiment_id,
+            self.project.pipe.description.input.channels,
+            self.project.pipe.description.input.objects
+        )
+        plan.fetch(site_ids)
+        return plan
+
+    def _load_pipeline_input(self, site_id, plan=None):
         logger.info('load pipeline inputs')
+        if plan is None:
+            plan = self._plan_pipeline_input([site_id])
         # Use an in-memory store for pipeline data and only insert outputs
         # into the database once the whole pipeline has completed successfully.
         store = {
@@ -249,7 +287,9 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
             'pipe': dict(),
             'current_figure': list(),
             'objects': dict(),
-            'channels': list()
+            'channels': list(),
+            'digests': dict(),
+            'profile': list()
         }
 
         # Load the images, correct them if requested and align them if required.
@@ -258,91 +298,47 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
         # desired behavior.
         channel_input = self.project.pipe.description.input.channels
         objects_input = self.project.pipe.description.input.objects
-        with tm.utils.ExperimentSession(self.experiment_id) as session:
-            site = session.query(tm.Site).get(site_id)
-            y_offset, x_offset = site.aligned_offset
-            height = site.aligned_height
-            width = site.aligned_width
+        site = plan.get_site(site_id)
+        for ch in channel_input:
+            image_files = plan.get_image_files(site_id, ch.name)
+            n_tpoints = len({f.tpoint for f in image_files})
+            n_zplanes = len({f.zplane for f in image_files})
+            image_array = np.zeros(
+                (site.height, site.width, n_zplanes, n_tpoints),
+                plan.get_dtype(ch.name)
+            )
+            stats = plan.get_stats(ch.name)
 
-            for ch in channel_input:
-                channel = session.query(
-                        tm.Channel.bit_depth, tm.Channel.id
-                    ).\
-                    filter_by(name=ch.name).\
-                    one()
-                if channel.bit_depth == 16:
-                    dtype = np.uint16
-                elif channel.bit_depth == 8:
-                    dtype = np.uint8
-
-                records = session.query(tm.ChannelImageFile.tpoint).\
-                    filter_by(site_id=site.id,channel_id=channel.id).\
-                    distinct()
-                tpoints = [r.tpoint for r in records]
-                n_tpoints = len(tpoints)
-                records = session.query(tm.ChannelImageFile.zplane).\
-                    filter_by(site_id=site.id,channel_id=channel.id).\
-                    distinct()
-                zplanes = [r.zplane for r in records]
-                n_zplanes = len(zplanes)
-
-                image_array = np.zeros(
-                    (height, width, n_zplanes, n_tpoints), dtype
-                )
+            logger.info('load images for channel "%s"', ch.name)
+            for f in image_files:
+                logger.info('load image %d', f.id)
+                img = plan.load_image(f)
                 if ch.correct:
-                    logger.info(
-                        'load illumination statistics for channel "%s"', ch.name
-                    )
-                    try:
-                        stats_file = session.query(tm.IllumstatsFile).\
-                            join(tm.Channel).\
-                            filter(tm.Channel.name == ch.name).\
-                            one()
-                    except NoResultFound:
-                        raise PipelineDescriptionError(
-                            'No illumination statistics file found for '
-                            'channel "%s"' % ch.name
-                        )
-                    stats = stats_file.get()
-                else:
-                    stats = None
+                    logger.info('correct image %d', f.id)
+                    img = img.correct(stats)
+                logger.debug('align image %d', f.id)
+                img = img.align()  # shifted and cropped!
+                image_array[:, :, f.zplane, f.tpoint] = img.array
+            store['pipe'][ch.name] = image_array
 
-                logger.info('load images for channel "%s"', ch.name)
-                image_files = session.query(tm.ChannelImageFile).\
-                    filter_by(site_id=site.id, channel_id=channel.id).\
-                    all()
-                for f in image_files:
-                    logger.info('load image %d', f.id)
-                    img = f.get()
-                    if ch.correct:
-                        logger.info('correct image %d', f.id)
-                        img = img.correct(stats)
-                    logger.debug('align image %d', f.id)
-                    img = img.align()  # shifted and cropped!
-                    image_array[:, :, f.zplane, f.tpoint] = img.array
-                store['pipe'][ch.name] = image_array
-
-            for obj in objects_input:
-                mapobject_type = session.query(tm.MapobjectType).\
-                    filter_by(name=obj.name).\
-                    one()
-                polygons = list()
-                for t in sorted(tpoints):
-                    zpolys = list()
-                    for z in sorted(zplanes):
-                        zpolys.append(
-                            mapobject_type.get_segmentations_per_site(
-                                site_id=site.id, tpoint=t, zplane=z
-                            )
-                        )
-                    polygons.append(zpolys)
+        for obj in objects_input:
+            tpoints, zplanes = plan.get_object_planes(obj.name)
+            polygons = list()
+            for t in tpoints:
+                zpolys = list()
+                for z in zplanes:
+                    zpolys.append(
+                        plan.get_segmentations(obj.name, site_id, t, z)
+                    )
+                polygons.append(zpolys)
 
-                segm_obj = SegmentedObjects(obj.name, obj.name)
-                segm_obj.add_polygons(
-                    polygons, y_offset, x_offset, (height, width)
-                )
-                store['objects'][segm_obj.name] = segm_obj
-                store['pipe'][segm_obj.name] = segm_obj.value
+            segm_obj = SegmentedObjects(obj.name, obj.name)
+            segm_obj.add_polygons(
+                polygons, site.y_offset, site.x_offset,
+                (site.height, site.width)
+            )
+            store['objects'][segm_obj.name] = segm_obj
+            store['pipe'][segm_obj.name] = segm_obj.value
 
         # Remove single-dimensions from image arrays.
         # NOTE: It would be more consistent to preserve shape, but most people
@@ -353,14 +349,34 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
 
         return store
 
-    def _run_pipeline(self, store, site_id, plot=False):
+    @autocreate_directory_property
+    def cache_location(self):
+        '''str: location where outputs of modules are cached'''
+        return os.path.join(self.step_location, 'cache')
+
+    def _run_pipeline(self, store, site_id, plot=False, cache=None):
         logger.info('run pipeline')
         for i, module in enumerate(self.pipeline):
-            logger.info('run module "%s"', module.name)
             # When plotting is not deriberately activated it defaults to
             # headless mode
             module.update_handles(store, headless=not plot)
-            module.run(self._engines[module.language])
+            with ModuleProfiler(site_id, module) as profiler:
+                if cache is not None:
+                    key = cache.build_key(module, store)
+                    profiler.cached = cache.get(key, module)
+                    if profiler.cached:
+                        logger.info(
+                            'skip module "%s", outputs are cached', module.name
+                        )
+                    else:
+                        logger.info('run module "%s"', module.name)
+                        module.run(self._engines[module.language])
+                        cache.set(key, module)
+                    cache.update_digests(key, module, store)
+                else:
+                    logger.info('run module "%s"', module.name)
+                    module.run(self._engines[module.language])
+            store['profile'].append(profiler.record)
             store = module.update_store(store)
 
             plotting_active = [
@@ -387,7 +403,8 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
         command.extend(['debug', '--site', str(site_id), '--plot'])
         return command
 
-    def _save_pipeline_outputs(self, store, assume_clean_state):
+    def _save_pipeline_outputs(self, store, assume_clean_state,
+            statistics=None):
         logger.info('save pipeline outputs')
         objects_output = self.project.pipe.description.output.objects
         for item in objects_output:
@@ -401,6 +418,7 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
             segmentation_layer_ids = dict()
             objects_to_save = dict()
             feature_ids = collections.defaultdict(dict)
+            array_indices = dict()
             for obj_name, segm_objs in store['objects'].iteritems():
                 if segm_objs.save:
                     logger.info('objects of type "%s" are saved', obj_name)
@@ -425,6 +443,10 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                         is_aggregate=False
                     )
                     feature_ids[obj_name][feature_name] = feature.id
+                if mapobject_type.array_feature_values:
+                    array_indices[obj_name] = self._assign_array_indices(
+                        mapobject_type.id
+                    )
 
                 for (t, z), plane in segm_objs.iter_planes():
                     segmentation_layer = session.get_or_create(
@@ -486,6 +508,10 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                     'add segmentations for objects of type "%s"', obj_name
                 )
                 mapobject_segmentations = list()
+                # Objects without a valid segmentation are removed in the
+                # collect phase and must not contribute to statistics.
+                segmented_labels = set()
+                invalid_labels = set()
                 if segm_objs.represent_as_polygons:
                     logger.debug('represent segmented objects as polygons')
                     iterator = segm_objs.iter_polygons(y_offset, x_offset)
@@ -503,6 +529,9 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                             # At the moment we remove the corresponding
                             # mapobjects in the collect phase.
                             continue
+                        if not polygon.is_valid:
+                            invalid_labels.add(label)
+                        segmented_labels.add(label)
                         mapobject_segmentations.append(
                             tm.MapobjectSegmentation(
                                 partition_key=store['site_id'], label=label,
@@ -522,6 +551,7 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                             'add segmentation for object #%d at '
                             'tpoint %d and zplane %d', label, t, z
                         )
+                        segmented_labels.add(label)
                         mapobject_segmentations.append(
                             tm.MapobjectSegmentation(
                                 partition_key=store['site_id'], label=label,
@@ -534,12 +564,12 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                         )
                 logger.info('insert segmentations into database')
                 session.bulk_ingest(mapobject_segmentations)
+                segmented_labels -= invalid_labels
 
                 logger.info(
                     'add feature values for objects of type "%s"', obj_name
                 )
                 logger.debug('round feature values to 6 decimals')
-                feature_values = list()
                 for t, data in enumerate(segm_objs.measurements):
                     data = data.round(6)  # single!
                     if data.empty:
@@ -551,24 +581,123 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                     elif data.shape[0] > len(mapobject_ids):
                         # Not sure this could happen.
                         logger.error('too many feature values')
-                    column_lut = feature_ids[obj_name]
-                    for label, c in data.rename(columns=column_lut).iterrows():
-                        logger.debug(
-                            'add values for mapobject #%d at time point %d',
-                            label, t
+                    logger.debug(
+                        'insert feature values for time point %d into db table',
+                        t
+                    )
+                    ids = [mapobject_ids[l] for l in data.index]
+                    if statistics is not None:
+                        self._update_feature_statistics(
+                            statistics,
+                            data[data.index.isin(list(segmented_labels))],
+                            feature_ids[obj_name], t
                         )
-                        values = dict(
-                            zip(c.index.astype(str), c.values.astype(str))
+                    if obj_name in array_indices:
+                        # Columns are ordered according to the array index
+                        # of features and values of features that were
+                        # not measured by the pipeline are missing.
+                        column_lut = array_indices[obj_name]
+                        n_features = max(column_lut.values()) + 1
+                        data = data.rename(columns=column_lut).\
+                            reindex(columns=range(n_features))
+                        session.bulk_ingest_dataframe(
+                            tm.FeatureValues, data,
+                            partition_key=store['site_id'],
+                            mapobject_ids=ids, tpoint=t, as_array=True
                         )
-                        feature_values.append(
-                            tm.FeatureValues(
-                                partition_key=store['site_id'],
-                                mapobject_id=mapobject_ids[label],
-                                tpoint=t, values=values
-                            )
+                    else:
+                        column_lut = feature_ids[obj_name]
+                        session.bulk_ingest_dataframe(
+                            tm.FeatureValues, data.rename(columns=column_lut),
+                            partition_key=store['site_id'],
+                            mapobject_ids=ids, tpoint=t
                         )
-                logger.debug('insert feature values into db table')
-                session.bulk_ingest(feature_values)
+
+    @staticmethod
+    def _update_feature_statistics(statistics, data, feature_ids, tpoint):
+        # Statistics of all sites of a job are merged on the fly, such that
+        # memory consumption doesn't depend on the number of sites.
+        for name in data.columns:
+            key = (feature_ids[name], tpoint)
+            summary = tm.FeatureStatistics.summarize(data[name].values)
+            if key in statistics:
+                summary = tm.FeatureStatistics.merge(
+                    [statistics[key], summary]
+                )
+            statistics[key] = summary
+
+    def _save_feature_statistics(self, batch, statistics):
+        # Jobs of the debug mode don't have an ID.
+        if 'id' not in batch:
+            return
+        logger.info('save statistics of %d feature values', len(statistics))
+        with tm.utils.ExperimentSession(self.experiment_id) as session:
+            # Statistics of a previous submission of the same job are
+            # replaced.
+            session.query(tm.FeatureStatistics).\
+                filter_by(job_id=batch['id']).\
+                delete()
+            session.add_all([
+                tm.FeatureStatistics(
+                    feature_id=feature_id, tpoint=tpoint, job_id=batch['id'],
+                    **summary
+                )
+                for (feature_id, tpoint), summary in statistics.iteritems()
+            ])
+
+    def _merge_feature_statistics(self):
+        logger.info('merge statistics of feature values of all jobs')
+        with tm.utils.ExperimentSession(self.experiment_id) as session:
+            records = session.query(tm.FeatureStatistics).\
+                filter(tm.FeatureStatistics.job_id != None).\
+                all()
+            summaries = collections.defaultdict(list)
+            for r in records:
+                summaries[(r.feature_id, r.tpoint)].append({
+                    'count': r.count, 'nan_count': r.nan_count,
+                    'minimum': r.minimum, 'maximum': r.maximum,
+                    'mean': r.mean, 'histogram_bins': r.histogram_bins,
+                    'histogram': r.histogram
+                })
+            session.query(tm.FeatureStatistics).\
+                filter(tm.FeatureStatistics.job_id == None).\
+                delete()
+            session.add_all([
+                tm.FeatureStatistics(
+                    feature_id=feature_id, tpoint=tpoint,
+                    **tm.FeatureStatistics.merge(s)
+                )
+                for (feature_id, tpoint), s in summaries.iteritems()
+            ])
+
+    def _assign_array_indices(self, mapobject_type_id):
+        # Features that are new to a mapobject type, which stores feature
+        # values as arrays, get appended to the arrays. The mapobject type
+        # is locked to prevent concurrently running jobs from assigning the
+        # same index to different features. This requires a separate
+        # session, since the lock would otherwise be released right away
+        # in autocommit mode.
+        with tm.utils.ExperimentSession(self.experiment_id) as session:
+            session.query(tm.MapobjectType.id).\
+                filter_by(id=mapobject_type_id).\
+                with_for_update().\
+                one()
+            features = session.query(tm.Feature).\
+                filter_by(mapobject_type_id=mapobject_type_id).\
+                order_by(tm.Feature.id).\
+                all()
+            indices = [
+                f.array_index for f in features if f.array_index is not None
+            ]
+            n = max(indices) + 1 if indices else 0
+            for f in features:
+                if f.array_index is None:
+                    logger.debug(
+                        'assign array index %d to feature "%s"', n, f.name
+                    )
+                    f.array_index = n
+                    n += 1
+            return {f.name: f.array_index for f in features}
 
     def create_debug_run_phase(self, submission_id):
         '''Creates a job collection for the debug "run" phase of the step.
@@ -648,15 +777,59 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
             job_collection.add(job)
         return job_collection
 
-    def run_job(self, batch, assume_clean_state):
+    def _get_run_job_args(self, **args):
+        '''
+        Let the job process its sites in parallel with one worker process
+        per requested core.
+        '''
+        n_workers = args.get('requested_cores') or 1
+        if n_workers > 1:
+            args['arguments'] = args['arguments'] + [
+                '--workers', str(n_workers)
+            ]
+        return args
+
+    def _log_module_timings(self):
+        for module in self.pipeline:
+            if module.import_time is None:
+                continue
+            logger.info(
+                'module "%s": import %.3f s, exec %.3f s (total, %d sites)',
+                module.name, module.import_time, sum(module.exec_times),
+                len(module.exec_times)
+            )
+
+    def _get_result_cache(self, batch):
+        if not batch.get('cache', False):
+            return None
+        logger.info('cache module outputs in: %s', self.cache_location)
+        return ModuleResultCache(self.cache_location)
+
+    def _build_profile_filename(self, job_id):
+        return os.path.join(
+            self.log_location,
+            '%s_run_%.7d.profile.csv' % (self.step_name, job_id)
+        )
+
+    def _write_profile(self, batch, profile):
+        # Jobs of the debug mode don't have an ID.
+        if 'id' not in batch:
+            return
+        filename = self._build_profile_filename(batch['id'])
+        logger.info('write profile of modules to file: %s', filename)
+        profile = pd.DataFrame(profile, columns=PROFILE_COLUMNS)
+        profile.to_csv(filename, index=False, float_format='%.4f')
+
+    def run_job(self, batch, assume_clean_state, n_workers=1):
         '''Runs the pipeline, i.e. executes modules sequentially. After
         successful completion of the pipeline, instances of
         :class:`MapobjectType <tmlib.models.mapobject.MapobjectType>`,
         :class:`Mapobject <tmlib.models.mapobject.Mapobject>`,
         :class:`SegmentationLayer <tmlib.models.layer.SegmentationLayer>`,
         :class:`MapobjectSegmentation <tmlib.models.mapobject.MapobjectSegmentation>`,
-        :class:`Feature <tmlib.models.feature.Feature>` and
-        :class:`FeatureValues <tmlib.models.feature.FeatureValues>`
+        :class:`Feature <tmlib.models.feature.Feature>`,
+        :class:`FeatureValues <tmlib.models.feature.FeatureValues>` and
+        :class:`FeatureStatistics <tmlib.models.feature.FeatureStatistics>`
         are created and persisted in the database for subsequent
         visualization and analysis.
 
@@ -666,23 +839,212 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
             job description
         assume_clean_state: bool, optional
             assume that output of previous runs has already been cleaned up
+        n_workers: int, optional
+            number of processes that should run the pipeline for different
+            sites in parallel (default: ``1``)
+
+        See also
+        --------
+        :meth:`tmlib.workflow.jterator.api.ImageAnalysisPipelineEngine._run_job_in_parallel`
         '''
+        if n_workers > 1 and len(batch['site_ids']) > 1 and not batch['plot']:
+            return self._run_job_in_parallel(
+                batch, assume_clean_state, n_workers
+            )
+
         logger.info('handle pipeline input')
 
         self.start_engines()
+        # Modules are loaded only once and reused for all sites.
+        for module in self.pipeline:
+            module.load(self._engines[module.language])
+
+        plan = self._plan_pipeline_input(batch['site_ids'])
+        cache = self._get_result_cache(batch)
 
         # Enable debugging of pipelines by providing the full path to images.
         # This requires a work around for "plot" and "job_id" arguments.
+        profile = list()
+        statistics = dict()
         for site_id in batch['site_ids']:
             logger.info('process site %d', site_id)
-            store = self._load_pipeline_input(site_id)
-            store = self._run_pipeline(store, site_id, batch['plot'])
-            self._save_pipeline_outputs(store, assume_clean_state)
+            store = self._load_pipeline_input(site_id, plan)
+            store = self._run_pipeline(store, site_id, batch['plot'], cache)
+            self._save_pipeline_outputs(store, assume_clean_state, statistics)
+            profile.extend(store['profile'])
+
+        self._log_module_timings()
+        self._write_profile(batch, profile)
+        self._save_feature_statistics(batch, statistics)
+
+    def _load_pipeline_inputs_into_queue(self, site_ids, queue, n_workers):
+        try:
+            plan = self._plan_pipeline_input(site_ids)
+        except Exception:
+            queue.put((None, None, traceback.format_exc()))
+            site_ids = list()
+        for site_id in site_ids:
+            logger.info('load pipeline input for site %d', site_id)
+            try:
+                store = self._load_pipeline_input(site_id, plan)
+            except Exception:
+                queue.put((site_id, None, traceback.format_exc()))
+                break
+            queue.put((site_id, store, None))
+        for i in range(n_workers):
+            queue.put(None)
+
+    def _run_pipeline_from_queue(self, input_queue, output_queue, batch):
+        try:
+            self.start_engines()
+            for module in self.pipeline:
+                module.load(self._engines[module.language])
+            cache = self._get_result_cache(batch)
+        except Exception:
+            output_queue.put((None, None, traceback.format_exc()))
+            output_queue.put(None)
+            return
+        while True:
+            item = input_queue.get()
+            if item is None:
+                break
+            site_id, store, error = item
+            if error is None:
+                logger.info('process site %d', site_id)
+                try:
+                    store = self._run_pipeline(
+                        store, site_id, batch['plot'], cache
+                    )
+                except Exception:
+                    store = None
+                    error = traceback.format_exc()
+            output_queue.put((site_id, store, error))
+        self._log_module_timings()
+        output_queue.put(None)
+
+    def _run_job_in_parallel(self, batch, assume_clean_state, n_workers):
+        '''Runs the pipeline for several sites in parallel, such that
+        loading of pipeline inputs, execution of modules and saving of
+        pipeline outputs overlap.
+
+        A separate process loads the inputs of the pipeline into a bounded
+        queue, from which `n_workers` processes take them to run the
+        pipeline. Outputs of the workers are saved by the current process,
+        which thus is the only one that writes into the database.
+
+        Parameters
+        ----------
+        batch: dict
+            job description
+        assume_clean_state: bool
+            assume that output of previous runs has already been cleaned up
+        n_workers: int
+            number of processes that should run the pipeline
+
+        Raises
+        ------
+        tmlib.errors.PipelineRunError
+            when loading of pipeline inputs or running of the pipeline failed
+            for any site
+
+        Note
+        ----
+        Engines for non-Python languages are started and modules are
+        loaded once per worker process.
+        '''
+        site_ids = batch['site_ids']
+        n_workers = min(n_workers, len(site_ids))
+        logger.info(
+            'process %d sites with %d worker processes',
+            len(site_ids), n_workers
+        )
+        input_queue = multiprocessing.Queue(2 * n_workers)
+        output_queue = multiprocessing.Queue(2 * n_workers)
+        # Child processes must not share database connections.
+        tm.utils.dispose_db_engines()
+        processes = [
+            multiprocessing.Process(
+                target=self._load_pipeline_inputs_into_queue,
+                args=(site_ids, input_queue, n_workers)
+            )
+        ]
+        for i in range(n_workers):
+            processes.append(
+                multiprocessing.Process(
+                    target=self._run_pipeline_from_queue,
+                    args=(input_queue, output_queue, batch)
+                )
+            )
+        for p in processes:
+            p.daemon = True
+            p.start()
+        profile = list()
+        statistics = dict()
+        try:
+            n_finished_workers = 0
+            while n_finished_workers < n_workers:
+                item = output_queue.get()
+                if item is None:
+                    n_finished_workers += 1
+                    continue
+                site_id, store, error = item
+                if error is not None:
+                    raise PipelineRunError(
+                        'Pipeline failed for site %s:\n%s' % (site_id, error)
+                    )
+                logger.info('save pipeline outputs of site %d', site_id)
+                self._save_pipeline_outputs(
+                    store, assume_clean_state, statistics
+                )
+                profile.extend(store['profile'])
+        finally:
+            for p in processes:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+        self._write_profile(batch, profile)
+        self._save_feature_statistics(batch, statistics)
+
+    def _summarize_profiles(self):
+        filenames = glob.glob(
+            os.path.join(self.log_location, '*_run_*.profile.csv')
+        )
+        if not filenames:
+            logger.info('no module profiles found')
+            return
+        logger.info('summarize profiles of %d jobs', len(filenames))
+        profiles = list()
+        for f in natsorted(filenames):
+            profile = pd.read_csv(f)
+            profile['job_id'] = int(
+                re.search(r'_run_(\d+)\.profile\.csv$', f).group(1)
+            )
+            profiles.append(profile)
+        profiles = pd.concat(profiles, ignore_index=True)
+        summary = summarize_profiles(profiles)
+        jobs = profiles.groupby('job_id')
+        logger.info(
+            'wall time per job: mean %.1f s, max %.1f s',
+            jobs['wall_time'].sum().mean(), jobs['wall_time'].sum().max()
+        )
+        for process, records in profiles.groupby('process'):
+            logger.info(
+                'peak RSS of %s processes per job: max %.1f MB', process,
+                records.groupby('job_id')['peak_rss'].max().max() / float(2**20)
+            )
+        logger.info('pipeline performance summary:\n%s', summary.to_string())
+        filename = os.path.join(
+            self.log_location, '%s_collect.profile.csv' % self.step_name
+        )
+        logger.info('write pipeline performance summary to file: %s', filename)
+        summary.to_csv(filename, index_label='module', float_format='%.4f')
 
     def collect_job_output(self, batch):
         '''Computes the optimal representation of each
         :class:`SegmentationLayer <tmlib.models.layer.SegmentationLayer>` on the
-        map for zoomable visualization.
+        map for zoomable visualization and merges
+        :class:`FeatureStatistics <tmlib.models.feature.FeatureStatistics>`
+        of all jobs.
 
         Parameters
         ----------
@@ -690,6 +1052,8 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
             job description
         '''
 
+        self._summarize_profiles()
+
         logger.info('compute zoom level thresholds for mapobjects')
         with tm.utils.ExperimentSession(self.experiment_id, False) as session:
             experiment = session.query(tm.Experiment.pyramid_depth).one()
@@ -752,6 +1116,8 @@ class ImageAnalysisPipelineEngine(WorkflowStepAPI):
                     filter(tm.Mapobject.id.in_(mapobject_ids)).\
                     delete()
 
+        self._merge_feature_statistics()
+
     @staticmethod
     def _add_feature(conn, name, mapobject_type_id, is_aggregate):
         conn.execute('''
@@ -33,6 +33,13 @@ class JteratorBatchArguments(BatchArguments):
         default=100, flag='batch-size', short_flag='b'
     )
 
+    cache = Argument(
+        type=bool, default=False,
+        help='whether outputs of modules should be cached, such that '
+             'modules whose source and inputs did not change are not '
+             'rerun upon resubmission'
+    )
+
 
 @register_step_submission_args('jterator')
 class JteratorSubmissionArguments(SubmissionArguments):
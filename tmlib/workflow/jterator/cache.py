@@ -0,0 +1,306 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Content-addressed cache for outputs of jterator modules.
+
+The key of a module call is the digest of the module source code, the values
+of its input handles and the description of its output handles.
+Piped input values are represented by the digest of their lineage, i.e. the
+key of the module call that produced them, or by the digest of their content
+in case they were loaded from the database. Consequently, a change of a module
+invalidates the cached outputs of the module and of all modules downstream
+of it, while outputs of upstream modules can be reused.
+'''
+import os
+import json
+import errno
+import hashlib
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+
+from tmlib.workflow.jterator import handles as hdls
+
+logger = logging.getLogger(__name__)
+
+#: int: default maximal size of the cache in bytes
+MAX_CACHE_SIZE = 4 * 2**30
+
+
+def compute_value_digest(value):
+    '''Computes the digest of a value based on its content.
+
+    Parameters
+    ----------
+    value: Union[numpy.ndarray, object]
+        array or any other value with a unique representation
+
+    Returns
+    -------
+    str
+        hexadecimal SHA-1 digest
+    '''
+    sha = hashlib.sha1()
+    if isinstance(value, np.ndarray):
+        sha.update(str(value.dtype))
+        sha.update(str(value.shape))
+        sha.update(np.ascontiguousarray(value).data)
+    else:
+        sha.update(repr(value))
+    return sha.hexdigest()
+
+
+class ModuleResultCache(object):
+
+    '''Cache for values of output handles of
+    :class:`ImageAnalysisModule <tmlib.workflow.jterator.module.ImageAnalysisModule>`
+    instances, which stores each entry in a separate *npz* file and
+    discards least recently used entries once the size of the cache exceeds
+    the maximally allowed size.
+
+    Examples
+    --------
+    >>> cache = ModuleResultCache('/tmp/cache')
+    >>> module.update_handles(store)
+    >>> key = cache.build_key(module, store)
+    >>> if not cache.get(key, module):
+    >>>     module.run()
+    >>>     cache.set(key, module)
+    >>> cache.update_digests(key, module, store)
+    >>> store = module.update_store(store)
+    '''
+
+    def __init__(self, location, max_size=MAX_CACHE_SIZE):
+        '''
+        Parameters
+        ----------
+        location: str
+            absolute path to the directory where cached entries are stored
+        max_size: int, optional
+            maximal total size of cached entries in bytes
+            (default: :const:`MAX_CACHE_SIZE`)
+        '''
+        self.location = location
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._source_digests = dict()
+        if not os.path.exists(self.location):
+            try:
+                os.makedirs(self.location)
+            except OSError as error:
+                # Another process may have created the directory in between.
+                if error.errno != errno.EEXIST:
+                    raise
+
+    def _get_source_digest(self, source_file):
+        if source_file not in self._source_digests:
+            with open(source_file, 'rb') as f:
+                self._source_digests[source_file] = hashlib.sha1(
+                    f.read()
+                ).hexdigest()
+        return self._source_digests[source_file]
+
+    def build_key(self, module, store):
+        '''Builds the key for a call of a module. Values of input handles
+        must have been updated beforehand.
+
+        Parameters
+        ----------
+        module: tmlib.workflow.jterator.module.ImageAnalysisModule
+            module that should be called
+        store: dict
+            in-memory key-value store of the pipeline, whose "digests"
+            item keeps track of the digest of each piped value
+
+        Returns
+        -------
+        str
+            hexadecimal SHA-1 digest
+        '''
+        sha = hashlib.sha1()
+        sha.update(self._get_source_digest(module.source_file))
+        for handle in module.handles.input:
+            sha.update(handle.name)
+            if isinstance(handle, hdls.PipeHandle):
+                digests = store.setdefault('digests', dict())
+                if handle.key not in digests:
+                    digests[handle.key] = compute_value_digest(handle.value)
+                sha.update(digests[handle.key])
+            else:
+                sha.update(repr(handle.value))
+        for handle in module.handles.output:
+            sha.update(repr(sorted(handle.to_dict().items())))
+        return sha.hexdigest()
+
+    def update_digests(self, key, module, store):
+        '''Records the digests of values of output handles of a module in
+        `store`, such that calls of downstream modules can be identified.
+
+        Parameters
+        ----------
+        key: str
+            key of the call of `module`
+        module: tmlib.workflow.jterator.module.ImageAnalysisModule
+            module that was called
+        store: dict
+            in-memory key-value store of the pipeline
+        '''
+        digests = store.setdefault('digests', dict())
+        for handle in module.handles.output:
+            if isinstance(handle, hdls.PipeHandle):
+                digests[handle.key] = hashlib.sha1(
+                    key + handle.name
+                ).hexdigest()
+
+    def _get_filename(self, key):
+        return os.path.join(self.location, '%s.npz' % key)
+
+    def get(self, key, module):
+        '''Assigns cached values to output handles of a module.
+
+        Parameters
+        ----------
+        key: str
+            key of the call of `module`
+        module: tmlib.workflow.jterator.module.ImageAnalysisModule
+            module whose output handles should be updated
+
+        Returns
+        -------
+        bool
+            whether the values were found in the cache
+        '''
+        filename = self._get_filename(key)
+        try:
+            with np.load(filename) as data:
+                values = self._deserialize(data)
+            # Mark entry as most recently used.
+            os.utime(filename, None)
+        except (IOError, OSError, KeyError, ValueError):
+            self.misses += 1
+            return False
+        for handle in module.handles.output:
+            handle.value = values[handle.name]
+        self.hits += 1
+        return True
+
+    def set(self, key, module):
+        '''Caches values of output handles of a module and discards least
+        recently used entries in case the cache exceeds its maximal size.
+
+        Parameters
+        ----------
+        key: str
+            key of the call of `module`
+        module: tmlib.workflow.jterator.module.ImageAnalysisModule
+            module whose output handles should be cached
+
+        Note
+        ----
+        Values must be cached before the store is updated, because
+        :meth:`update_store <tmlib.workflow.jterator.module.ImageAnalysisModule.update_store>`
+        modifies measurements in place.
+        '''
+        arrays = self._serialize(module.handles.output)
+        if arrays is None:
+            logger.debug(
+                'outputs of module "%s" cannot be cached', module.name
+            )
+            return
+        # Write into a temporary file first, such that concurrent processes
+        # never read incomplete entries.
+        fd, tmp_filename = tempfile.mkstemp(
+            suffix='.tmp', dir=self.location
+        )
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmp_filename, self._get_filename(key))
+        self._evict()
+
+    def _evict(self):
+        entries = list()
+        for name in os.listdir(self.location):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.location, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total_size = sum([e[1] for e in entries])
+        for mtime, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.debug('discard cached module outputs %s', name)
+            try:
+                os.remove(os.path.join(self.location, name))
+            except OSError:
+                continue
+            total_size -= size
+
+    @staticmethod
+    def _serialize(handles):
+        manifest = list()
+        arrays = dict()
+        for i, handle in enumerate(handles):
+            value = handle.value
+            if isinstance(value, np.ndarray):
+                if value.dtype == np.object:
+                    return None
+                arrays['h%d' % i] = value
+                manifest.append({'name': handle.name, 'kind': 'array'})
+            elif isinstance(handle, hdls.Measurement):
+                for t, df in enumerate(value):
+                    if df.values.dtype == np.object:
+                        return None
+                    arrays['h%d_%d_values' % (i, t)] = df.values
+                    arrays['h%d_%d_index' % (i, t)] = df.index.values
+                    arrays['h%d_%d_columns' % (i, t)] = np.array(
+                        df.columns.tolist(), dtype=str
+                    )
+                manifest.append({
+                    'name': handle.name, 'kind': 'measurement',
+                    'n': len(value)
+                })
+            elif isinstance(value, basestring):
+                manifest.append({
+                    'name': handle.name, 'kind': 'string', 'value': value
+                })
+            else:
+                return None
+        arrays['manifest'] = np.array(json.dumps(manifest))
+        return arrays
+
+    @staticmethod
+    def _deserialize(data):
+        values = dict()
+        manifest = json.loads(str(data['manifest']))
+        for i, item in enumerate(manifest):
+            if item['kind'] == 'array':
+                values[item['name']] = data['h%d' % i]
+            elif item['kind'] == 'measurement':
+                values[item['name']] = [
+                    pd.DataFrame(
+                        data['h%d_%d_values' % (i, t)],
+                        index=data['h%d_%d_index' % (i, t)],
+                        columns=data['h%d_%d_columns' % (i, t)].tolist()
+                    )
+                    for t in range(item['n'])
+                ]
+            else:
+                values[item['name']] = item['value']
+        return values
@@ -72,15 +72,19 @@ class Jterator(WorkflowStepCLI):
             type=bool,
             help='assume that previous outputs have been cleaned up',
             flag='assume-clean-state', default=False
+        ),
+        n_workers=Argument(
+            type=int, default=1, flag='workers',
+            help='number of processes that should process sites in parallel'
         )
     )
-    def run(self, job_id, assume_clean_state):
+    def run(self, job_id, assume_clean_state, n_workers):
         self._print_logo()
         api = self.api_instance
         logger.info('get batch for job #%d', job_id)
         batch = api.get_run_batch(job_id)
         logger.info('run job #%d' % job_id)
-        api.run_job(batch, assume_clean_state)
+        api.run_job(batch, assume_clean_state, n_workers)
 
     @climethod(
         help='runs an invidiual site on the local machine for debugging',
@@ -98,7 +102,9 @@ class Jterator(WorkflowStepCLI):
         api = self.api_instance
         logger.info('DEBUG mode')
         logger.info('create debug batch for site %d', site_id)
-        batch = {'site_ids': [site_id], 'plot': plot}
+        # Outputs of modules are cached, such that only modules that were
+        # changed since the last debug run and their downstream modules rerun.
+        batch = {'site_ids': [site_id], 'plot': plot, 'cache': True}
         api.run_job(batch, assume_clean_state=False)
 
     @climethod(help='removes an existing project')
@@ -0,0 +1,186 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Exchange of arrays between jterator and the Matlab engine.
+
+The Matlab engine runs in a separate process and
+``engine.put()`` serializes arrays through a pipe. Large arrays are instead
+written once to a memory-mapped file, preferably on a shared-memory file
+system, from which Matlab maps them via ``memmapfile``. Arrays are written
+in column-major order, such that Matlab can read them in place.
+'''
+import os
+import shutil
+import logging
+import tempfile
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+#: int: minimal size in bytes of arrays that are handed over via files
+MEMMAP_THRESHOLD = 2**20
+
+#: Dict[numpy.dtype, str]: Matlab classes for data types supported by
+#: ``memmapfile``
+MATLAB_CLASSES = {
+    np.dtype(np.uint8): 'uint8',
+    np.dtype(np.uint16): 'uint16',
+    np.dtype(np.uint32): 'uint32',
+    np.dtype(np.uint64): 'uint64',
+    np.dtype(np.int8): 'int8',
+    np.dtype(np.int16): 'int16',
+    np.dtype(np.int32): 'int32',
+    np.dtype(np.int64): 'int64',
+    np.dtype(np.float32): 'single',
+    np.dtype(np.float64): 'double',
+}
+
+
+def get_shared_memory_directory():
+    '''Gets a directory that resides in memory if available.
+
+    Returns
+    -------
+    str
+        ``/dev/shm`` if it exists and is writable, otherwise the default
+        temporary directory
+    '''
+    shm_dir = '/dev/shm'
+    if os.path.isdir(shm_dir) and os.access(shm_dir, os.W_OK):
+        return shm_dir
+    return tempfile.gettempdir()
+
+
+class MatlabArrayExchange(object):
+
+    '''Class for handing over arguments to and from the Matlab engine,
+    which keeps track of the number of bytes that are copied.
+
+    Examples
+    --------
+    >>> with MatlabArrayExchange(engine) as exchange:
+    >>>     exchange.put('image', image)
+    >>>     engine.eval('mask = image > 0;')
+    >>>     mask = exchange.get('mask')
+    '''
+
+    def __init__(self, engine, directory=None, threshold=MEMMAP_THRESHOLD):
+        '''
+        Parameters
+        ----------
+        engine: matlab_wrapper.matlab_session.MatlabSession
+            Matlab engine
+        directory: str, optional
+            directory in which memory-mapped files should be created
+            (defaults to the value of :func:`get_shared_memory_directory`)
+        threshold: int, optional
+            minimal number of bytes of an array to be handed over via
+            a memory-mapped file (default: :const:`MEMMAP_THRESHOLD`)
+        '''
+        self.engine = engine
+        self.threshold = threshold
+        if directory is None:
+            directory = get_shared_memory_directory()
+        self._parent_directory = directory
+        self._directory = None
+        #: int: number of bytes written to memory-mapped files
+        self.bytes_mapped = 0
+        #: int: number of bytes transferred via the engine
+        self.bytes_transferred = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def directory(self):
+        '''str: temporary directory of memory-mapped files'''
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(
+                prefix='jterator_', dir=self._parent_directory
+            )
+        return self._directory
+
+    def _can_map(self, value):
+        return (
+            isinstance(value, np.ndarray) and value.ndim >= 2 and
+            value.dtype in MATLAB_CLASSES and value.nbytes >= self.threshold
+        )
+
+    def put(self, name, value):
+        '''Assigns a value to a variable in the Matlab workspace.
+
+        Parameters
+        ----------
+        name: str
+            name of the variable
+        value:
+            value of the variable
+        '''
+        if not self._can_map(value):
+            if isinstance(value, np.ndarray):
+                self.bytes_transferred += value.nbytes
+            self.engine.put(name, value)
+            return
+        filename = os.path.join(self.directory, '%s.bin' % name)
+        # Writing into the column-major memory map is the only copy and
+        # takes care of the transposition of row-major arrays.
+        mm = np.memmap(
+            filename, dtype=value.dtype, mode='w+', shape=value.shape,
+            order='F'
+        )
+        mm[...] = value
+        mm.flush()
+        del mm
+        self.bytes_mapped += value.nbytes
+        self.engine.eval(
+            "jt_memmap_ = memmapfile('{filename}', 'Format', "
+            "{{'{cls}', [{dims}], 'x'}}, 'Repeat', 1); "
+            "{name} = jt_memmap_.Data.x; clear jt_memmap_;".format(
+                filename=filename, cls=MATLAB_CLASSES[value.dtype],
+                dims=' '.join(str(d) for d in value.shape), name=name
+            )
+        )
+
+    def get(self, name):
+        '''Gets the value of a variable from the Matlab workspace.
+
+        Parameters
+        ----------
+        name: str
+            name of the variable
+
+        Returns
+        -------
+        value of the variable
+
+        Note
+        ----
+        Arrays are returned in column-major order as provided by Matlab.
+        They are not copied into row-major order, since *NumPy* handles
+        the layout via strides.
+        '''
+        value = self.engine.get(name)
+        if isinstance(value, np.ndarray):
+            self.bytes_transferred += value.nbytes
+        return value
+
+    def close(self):
+        '''Removes the memory-mapped files.'''
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
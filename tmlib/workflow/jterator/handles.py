@@ -417,11 +417,38 @@ class SegmentedObjects(LabelImage):
         self._features = collections.defaultdict(list)
         self.save = False
         self.represent_as_polygons = True
+        self._reset_cache()
+
+    @property
+    def value(self):
+        '''numpy.ndarray[numpy.int32]: pixels/voxels array'''
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        LabelImage.value.fset(self, value)
+        self._reset_cache()
+
+    def _reset_cache(self):
+        # Properties derived from the label image are computed only once
+        # and need to be recomputed when a new label image gets assigned.
+        self._labels = None
+        self._centroids = dict()
+        self._is_border = None
 
     @property
     def labels(self):
         '''List[int]: unique object identifier labels'''
-        return np.unique(self.value[self.value > 0]).astype(int).tolist()
+        if self._labels is None:
+            self._labels = np.unique(
+                self.value[self.value > 0]
+            ).astype(int).tolist()
+        return self._labels
+
+    def _get_centroids(self, t, z, plane):
+        if (t, z) not in self._centroids:
+            self._centroids[(t, z)] = mh.center_of_mass(plane, labels=plane)
+        return self._centroids[(t, z)]
 
     def iter_points(self, y_offset, x_offset):
         '''Iterates over point representations of segmented objects.
@@ -443,15 +470,13 @@ class SegmentedObjects(LabelImage):
         '''
         logger.debug('calculate centroids for objects of type "%s"', self.key)
         points = dict()
+        labels = self.labels
         for (t, z), plane in self.iter_planes():
-            centroids = mh.center_of_mass(plane, labels=plane)
-            centroids[:, 1] += x_offset
-            centroids[:, 0] += y_offset
-            centroids[:, 0] *= -1
-            for label in self.labels:
-                y = int(centroids[label, 0])
-                x = int(centroids[label, 1])
-                point = shapely.geometry.Point(x, y)
+            centroids = self._get_centroids(t, z, plane)[labels]
+            y = (-1 * (centroids[:, 0] + y_offset)).astype(int)
+            x = (centroids[:, 1] + x_offset).astype(int)
+            for i, label in enumerate(labels):
+                point = shapely.geometry.Point(x[i], y[i])
                 yield (t, z, label, point)
 
     def iter_polygons(self, y_offset, x_offset):
@@ -519,11 +544,14 @@ class SegmentedObjects(LabelImage):
         '''Dict[Tuple[int], pandas.Series[bool]]: ``True`` if object lies
         at the border of the image and ``False`` otherwise
         '''
-        mapping = dict()
-        for (t, z), plane in self.iter_planes():
-            for label, is_border in self._find_border_objects(plane).iteritems():
-                mapping[(t, z, label)] = bool(is_border)
-        return mapping
+        if self._is_border is None:
+            mapping = dict()
+            for (t, z), plane in self.iter_planes():
+                border_objects = self._find_border_objects(plane)
+                for label, is_border in border_objects.iteritems():
+                    mapping[(t, z, label)] = is_border
+            self._is_border = mapping
+        return self._is_border
 
     @staticmethod
     def _find_border_objects(img):
@@ -540,15 +568,16 @@ class SegmentedObjects(LabelImage):
             ``True`` if an object lies at the border of the `img` and
             ``False`` otherwise
         '''
-        edges = [np.unique(img[0, :]),   # first row
-                 np.unique(img[-1, :]),  # last row
-                 np.unique(img[:, 0]),   # first col
-                 np.unique(img[:, -1])]  # last col
-
+        edges = np.concatenate([
+            img[0, :],   # first row
+            img[-1, :],  # last row
+            img[:, 0],   # first col
+            img[:, -1]   # last col
+        ])
         # Count only unique ids and remove 0 since it signals 'empty space'
-        border_ids = list(reduce(set.union, map(set, edges)).difference({0}))
         object_ids = np.unique(img[img != 0])
-        return {o: True if o in border_ids else False for o in object_ids}
+        is_border = np.in1d(object_ids, edges)
+        return dict(zip(object_ids.tolist(), is_border.tolist()))
 
     @property
     def save(self):
@@ -615,41 +644,36 @@ class SegmentedObjects(LabelImage):
                 'Argument "measurement" must have type '
                 'tmlib.workflow.jterator.handles.Measurement.'
             )
+        labels = pd.Index(self.labels)
         for t, val in enumerate(measurement.value):
-            if len(val.index) < len(self.labels):
+            if val.index.has_duplicates:
+                logger.warn(
+                    'duplicate values for "%s" at time point %d',
+                    measurement.name, t
+                )
+                logger.info('remove duplicates and keep first')
+                val = val[~val.index.duplicated(keep='first')]
+            missing = labels.difference(val.index)
+            if len(missing) > 0:
                 logger.warn(
                     'missing values for object type "%s" at time point %d',
                     self.key, t
                 )
-                for label in self.labels:
-                    if label not in val.index:
-                        logger.warn(
-                            'add NaN values for missing object #%d', label
-                        )
-                        val.loc[label, :] = np.NaN
-                val.sort_index(inplace=True)
-            elif len(val.index) > len(self.labels):
-                if len(np.unique(val.index)) < len(val.index):
-                    logger.warn(
-                        'duplicate values for "%s" at time point %d',
-                        measurement.name, t
-                    )
-                    logger.info('remove duplicates and keep first')
-                    val = val[~val.index.duplicated(keep='first')]
-                else:
-                    logger.warn(
-                        'too many values for object type "%s" at time point %d',
-                        self.key, t
-                    )
-                    for i in val.index:
-                        if i not in self.labels:
-                            logger.warn('remove values for object #%d', i)
-                            val.drop(i, inplace=True)
-            if np.any(val.index.values != np.array(self.labels)):
-                raise ValueError(
-                    'Labels of objects for "%s" at time point %d do not match!'
-                    % (measurement.name, t)
+                logger.warn(
+                    'add NaN values for %d missing objects', len(missing)
+                )
+            redundant = val.index.difference(labels)
+            if len(redundant) > 0:
+                logger.warn(
+                    'too many values for object type "%s" at time point %d',
+                    self.key, t
+                )
+                logger.warn(
+                    'remove values for %d unknown objects', len(redundant)
                 )
+            # Align measurements with objects: rows are sorted according
+            # to labels and missing rows are filled with NaN values.
+            val = val.reindex(self.labels)
             if len(np.unique(val.columns)) != len(val.columns):
                 raise ValueError(
                     'Column names of "%s" at time point %d must be unique.'
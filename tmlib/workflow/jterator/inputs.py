@@ -0,0 +1,366 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Loading of pipeline inputs for a batch of sites.
+
+Everything that is required to load the inputs of a pipeline, i.e. image file
+locations, site residues, shifts between cycles, illumination statistics and
+segmentations of objects, is fetched for all sites of a batch at once with a
+fixed number of queries. Images are subsequently read from plain records
+without the need for any further database interaction.
+'''
+import os
+import logging
+import collections
+import numpy as np
+from sqlalchemy.orm import joinedload
+
+import tmlib.models as tm
+from tmlib.image import ChannelImage
+from tmlib.metadata import ChannelImageMetadata
+from tmlib.readers import DatasetReader
+from tmlib.errors import PipelineDescriptionError
+
+logger = logging.getLogger(__name__)
+
+#: Record of a :class:`ChannelImageFile <tmlib.models.file.ChannelImageFile>`
+ImageFileRecord = collections.namedtuple(
+    'ImageFileRecord',
+    ['id', 'location', 'site_id', 'cycle_id', 'channel_id', 'tpoint', 'zplane']
+)
+
+#: Record of a :class:`Site <tmlib.models.site.Site>` after alignment
+SiteRecord = collections.namedtuple(
+    'SiteRecord',
+    [
+        'id', 'y_offset', 'x_offset', 'height', 'width',
+        'top_residue', 'bottom_residue', 'left_residue', 'right_residue'
+    ]
+)
+
+
+class PipelineInputPlan(object):
+
+    '''Plan for loading the inputs of an image analysis pipeline for a batch
+    of sites.
+    '''
+
+    def __init__(self, experiment_id, channels_input, objects_input):
+        '''
+        Parameters
+        ----------
+        experiment_id: int
+            ID of the processed experiment
+        channels_input: List[tmlib.workflow.jterator.description.PipelineChannelInputDescription]
+            description of channel inputs of the pipeline
+        objects_input: List[tmlib.workflow.jterator.description.PipelineObjectInputDescription]
+            description of object inputs of the pipeline
+        '''
+        self.experiment_id = experiment_id
+        self.channels_input = channels_input
+        self.objects_input = objects_input
+        self.site_ids = list()
+        self._sites = dict()
+        self._channels = dict()
+        self._dtypes = dict()
+        self._stats = dict()
+        self._shifts = dict()
+        self._image_files = collections.defaultdict(list)
+        self._segmentations = collections.defaultdict(list)
+        self._object_planes = collections.defaultdict(set)
+
+    def fetch(self, site_ids):
+        '''Fetches all information required to load the pipeline inputs for
+        the given sites from the database.
+
+        Parameters
+        ----------
+        site_ids: List[int]
+            IDs of sites that should be processed
+
+        Raises
+        ------
+        tmlib.errors.PipelineDescriptionError
+            when a channel or object type requested as input doesn't exist
+            or when illumination statistics are not available for a channel
+            that should be corrected
+        '''
+        self.site_ids = list(site_ids)
+        logger.info('plan pipeline inputs for %d sites', len(self.site_ids))
+        with tm.utils.ExperimentSession(self.experiment_id) as session:
+            self._fetch_sites(session)
+            if self.channels_input:
+                self._fetch_channels(session)
+                self._fetch_image_files(session)
+                self._fetch_shifts(session)
+            if self.objects_input:
+                self._fetch_segmentations(session)
+
+    def _fetch_sites(self, session):
+        # Wells, plates and the experiment are shared between sites and
+        # loaded only once per session, which is required to compute offsets.
+        sites = session.query(tm.Site).\
+            options(joinedload(tm.Site.well)).\
+            filter(tm.Site.id.in_(self.site_ids)).\
+            all()
+        for site in sites:
+            y_offset, x_offset = site.aligned_offset
+            self._sites[site.id] = SiteRecord(
+                site.id, y_offset, x_offset,
+                site.aligned_height, site.aligned_width,
+                site.top_residue, site.bottom_residue,
+                site.left_residue, site.right_residue
+            )
+
+    def _fetch_channels(self, session):
+        names = [ch.name for ch in self.channels_input]
+        channels = session.query(tm.Channel).\
+            filter(tm.Channel.name.in_(names)).\
+            all()
+        self._channels = {c.name: c for c in channels}
+        for ch in self.channels_input:
+            if ch.name not in self._channels:
+                raise PipelineDescriptionError(
+                    'Channel "%s" does not exist.' % ch.name
+                )
+            channel = self._channels[ch.name]
+            if channel.bit_depth == 16:
+                self._dtypes[ch.name] = np.uint16
+            elif channel.bit_depth == 8:
+                self._dtypes[ch.name] = np.uint8
+
+        correct_names = [ch.name for ch in self.channels_input if ch.correct]
+        if correct_names:
+            stats_files = session.query(tm.IllumstatsFile, tm.Channel.name).\
+                join(tm.Channel).\
+                filter(tm.Channel.name.in_(correct_names)).\
+                all()
+            stats_files = {name: f for f, name in stats_files}
+            for name in correct_names:
+                if name not in stats_files:
+                    raise PipelineDescriptionError(
+                        'No illumination statistics file found for '
+                        'channel "%s"' % name
+                    )
+                logger.info(
+                    'load illumination statistics for channel "%s"', name
+                )
+                self._stats[name] = stats_files[name].get()
+
+    def _fetch_image_files(self, session):
+        channel_names = {c.id: c.name for c in self._channels.itervalues()}
+        records = session.query(
+                tm.ChannelImageFile.id,
+                tm.ChannelImageFile._location.label('location'),
+                tm.ChannelImageFile.site_id, tm.ChannelImageFile.cycle_id,
+                tm.ChannelImageFile.channel_id,
+                tm.ChannelImageFile.tpoint, tm.ChannelImageFile.zplane
+            ).\
+            filter(
+                tm.ChannelImageFile.site_id.in_(self.site_ids),
+                tm.ChannelImageFile.channel_id.in_(channel_names.keys())
+            ).\
+            order_by(tm.ChannelImageFile.id).\
+            all()
+        for r in records:
+            name = channel_names[r.channel_id]
+            location = r.location
+            if location is None:
+                location = os.path.join(
+                    self._channels[name].get_image_file_location(r.id),
+                    tm.ChannelImageFile.FILENAME_FORMAT.format(id=r.id)
+                )
+            self._image_files[(r.site_id, name)].append(
+                ImageFileRecord(
+                    r.id, location, r.site_id, r.cycle_id, r.channel_id,
+                    r.tpoint, r.zplane
+                )
+            )
+
+    def _fetch_shifts(self, session):
+        records = session.query(
+                tm.SiteShift.site_id, tm.SiteShift.cycle_id,
+                tm.SiteShift.y, tm.SiteShift.x
+            ).\
+            filter(tm.SiteShift.site_id.in_(self.site_ids)).\
+            all()
+        self._shifts = {(r.site_id, r.cycle_id): (r.y, r.x) for r in records}
+
+    def _fetch_segmentations(self, session):
+        names = [obj.name for obj in self.objects_input]
+        layers = session.query(
+                tm.SegmentationLayer.id, tm.SegmentationLayer.tpoint,
+                tm.SegmentationLayer.zplane, tm.MapobjectType.name
+            ).\
+            join(tm.MapobjectType).\
+            filter(tm.MapobjectType.name.in_(names)).\
+            all()
+        lut = {l.id: (l.name, l.tpoint, l.zplane) for l in layers}
+        available_names = {l.name for l in layers}
+        for name in names:
+            if name not in available_names:
+                raise PipelineDescriptionError(
+                    'No segmentations found for objects "%s".' % name
+                )
+        segmentations = session.query(
+                tm.MapobjectSegmentation.partition_key,
+                tm.MapobjectSegmentation.segmentation_layer_id,
+                tm.MapobjectSegmentation.label,
+                tm.MapobjectSegmentation.geom_polygon
+            ).\
+            filter(
+                tm.MapobjectSegmentation.segmentation_layer_id.in_(lut.keys()),
+                tm.MapobjectSegmentation.partition_key.in_(self.site_ids)
+            ).\
+            order_by(tm.MapobjectSegmentation.mapobject_id).\
+            all()
+        for s in segmentations:
+            name, tpoint, zplane = lut[s.segmentation_layer_id]
+            self._segmentations[(name, s.partition_key, tpoint, zplane)].append(
+                (s.label, s.geom_polygon)
+            )
+        for name, tpoint, zplane in lut.itervalues():
+            self._object_planes[name].add((tpoint, zplane))
+
+    def get_site(self, site_id):
+        '''Gets a site.
+
+        Parameters
+        ----------
+        site_id: int
+            ID of the site
+
+        Returns
+        -------
+        tmlib.workflow.jterator.inputs.SiteRecord
+        '''
+        return self._sites[site_id]
+
+    def get_image_files(self, site_id, channel_name):
+        '''Gets the image files of a channel for a site.
+
+        Parameters
+        ----------
+        site_id: int
+            ID of the site
+        channel_name: str
+            name of the channel
+
+        Returns
+        -------
+        List[tmlib.workflow.jterator.inputs.ImageFileRecord]
+        '''
+        return self._image_files[(site_id, channel_name)]
+
+    def get_dtype(self, channel_name):
+        '''Gets the data type of images of a channel.
+
+        Parameters
+        ----------
+        channel_name: str
+            name of the channel
+
+        Returns
+        -------
+        type
+        '''
+        return self._dtypes[channel_name]
+
+    def get_stats(self, channel_name):
+        '''Gets the illumination statistics of a channel.
+
+        Parameters
+        ----------
+        channel_name: str
+            name of the channel
+
+        Returns
+        -------
+        tmlib.image.IllumstatsContainer
+            statistics or ``None`` if images of the channel should not be
+            corrected
+        '''
+        return self._stats.get(channel_name)
+
+    def get_object_planes(self, object_name):
+        '''Gets time points and z-planes for which objects were segmented.
+
+        Parameters
+        ----------
+        object_name: str
+            name of the objects type
+
+        Returns
+        -------
+        Tuple[List[int]]
+            sorted time points and z-planes
+        '''
+        planes = self._object_planes[object_name]
+        tpoints = sorted({t for t, z in planes})
+        zplanes = sorted({z for t, z in planes})
+        return (tpoints, zplanes)
+
+    def get_segmentations(self, object_name, site_id, tpoint, zplane):
+        '''Gets the segmentations of objects for a site.
+
+        Parameters
+        ----------
+        object_name: str
+            name of the objects type
+        site_id: int
+            ID of the site
+        tpoint: int
+            time point
+        zplane: int
+            z-plane
+
+        Returns
+        -------
+        List[Tuple[Union[int, geoalchemy2.elements.WKBElement]]]
+            label and polygon of each segmented object
+        '''
+        return self._segmentations[(object_name, site_id, tpoint, zplane)]
+
+    def load_image(self, record):
+        '''Reads the image of a file. Residues and shifts of the image are
+        set, such that the image can be aligned.
+
+        Parameters
+        ----------
+        record: tmlib.workflow.jterator.inputs.ImageFileRecord
+            record of the image file
+
+        Returns
+        -------
+        tmlib.image.ChannelImage
+        '''
+        metadata = ChannelImageMetadata(
+            channel_id=record.channel_id,
+            site_id=record.site_id,
+            tpoint=record.tpoint,
+            zplane=record.zplane,
+            cycle_id=record.cycle_id
+        )
+        with DatasetReader(record.location) as f:
+            array = f.read('array')
+        site = self._sites[record.site_id]
+        metadata.bottom_residue = site.bottom_residue
+        metadata.top_residue = site.top_residue
+        metadata.left_residue = site.left_residue
+        metadata.right_residue = site.right_residue
+        shifts = self._shifts.get((record.site_id, record.cycle_id))
+        if shifts is not None:
+            metadata.y_shift, metadata.x_shift = shifts
+        return ChannelImage(array, metadata)
@@ -16,17 +16,20 @@
 import os
 import sys
 import re
+import time
 import logging
 import imp
 import collections
 import importlib
 import traceback
 import numpy as np
+import pandas as pd
 from cStringIO import StringIO
 
 
 from tmlib.workflow.jterator.utils import determine_language
 from tmlib.workflow.jterator import handles as hdls
+from tmlib.workflow.jterator.exchange import MatlabArrayExchange
 from tmlib.errors import PipelineRunError
 
 logger = logging.getLogger(__name__)
@@ -82,6 +85,11 @@ class ImageAnalysisModule(object):
         self.handles = handles
         self.outputs = dict()
         self.persistent_store = dict()
+        self._main = None
+        #: float: time in seconds it took to load the module source code
+        self.import_time = None
+        #: List[float]: time in seconds each execution of the module took
+        self.exec_times = list()
 
     def build_figure_filename(self, figures_dir, job_id):
         '''Builds name of figure file into which module will write figure
@@ -114,8 +122,13 @@ class ImageAnalysisModule(object):
         '''str: language of the module (e.g. "Python")'''
         return determine_language(self.source_file)
 
-    def _exec_m_module(self, engine):
-        module_name = os.path.splitext(os.path.basename(self.source_file))[0]
+    @property
+    def module_name(self):
+        '''str: name of the module as defined by its source file'''
+        return os.path.splitext(os.path.basename(self.source_file))[0]
+
+    def _load_m_module(self, engine):
+        module_name = self.module_name
         logger.debug(
             'import module "%s" from source file: %s',
             module_name, self.source_file
@@ -133,7 +146,6 @@ class ImageAnalysisModule(object):
             "addpath('{0}');".format(source_dir)
         )
         engine.eval('version = {0}.VERSION'.format(module_name))
-        function_call_format_string = '[{outputs}] = {name}.main({inputs});'
         # NOTE: Matlab doesn't add imported classes to the workspace. It access
         # the "VERSION" property, we need to assign it to a variable first.
         version = engine.get('version')
@@ -141,6 +153,11 @@ class ImageAnalysisModule(object):
             raise PipelineRunError(
                 'Version of source and handles is not the same.'
             )
+        return module_name
+
+    def _exec_m_module(self, engine):
+        module_name = self._main
+        function_call_format_string = '[{outputs}] = {name}.main({inputs});'
         kwargs = self.keyword_arguments
         logger.debug(
             'evaluate main() function with INPUTS: "%s"',
@@ -152,27 +169,31 @@ class ImageAnalysisModule(object):
             name=module_name,
             inputs=', '.join(kwargs.keys())
         )
-        # Add arguments as variable in Matlab session
-        for name, value in kwargs.iteritems():
-            engine.put(name, value)
-        # Evaluate the function call
-        # NOTE: Unfortunately, the matlab_wrapper engine doesn't return
-        # standard output and error (exceptions are caught, though).
-        # TODO: log to file
-        engine.eval(func_call_string)
-
-        for handle in self.handles.output:
-            val = engine.get('%s' % handle.name)
-            if isinstance(val, np.ndarray):
-                # Matlab returns arrays in Fortran order
-                handle.value = val.copy(order='C')
-            else:
-                handle.value = val
+        with MatlabArrayExchange(engine) as exchange:
+            # Add arguments as variable in Matlab session
+            for name, value in kwargs.iteritems():
+                exchange.put(name, value)
+            # Evaluate the function call
+            # NOTE: Unfortunately, the matlab_wrapper engine doesn't return
+            # standard output and error (exceptions are caught, though).
+            # TODO: log to file
+            engine.eval(func_call_string)
+
+            for handle in self.handles.output:
+                # NOTE: Matlab returns arrays in Fortran order, which is
+                # handled by strides rather than copying the values.
+                handle.value = exchange.get('%s' % handle.name)
 
+        logger.debug(
+            'module "%s": %.1f MB mapped to and %.1f MB transferred '
+            'from/to Matlab', self.name,
+            exchange.bytes_mapped / float(2**20),
+            exchange.bytes_transferred / float(2**20)
+        )
         return self.handles.output
 
-    def _exec_py_module(self):
-        module_name = os.path.splitext(os.path.basename(self.source_file))[0]
+    def _load_py_module(self):
+        module_name = self.module_name
         logger.debug(
             'import module "%s" from source file: %s',
             module_name, self.source_file
@@ -188,6 +209,10 @@ class ImageAnalysisModule(object):
                 'Module source file "%s" must contain a "main" function.'
                 % module_name
             )
+        return func
+
+    def _exec_py_module(self):
+        func = self._main
         kwargs = self.keyword_arguments
         logger.debug(
             'evaluate main() function with INPUTS: "%s"',
@@ -211,7 +236,7 @@ class ImageAnalysisModule(object):
 
         return self.handles.output
 
-    def _exec_r_module(self):
+    def _load_r_module(self):
         try:
             import rpy2.robjects
             from rpy2.robjects import numpy2ri
@@ -222,9 +247,10 @@ class ImageAnalysisModule(object):
                 'R module cannot be run, because '
                 '"rpy2" package is not installed.'
             )
-        module_name = os.path.splitext(os.path.basename(self.source_file))[0]
+        module_name = self.module_name
         logger.debug(
-            'import module "%s" from source file: %s', self.source_file
+            'import module "%s" from source file: %s',
+            module_name, self.source_file
         )
         logger.debug('source module: "%s"', self.source_file)
         rpy2.robjects.r('source("{0}")'.format(self.source_file))
@@ -234,32 +260,42 @@ class ImageAnalysisModule(object):
             raise PipelineRunError(
                 'Version of source and handles is not the same.'
             )
-        func = module.get('main')
         numpy2ri.activate()   # enables use of numpy arrays
         pandas2ri.activate()  # enable use of pandas data frames
+        self._r_base = importr('base')
+        return module.get('main')
+
+    def _exec_r_module(self):
+        import rpy2.robjects
+        from rpy2.robjects import numpy2ri
+        from rpy2.robjects import pandas2ri
+        func = self._main
         kwargs = self.keyword_arguments
         logger.debug(
             'evaluate main() function with INPUTS: "%s"',
             '", "'.join(kwargs.keys())
         )
         # R doesn't have unsigned integer types
+        n_bytes_copied = 0
         for k, v in kwargs.iteritems():
             if isinstance(v, np.ndarray):
                 if v.dtype == np.uint16 or v.dtype == np.uint8:
-                    logging.debug(
+                    logger.debug(
                         'module "%s" input argument "%s": '
                         'convert unsigned integer data type to integer',
                         self.name, k
                     )
-                    kwargs[k] = v.astype(int)
+                    # R integers have 32 bit, which avoids an additional
+                    # conversion of 64 bit integers.
+                    kwargs[k] = v.astype(np.int32)
+                    n_bytes_copied += kwargs[k].nbytes
             elif isinstance(v, pd.DataFrame):
                 # TODO: We may have to translate pandas data frames explicitly
                 # into the R equivalent.
                 # pandas2ri.py2ri(v)
                 kwargs[k] = v
         args = rpy2.robjects.ListVector({k: v for k, v in kwargs.iteritems()})
-        base = importr('base')
-        r_out = base.do_call(func, args)
+        r_out = self._r_base.do_call(func, args)
 
         for handle in self.handles.output:
             # NOTE: R functions are supposed to return a list. Therefore
@@ -272,10 +308,15 @@ class ImageAnalysisModule(object):
                 # NOTE: R doesn't have an unsigned integer data type.
                 # So we cast to uint16.
                 handle.value = numpy2ri.ri2py(r_out.rx2(handle.name)).astype(
-                    np.uint16
+                    np.uint16, copy=False
                 )
                 # handle.value = np.array(r_out.rx2(handle.name), np.uint16)
+                n_bytes_copied += handle.value.nbytes
 
+        logger.debug(
+            'module "%s": %.1f MB converted from/to R',
+            self.name, n_bytes_copied / float(2**20)
+        )
         return self.handles.output
 
     def update_handles(self, store, headless=True):
@@ -450,6 +491,37 @@ class ImageAnalysisModule(object):
                 store['pipe'][handle.key] = handle.value
         return store
 
+    def load(self, engine=None):
+        '''Loads the source code of the module and checks whether its
+        version matches the version of the handles. The module is only loaded
+        once, subsequent calls have no effect.
+
+        Parameters
+        ----------
+        engine: matlab_wrapper.matlab_session.MatlabSession, optional
+            engine for non-Python languages, such as Matlab (default: ``None``)
+
+        Note
+        ----
+        Called automatically by :meth:`tmlib.jterator.module.Module.run`.
+        '''
+        if self._main is not None:
+            return
+        start = time.time()
+        if self.language == 'Python':
+            self._main = self._load_py_module()
+        elif self.language == 'Matlab':
+            self._main = self._load_m_module(engine)
+        elif self.language == 'R':
+            self._main = self._load_r_module()
+        else:
+            raise PipelineRunError('Language not supported.')
+        self.import_time = time.time() - start
+        logger.debug(
+            'loading module "%s" took %.3f seconds',
+            self.name, self.import_time
+        )
+
     def run(self, engine=None):
         '''Executes a module, i.e. evaluate the corresponding function with
         the keyword arguments provided by
@@ -466,14 +538,20 @@ class ImageAnalysisModule(object):
         calling this method and
         ::meth:`tmlib.jterator.module.Module.update_store` afterwards.
         '''
+        self.load(engine)
+        start = time.time()
         if self.language == 'Python':
-            return self._exec_py_module()
+            output = self._exec_py_module()
         elif self.language == 'Matlab':
-            return self._exec_m_module(engine)
-        elif self.language == 'R':
-            return self._exec_r_module()
+            output = self._exec_m_module(engine)
         else:
-            raise PipelineRunError('Language not supported.')
+            output = self._exec_r_module()
+        exec_time = time.time() - start
+        self.exec_times.append(exec_time)
+        logger.debug(
+            'executing module "%s" took %.3f seconds', self.name, exec_time
+        )
+        return output
 
     def __str__(self):
         return (
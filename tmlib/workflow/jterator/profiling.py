@@ -0,0 +1,312 @@
+# TmLibrary - TissueMAPS library for distibuted image analysis routines.
+# Copyright (C) 2016, 2018  University of Zurich
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''Profiling of jterator modules.
+
+For each module call, wall and CPU time, the change of the resident set
+size (RSS) and the peak RSS of the process that executed the module, the size
+of inputs and outputs and the number of segmented objects are recorded.
+The records of a job are written as a table into the log directory of the
+step and the tables of all jobs are summarized per module in the *collect*
+phase.
+
+Modules that are executed by an engine running in a separate process, such as
+Matlab, are profiled by means of the child processes of the current process
+and are labeled as ``"external"``. Memory is measured via the ``/proc``
+file system and is thus only available on Linux.
+'''
+import os
+import time
+import logging
+import resource
+import numpy as np
+import pandas as pd
+
+from tmlib.workflow.jterator import handles as hdls
+
+logger = logging.getLogger(__name__)
+
+#: List[str]: columns of the table of profiling records
+PROFILE_COLUMNS = [
+    'site_id', 'module', 'process', 'cached', 'wall_time', 'cpu_time',
+    'rss_increase', 'peak_rss', 'input_bytes', 'output_bytes', 'n_objects'
+]
+
+#: Set[str]: languages of modules that are executed in a separate process
+EXTERNAL_LANGUAGES = {'Matlab'}
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def get_memory_usage(pid='self'):
+    '''Gets the current and the peak resident set size of a process.
+
+    Parameters
+    ----------
+    pid: Union[int, str], optional
+        ID of the process (default: ``"self"``)
+
+    Returns
+    -------
+    Tuple[int]
+        current and peak resident set size in bytes; ``(0, 0)`` when the
+        process doesn't exist (anymore)
+    '''
+    rss, peak_rss = 0, 0
+    try:
+        with open('/proc/%s/status' % pid) as f:
+            for line in f:
+                # NOTE: Values are reported in kilobytes.
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak_rss = int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return (rss, peak_rss)
+
+
+def get_cpu_time(pid):
+    '''Gets the CPU time consumed by a process.
+
+    Parameters
+    ----------
+    pid: int
+        ID of the process
+
+    Returns
+    -------
+    float
+        user and system CPU time in seconds; ``0`` when the process doesn't
+        exist (anymore)
+    '''
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            # The name of the executable may contain whitespace.
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError):
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / float(_CLOCK_TICKS)
+
+
+def find_child_processes(pid=None):
+    '''Finds all descendants of a process.
+
+    Parameters
+    ----------
+    pid: int, optional
+        ID of the process (defaults to the current process)
+
+    Returns
+    -------
+    List[int]
+        IDs of child processes and their descendants
+    '''
+    if pid is None:
+        pid = os.getpid()
+    children = dict()
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return list()
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, OSError):
+            continue
+        children.setdefault(ppid, list()).append(int(name))
+    descendants = list()
+    parents = [pid]
+    while parents:
+        ids = children.get(parents.pop(), list())
+        descendants.extend(ids)
+        parents.extend(ids)
+    return descendants
+
+
+def _get_external_usage(pids):
+    cpu_time = sum([get_cpu_time(p) for p in pids])
+    usage = [get_memory_usage(p) for p in pids]
+    return (cpu_time, sum([u[0] for u in usage]), sum([u[1] for u in usage]))
+
+
+def compute_nbytes(value):
+    '''Computes the memory consumed by the value of a handle.
+
+    Parameters
+    ----------
+    value: Union[numpy.ndarray, pandas.DataFrame, List[pandas.DataFrame], object]
+        value of a handle
+
+    Returns
+    -------
+    int
+        number of bytes; zero for values other than arrays and data frames
+    '''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    elif isinstance(value, list):
+        return sum([compute_nbytes(v) for v in value])
+    return 0
+
+
+def _get_handle_values(handles):
+    values = list()
+    for handle in handles:
+        try:
+            values.append(handle.value)
+        except AttributeError:
+            # Output handles don't have a value before the module was run.
+            values.append(None)
+    return values
+
+
+class ModuleProfiler(object):
+
+    '''Context manager that profiles a call of a module.
+
+    Examples
+    --------
+    >>> with ModuleProfiler(site_id, module) as profiler:
+    >>>     module.run()
+    >>> profiler.record
+    '''
+
+    def __init__(self, site_id, module):
+        '''
+        Parameters
+        ----------
+        site_id: int
+            ID of the processed site
+        module: tmlib.workflow.jterator.module.ImageAnalysisModule
+            module whose call should be profiled; values of input handles
+            must have been updated beforehand
+        '''
+        self.site_id = site_id
+        self.module = module
+        #: bool: whether outputs of the module were loaded from a cache
+        self.cached = False
+        #: dict: profiling record, available once the call finished
+        self.record = None
+
+    def __enter__(self):
+        self._input_bytes = sum([
+            compute_nbytes(v)
+            for v in _get_handle_values(self.module.handles.input)
+        ])
+        language = getattr(self.module, 'language', None)
+        self._is_external = language in EXTERNAL_LANGUAGES
+        if self._is_external:
+            # The engine was started beforehand and is a child process.
+            self._pids = find_child_processes()
+            self._external_usage = _get_external_usage(self._pids)
+        self._usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._rss = get_memory_usage()[0]
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        wall_time = time.time() - self._start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        if exc_type is not None:
+            return
+        cpu_time = (
+            (usage.ru_utime - self._usage.ru_utime) +
+            (usage.ru_stime - self._usage.ru_stime)
+        )
+        if self._is_external:
+            # Memory is reported for the engine, while CPU time includes
+            # the exchange of data with the engine by the current process.
+            external_usage = _get_external_usage(self._pids)
+            process = 'external'
+            cpu_time += external_usage[0] - self._external_usage[0]
+            rss_increase = external_usage[1] - self._external_usage[1]
+            peak_rss = external_usage[2]
+        else:
+            process = 'self'
+            rss, peak_rss = get_memory_usage()
+            rss_increase = rss - self._rss
+        output_values = _get_handle_values(self.module.handles.output)
+        n_objects = 0
+        for handle in self.module.handles.output:
+            if isinstance(handle, hdls.SegmentedObjects):
+                n_objects += len(handle.labels)
+        self.record = {
+            'site_id': self.site_id,
+            'module': self.module.name,
+            'process': process,
+            'cached': self.cached,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'rss_increase': rss_increase,
+            'peak_rss': peak_rss,
+            'input_bytes': self._input_bytes,
+            'output_bytes': sum([compute_nbytes(v) for v in output_values]),
+            'n_objects': n_objects
+        }
+        logger.debug(
+            'module "%s" (%s): wall %.3f s, cpu %.3f s, RSS %+.1f MB, '
+            'peak RSS %.1f MB',
+            self.module.name, process, wall_time, cpu_time,
+            rss_increase / float(2**20), peak_rss / float(2**20)
+        )
+
+
+def summarize_profiles(profiles):
+    '''Summarizes profiling records per module.
+
+    Parameters
+    ----------
+    profiles: pandas.DataFrame
+        profiling records with columns :const:`PROFILE_COLUMNS`
+
+    Returns
+    -------
+    pandas.DataFrame
+        summary statistics with one row per module, in order of first
+        appearance of modules in `profiles`
+    '''
+    grouped = profiles.groupby('module', sort=False)
+    summary = pd.DataFrame({
+        'process': grouped['process'].first(),
+        'n_calls': grouped.size(),
+        'n_cached': grouped['cached'].sum().astype(int),
+        'total_wall_time': grouped['wall_time'].sum(),
+        'mean_wall_time': grouped['wall_time'].mean(),
+        'max_wall_time': grouped['wall_time'].max(),
+        'total_cpu_time': grouped['cpu_time'].sum(),
+        'mean_rss_increase': grouped['rss_increase'].mean(),
+        'max_rss_increase': grouped['rss_increase'].max(),
+        'max_peak_rss': grouped['peak_rss'].max(),
+        'mean_input_bytes': grouped['input_bytes'].mean(),
+        'mean_output_bytes': grouped['output_bytes'].mean(),
+        'mean_n_objects': grouped['n_objects'].mean()
+    })
+    summary['fraction_wall_time'] = (
+        summary['total_wall_time'] / summary['total_wall_time'].sum()
+    )
+    columns = [
+        'process', 'n_calls', 'n_cached', 'total_wall_time',
+        'fraction_wall_time', 'mean_wall_time', 'max_wall_time',
+        'total_cpu_time', 'mean_rss_increase', 'max_rss_increase',
+        'max_peak_rss', 'mean_input_bytes', 'mean_output_bytes',
+        'mean_n_objects'
+    ]
+    return summary[columns]
@@ -0,0 +1,119 @@
+import collections
+import numpy as np
+import pandas as pd
+
+from tmlib.workflow.jterator import handles as hdls
+from tmlib.workflow.jterator.cache import ModuleResultCache
+
+Handles = collections.namedtuple('Handles', ['input', 'output'])
+
+
+class FakeModule(object):
+
+    def __init__(self, source_file, threshold):
+        self.name = 'threshold'
+        self.source_file = source_file
+        self.handles = Handles(
+            input=[
+                hdls.IntensityImage('image', 'dapi'),
+                hdls.Numeric('threshold', threshold)
+            ],
+            output=[
+                hdls.BinaryImage('mask', 'mask'),
+                hdls.Measurement('intensity', 'nuclei', 'nuclei'),
+                hdls.Figure('figure')
+            ]
+        )
+
+    def update_handles(self, store):
+        self.handles.input[0].value = store['pipe']['dapi']
+
+    def run(self):
+        image = self.handles.input[0].value
+        threshold = self.handles.input[1].value
+        self.handles.output[0].value = image > threshold
+        self.handles.output[1].value = [
+            pd.DataFrame({'mean': [1.5, 2.5]}, index=[1, 2])
+        ]
+        self.handles.output[2].value = ''
+
+
+def create_source(tmpdir, content):
+    source = tmpdir.join('threshold.py')
+    source.write(content)
+    return str(source)
+
+
+def create_store():
+    image = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    return {'pipe': {'dapi': image}, 'digests': dict()}
+
+
+def test_cached_outputs_are_restored(tmpdir):
+    cache = ModuleResultCache(str(tmpdir.join('cache')))
+    source = create_source(tmpdir, 'VERSION = "0.1.0"')
+    module = FakeModule(source, 5)
+    store = create_store()
+    module.update_handles(store)
+    key = cache.build_key(module, store)
+    assert not cache.get(key, module)
+    module.run()
+    expected = module.handles.output[0].value
+    cache.set(key, module)
+
+    module = FakeModule(source, 5)
+    module.update_handles(store)
+    assert cache.build_key(module, store) == key
+    assert cache.get(key, module)
+    assert np.array_equal(module.handles.output[0].value, expected)
+    measurement = module.handles.output[1].value[0]
+    assert measurement.columns.tolist() == ['mean']
+    assert measurement.index.tolist() == [1, 2]
+    assert measurement['mean'].tolist() == [1.5, 2.5]
+    assert module.handles.output[2].value == '{}'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_source_and_inputs(tmpdir):
+    cache = ModuleResultCache(str(tmpdir.join('cache')))
+    store = create_store()
+    source = create_source(tmpdir, 'VERSION = "0.1.0"')
+    module = FakeModule(source, 5)
+    module.update_handles(store)
+    key = cache.build_key(module, store)
+
+    module = FakeModule(source, 6)
+    module.update_handles(store)
+    assert cache.build_key(module, store) != key
+
+    other_store = create_store()
+    other_store['pipe']['dapi'] = other_store['pipe']['dapi'] + 1
+    module = FakeModule(source, 5)
+    module.update_handles(other_store)
+    assert cache.build_key(module, other_store) != key
+
+    other_cache = ModuleResultCache(str(tmpdir.join('cache')))
+    source = create_source(tmpdir, 'VERSION = "0.2.0"')
+    module = FakeModule(source, 5)
+    module.update_handles(store)
+    assert other_cache.build_key(module, store) != key
+
+
+def test_update_digests(tmpdir):
+    cache = ModuleResultCache(str(tmpdir.join('cache')))
+    store = create_store()
+    module = FakeModule(create_source(tmpdir, ''), 5)
+    module.update_handles(store)
+    key = cache.build_key(module, store)
+    cache.update_digests(key, module, store)
+    assert set(store['digests'].keys()) == {'dapi', 'mask'}
+
+
+def test_least_recently_used_entries_are_discarded(tmpdir):
+    cache = ModuleResultCache(str(tmpdir.join('cache')), max_size=0)
+    module = FakeModule(create_source(tmpdir, ''), 5)
+    store = create_store()
+    module.update_handles(store)
+    module.run()
+    cache.set('a', module)
+    assert not cache.get('a', module)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from tmlib.workflow.jterator.exchange import MatlabArrayExchange
+
+
+class FakeEngine(object):
+
+    def __init__(self):
+        self.workspace = dict()
+        self.statements = list()
+
+    def put(self, name, value):
+        self.workspace[name] = value
+
+    def get(self, name):
+        return self.workspace[name]
+
+    def eval(self, statement):
+        self.statements.append(statement)
+
+
+def test_put_large_array_via_memmap(tmpdir):
+    engine = FakeEngine()
+    array = np.arange(24, dtype=np.uint16).reshape(2, 3, 4)
+    with MatlabArrayExchange(engine, str(tmpdir), threshold=0) as exchange:
+        exchange.put('image', array)
+        filename = tmpdir.listdir()[0].join('image.bin')
+        mapped = np.memmap(
+            str(filename), dtype=np.uint16, mode='r', shape=array.shape,
+            order='F'
+        )
+        assert np.array_equal(mapped, array)
+        # Matlab reads the file in column-major order
+        assert np.array_equal(
+            np.fromfile(str(filename), dtype=np.uint16),
+            array.ravel(order='F')
+        )
+    assert 'image' not in engine.workspace
+    assert "{'uint16', [2 3 4], 'x'}" in engine.statements[0]
+    assert exchange.bytes_mapped == array.nbytes
+    assert exchange.bytes_transferred == 0
+    assert tmpdir.listdir() == []
+
+
+def test_put_small_array_via_engine(tmpdir):
+    engine = FakeEngine()
+    array = np.zeros((4, 4), dtype=np.bool)
+    with MatlabArrayExchange(engine, str(tmpdir), threshold=0) as exchange:
+        exchange.put('mask', array)
+        exchange.put('name', 'foo')
+    assert engine.workspace['mask'] is array
+    assert engine.statements == []
+    assert exchange.bytes_transferred == array.nbytes
+
+
+def test_get_keeps_fortran_order(tmpdir):
+    engine = FakeEngine()
+    engine.workspace['labels'] = np.asfortranarray(np.ones((3, 5)))
+    with MatlabArrayExchange(engine, str(tmpdir)) as exchange:
+        labels = exchange.get('labels')
+    assert labels is engine.workspace['labels']
+    assert labels.flags.f_contiguous
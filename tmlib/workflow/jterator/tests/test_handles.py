@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from tmlib.workflow.jterator.handles import SegmentedObjects
+from tmlib.workflow.jterator.handles import Measurement
+
+
+def create_objects():
+    array = np.zeros((20, 20), dtype=np.int32)
+    array[0:4, 0:4] = 1
+    array[8:12, 8:12] = 2
+    array[15:20, 10:14] = 4
+    objects = SegmentedObjects('nuclei', 'nuclei')
+    objects.value = array
+    return objects
+
+
+def create_measurement(values, index):
+    measurement = Measurement('area', 'nuclei', 'nuclei')
+    measurement.value = [pd.DataFrame({'area': values}, index=index)]
+    return measurement
+
+
+def test_labels_are_recomputed_for_new_value():
+    objects = create_objects()
+    assert objects.labels == [1, 2, 4]
+    objects.value = np.ones((5, 5), dtype=np.int32) * 3
+    assert objects.labels == [3]
+
+
+def test_is_border():
+    objects = create_objects()
+    assert objects.is_border == {
+        (0, 0, 1): True, (0, 0, 2): False, (0, 0, 4): True
+    }
+
+
+def test_iter_points():
+    objects = create_objects()
+    points = list(objects.iter_points(100, 200))
+    assert [p[2] for p in points] == [1, 2, 4]
+    assert (points[1][3].x, points[1][3].y) == (209, -109)
+
+
+def test_add_measurement_fills_missing_objects():
+    objects = create_objects()
+    objects.add_measurement(create_measurement([4.0, 16.0], [4, 1]))
+    data = objects.measurements[0]
+    assert data.index.tolist() == [1, 2, 4]
+    assert data['area'][1] == 16.0
+    assert np.isnan(data['area'][2])
+    assert data['area'][4] == 4.0
+
+
+def test_add_measurement_removes_duplicate_and_unknown_objects():
+    objects = create_objects()
+    objects.add_measurement(
+        create_measurement([1.0, 2.0, 3.0, 4.0, 5.0], [1, 1, 2, 4, 7])
+    )
+    data = objects.measurements[0]
+    assert data.index.tolist() == [1, 2, 4]
+    assert data['area'].tolist() == [1.0, 3.0, 4.0]
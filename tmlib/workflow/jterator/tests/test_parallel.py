@@ -0,0 +1,106 @@
+import os
+import multiprocessing
+import pytest
+
+from tmlib.errors import PipelineRunError
+from tmlib.workflow.jterator.api import ImageAnalysisPipelineEngine
+
+
+class FakePipelineEngine(ImageAnalysisPipelineEngine):
+
+    pipeline = list()
+
+    def __init__(self, failing_load=None, failing_run=None):
+        self._engines = {'Python': None, 'R': None}
+        self.failing_load = failing_load
+        self.failing_run = failing_run
+        self.saved = list()
+        self.statistics = None
+
+    def _plan_pipeline_input(self, site_ids):
+        return None
+
+    def _load_pipeline_input(self, site_id, plan=None):
+        if site_id == self.failing_load:
+            raise IOError('cannot load site %d' % site_id)
+        return {'site_id': site_id, 'loader_pid': os.getpid()}
+
+    def _run_pipeline(self, store, site_id, plot=False, cache=None):
+        if site_id == self.failing_run:
+            raise ValueError('module failed for site %d' % site_id)
+        store['worker_pid'] = os.getpid()
+        store['profile'] = [(site_id, 'module')]
+        return store
+
+    def _save_pipeline_outputs(self, store, assume_clean_state, statistics):
+        store['writer_pid'] = os.getpid()
+        statistics[store['site_id']] = store['worker_pid']
+        self.saved.append(store)
+
+    def _write_profile(self, batch, profile):
+        self.profile = profile
+
+    def _save_feature_statistics(self, batch, statistics):
+        self.statistics = statistics
+
+
+def _create_batch(n_sites):
+    return {'id': 1, 'site_ids': range(1, n_sites + 1), 'plot': False}
+
+
+def test_run_job_in_parallel():
+    engine = FakePipelineEngine()
+    batch = _create_batch(10)
+    engine.run_job(batch, True, n_workers=3)
+    assert sorted(s['site_id'] for s in engine.saved) == batch['site_ids']
+    assert sorted(p[0] for p in engine.profile) == batch['site_ids']
+    assert sorted(engine.statistics.keys()) == batch['site_ids']
+    pid = os.getpid()
+    # The current process is the only one that writes outputs.
+    assert all(s['writer_pid'] == pid for s in engine.saved)
+    assert all(s['worker_pid'] != pid for s in engine.saved)
+    assert all(s['loader_pid'] != pid for s in engine.saved)
+    assert all(s['loader_pid'] != s['worker_pid'] for s in engine.saved)
+    assert multiprocessing.active_children() == []
+
+
+def test_run_job_in_parallel_with_more_workers_than_sites():
+    engine = FakePipelineEngine()
+    batch = _create_batch(2)
+    engine.run_job(batch, True, n_workers=8)
+    assert sorted(s['site_id'] for s in engine.saved) == batch['site_ids']
+    assert multiprocessing.active_children() == []
+
+
+def test_run_job_in_parallel_with_failing_worker():
+    engine = FakePipelineEngine(failing_run=4)
+    with pytest.raises(PipelineRunError) as exc:
+        engine.run_job(_create_batch(10), True, n_workers=3)
+    assert 'site 4' in str(exc.value)
+    assert 'module failed for site 4' in str(exc.value)
+    assert engine.statistics is None
+    assert multiprocessing.active_children() == []
+
+
+def test_run_job_in_parallel_with_failing_loader():
+    engine = FakePipelineEngine(failing_load=2)
+    with pytest.raises(PipelineRunError) as exc:
+        engine.run_job(_create_batch(10), True, n_workers=3)
+    assert 'cannot load site 2' in str(exc.value)
+    assert all(s['site_id'] < 2 for s in engine.saved)
+    assert engine.statistics is None
+    assert multiprocessing.active_children() == []
+
+
+def test_get_run_job_args():
+    engine = FakePipelineEngine()
+    args = engine._get_run_job_args(
+        arguments=['jterator', '1', 'run', '--job', '1'], requested_cores=4
+    )
+    assert args['arguments'][-2:] == ['--workers', '4']
+    for cores in (1, None):
+        args = engine._get_run_job_args(
+            arguments=['jterator', '1', 'run', '--job', '1'],
+            requested_cores=cores
+        )
+        assert '--workers' not in args['arguments']
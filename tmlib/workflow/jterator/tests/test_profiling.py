@@ -0,0 +1,99 @@
+import os
+import subprocess
+import collections
+import numpy as np
+import pandas as pd
+
+from tmlib.workflow.jterator import handles as hdls
+from tmlib.workflow.jterator.profiling import ModuleProfiler
+from tmlib.workflow.jterator.profiling import PROFILE_COLUMNS
+from tmlib.workflow.jterator.profiling import compute_nbytes
+from tmlib.workflow.jterator.profiling import find_child_processes
+from tmlib.workflow.jterator.profiling import get_memory_usage
+from tmlib.workflow.jterator.profiling import summarize_profiles
+
+Handles = collections.namedtuple('Handles', ['input', 'output'])
+Module = collections.namedtuple('Module', ['name', 'handles'])
+ExternalModule = collections.namedtuple(
+    'ExternalModule', ['name', 'handles', 'language']
+)
+
+
+def test_compute_nbytes():
+    array = np.zeros((10, 10), dtype=np.uint16)
+    df = pd.DataFrame({'a': np.zeros(10)})
+    assert compute_nbytes(array) == 200
+    assert compute_nbytes([df, df]) == 2 * compute_nbytes(df)
+    assert compute_nbytes('foo') == 0
+
+
+def test_module_profiler():
+    image = hdls.IntensityImage('image', 'dapi')
+    image.value = np.zeros((10, 10), dtype=np.uint16)
+    objects = hdls.SegmentedObjects('nuclei', 'nuclei')
+    module = Module('segment', Handles([image], [objects]))
+    with ModuleProfiler(1, module) as profiler:
+        labels = np.zeros((10, 10), dtype=np.int32)
+        labels[1:3, 1:3] = 1
+        labels[5:8, 5:8] = 2
+        objects.value = labels
+    record = profiler.record
+    assert sorted(record.keys()) == sorted(PROFILE_COLUMNS)
+    assert record['site_id'] == 1
+    assert record['module'] == 'segment'
+    assert record['process'] == 'self'
+    assert not record['cached']
+    assert record['input_bytes'] == 200
+    assert record['output_bytes'] == 400
+    assert record['n_objects'] == 2
+    assert record['wall_time'] >= 0
+    assert record['peak_rss'] > 0
+
+
+def test_module_profiler_memory():
+    module = Module('allocate', Handles([], []))
+    with ModuleProfiler(1, module) as profiler:
+        array = np.ones(2**25, dtype=np.uint8)
+    # The increase is measured for the current rather than the peak RSS,
+    # such that it doesn't depend on previous calls.
+    assert profiler.record['rss_increase'] >= array.nbytes / 2
+    assert profiler.record['peak_rss'] >= get_memory_usage()[0]
+    del array
+    with ModuleProfiler(1, module) as profiler:
+        array = np.ones(2**25, dtype=np.uint8)
+    assert profiler.record['rss_increase'] >= array.nbytes / 2
+
+
+def test_module_profiler_external():
+    engine = subprocess.Popen(['sleep', '10'])
+    try:
+        assert engine.pid in find_child_processes()
+        module = ExternalModule('segment', Handles([], []), 'Matlab')
+        with ModuleProfiler(1, module) as profiler:
+            pass
+        record = profiler.record
+        assert record['process'] == 'external'
+        assert record['peak_rss'] == get_memory_usage(engine.pid)[1]
+    finally:
+        engine.kill()
+        engine.wait()
+
+
+def test_summarize_profiles():
+    profiles = pd.DataFrame([
+        [1, 'b', 'self', False, 2.0, 1.0, 100, 1000, 10, 20, 5],
+        [1, 'a', 'external', True, 0.0, 0.0, 0, 500, 10, 20, 0],
+        [2, 'b', 'self', False, 4.0, 3.0, 300, 1200, 10, 20, 7],
+        [2, 'a', 'external', False, 2.0, 2.0, 0, 500, 10, 20, 0],
+    ], columns=PROFILE_COLUMNS)
+    summary = summarize_profiles(profiles)
+    assert summary.index.tolist() == ['b', 'a']
+    assert summary.loc['b', 'n_calls'] == 2
+    assert summary.loc['a', 'n_cached'] == 1
+    assert summary.loc['b', 'total_wall_time'] == 6.0
+    assert summary.loc['b', 'fraction_wall_time'] == 0.75
+    assert summary.loc['a', 'process'] == 'external'
+    assert summary.loc['b', 'max_rss_increase'] == 300
+    assert summary.loc['b', 'mean_rss_increase'] == 200
+    assert summary.loc['b', 'max_peak_rss'] == 1200
+    assert summary.loc['b', 'mean_n_objects'] == 6